@@ -4,10 +4,42 @@ backend/__init__.py
 Top level import for all objects in the backend. Probably a little bit naive
 and would generate some issues at scale as they regard to circular importation
 and datastructures that would depend on each other.
+
+Subpackages are imported lazily (PEP 562), on first attribute access, so that
+`import backend` and short CLI runs don't pay for scipy, requests and friends
+until they're actually used.
 '''
+import importlib
+
+# Searched in order; the cheap subpackages come first so that looking up a
+# name from one of them never imports the solvers.
+_SUBPACKAGES = (
+    'datastructures',
+    'api_interactions',
+    'parsing',
+    'solvers',
+)
+
+
+def __getattr__(name: str):
+    if name in _SUBPACKAGES:
+        return importlib.import_module(f'.{name}', __name__)
+    if name == '__all__':
+        return [
+            export
+            for subpackage in _SUBPACKAGES
+            for export in __getattr__(subpackage).__all__
+        ]
+    for subpackage in _SUBPACKAGES:
+        module = importlib.import_module(f'.{subpackage}', __name__)
+        if name in module.__all__:
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-from .datastructures import *
-from .api_interactions import *
-from .parsing import *
-from .solvers import *
 
+def __dir__():
+    return sorted(
+        set(globals()) | set(_SUBPACKAGES) | set(__getattr__('__all__'))
+    )
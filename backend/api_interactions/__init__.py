@@ -1 +1,32 @@
-from .cello_requests import CelloAPI
\ No newline at end of file
+'''
+backend/api_interactions/__init__.py
+
+Exports are imported lazily (PEP 562): the Cello client pulls in requests and
+colorama, which scripts that only need the cache or the service shouldn't pay
+for.
+'''
+import importlib
+
+_EXPORTS = {
+    'ResultCache': '.cache',
+    'CelloAPI': '.cello_requests',
+    'Backoff': '.scheduler',
+    'CelloJob': '.scheduler',
+    'CelloScheduler': '.scheduler',
+    'OptimizationService': '.service',
+    'CelloStandIn': '.stand_in',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,381 @@
+"""
+backend.api_interactions.cache
+
+Content-addressed on-disk cache for responses from the Cello API.
+
+Entries are looked up by a key derived from the endpoint and its parameters,
+and point at blobs named by the digest of their content, so identical payloads
+fetched through different routes are only stored once. Completed job artifacts
+never change and are kept until evicted; listings are revalidated after a TTL.
+
+W.R. Jackson 2020
+"""
+import hashlib
+import json
+import os
+import time
+from typing import (
+    Callable,
+    Dict,
+)
+
+# Endpoints whose responses depend on server state we don't control.
+MUTABLE_ENDPOINTS = ['in_out', 'ucf', 'resultsroot']
+# Endpoints that must always hit the server.
+UNCACHEABLE_ENDPOINTS = ['submit']
+# Arguments that carry an upload. The API tunnels writes through GET, so these
+# are what distinguishes posting an input from listing one.
+WRITE_ARGUMENTS = ['filetext', 'verilog_text']
+
+
+def cache_key(end_point: str, additional_arguments: dict = None) -> str:
+    '''
+    Derives the lookup key for a request. Argument order is significant since
+    `fetch_resource` turns arguments into path segments in order.
+
+    Args:
+        end_point: Which endpoint is being requested.
+        additional_arguments: Additional arguments to the end point.
+
+    Returns:
+        Hex digest identifying the request.
+    '''
+    arguments = list((additional_arguments or {}).items())
+    payload = json.dumps([end_point, arguments], sort_keys=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_cacheable(end_point: str, additional_arguments: dict = None) -> bool:
+    '''
+    Args:
+        end_point: Which endpoint is being requested.
+        additional_arguments: Additional arguments to the end point.
+
+    Returns:
+        Whether the request is a pure read that can be served from cache.
+    '''
+    if end_point in UNCACHEABLE_ENDPOINTS:
+        return False
+    arguments = additional_arguments or {}
+    return not any(argument in arguments for argument in WRITE_ARGUMENTS)
+
+
+def is_job_listing(end_point: str, additional_arguments: dict = None) -> bool:
+    '''
+    Returns:
+        Whether the request lists a job's results files. The listing stays
+        empty until the job has written its output.
+    '''
+    arguments = additional_arguments or {}
+    return end_point == 'results' and 'job_id' in arguments and \
+        'filename' not in arguments
+
+
+def _lists_files(body: str) -> bool:
+    try:
+        listing = json.loads(body)
+    except ValueError:
+        return False
+    return isinstance(listing, list) and len(listing) > 0
+
+
+def is_immutable(end_point: str, additional_arguments: dict = None) -> bool:
+    '''
+    A request is treated as immutable when it names a specific file belonging
+    to a job. Results files are written once when a job finishes, whereas
+    listings keep changing while it runs.
+
+    Args:
+        end_point: Which endpoint is being requested.
+        additional_arguments: Additional arguments to the end point.
+
+    Returns:
+        Whether the response can be cached without revalidation.
+    '''
+    arguments = additional_arguments or {}
+    if end_point in MUTABLE_ENDPOINTS:
+        return False
+    return 'job_id' in arguments and 'filename' in arguments
+
+
+class ResultCache:
+    '''
+    Size-bounded, content-addressed response cache.
+
+    A job's results listing is only stored once it lists something, i.e. the
+    job has finished, so an unfinished job is never reported as empty from
+    cache. Pollers watching for a job to finish should still bypass it, see
+    `CelloAPI.fetch_resource(refresh=True)`.
+
+    Reads only update access times in memory; they reach `index.json` with
+    the next `put`, `flush` or `close`.
+
+    Layout on disk:
+        <root>/index.json           Request key -> entry metadata.
+        <root>/objects/ab/abcd...   Response bodies named by their SHA-256.
+    '''
+
+    def __init__(
+            self,
+            root: str,
+            max_bytes: int = 512 * 1024 * 1024,
+            ttl: float = 3600.0,
+            clock: Callable[[], float] = time.time,
+    ):
+        '''
+        Args:
+            root: Directory to store the cache in. Created if missing.
+            max_bytes: Upper bound on the total size of stored blobs.
+            ttl: Seconds a mutable entry is served before it is refetched.
+            clock: Time function, swappable for testing.
+        '''
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self._index_fp = os.path.join(root, 'index.json')
+        self._index: Dict[str, dict] = {}
+        # Access times updated by reads since the index was last written.
+        self._dirty = False
+        if os.path.exists(self._index_fp):
+            with open(self._index_fp, 'r') as index_file:
+                self._index = json.load(index_file)
+
+    def get(self, end_point: str, additional_arguments: dict = None) -> str:
+        '''
+        Looks up a cached response.
+
+        Args:
+            end_point: Which endpoint is being requested.
+            additional_arguments: Additional arguments to the end point.
+
+        Returns:
+            The cached body, or `None` if absent or stale.
+        '''
+        blob_path = self.path(end_point, additional_arguments)
+        if blob_path is None:
+            return None
+        with open(blob_path, 'r') as blob:
+            return blob.read()
+
+    def path(self, end_point: str, additional_arguments: dict = None) -> str:
+        '''
+        Looks up a cached response without reading it, e.g. a download stored
+        with `put_file`.
+
+        Args:
+            end_point: Which endpoint is being requested.
+            additional_arguments: Additional arguments to the end point.
+
+        Returns:
+            Filepath of the cached body, or `None` if absent or stale. The
+            file belongs to the cache and must not be modified.
+        '''
+        key = cache_key(end_point, additional_arguments)
+        entry = self._index.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        now = self.clock()
+        if not entry['immutable'] and now - entry['stored_at'] > self.ttl:
+            self.misses += 1
+            return None
+        blob_path = self._blob_path(entry['digest'])
+        if not os.path.exists(blob_path):
+            # Someone cleaned out the objects directory underneath us.
+            del self._index[key]
+            self._save_index()
+            self.misses += 1
+            return None
+        # Only the access time changed; that is written out with the next
+        # `put` or `flush` rather than costing a full index write per read.
+        entry['last_access'] = now
+        self._dirty = True
+        self.hits += 1
+        return blob_path
+
+    def put(
+            self,
+            end_point: str,
+            additional_arguments: dict,
+            body: str,
+            immutable: bool = None,
+    ):
+        '''
+        Stores a response.
+
+        Args:
+            end_point: Which endpoint was requested.
+            additional_arguments: Additional arguments to the end point.
+            body: The response body.
+            immutable: Overrides the default classification from
+                `is_immutable`.
+        '''
+        if not is_cacheable(end_point, additional_arguments):
+            return
+        if is_job_listing(end_point, additional_arguments) and \
+                not _lists_files(body):
+            return
+        encoded = body.encode('utf-8')
+        digest = hashlib.sha256(encoded).hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            temporary_path = f'{blob_path}.tmp'
+            with open(temporary_path, 'wb') as blob:
+                blob.write(encoded)
+            os.replace(temporary_path, blob_path)
+        self._add_entry(end_point, additional_arguments, digest, len(encoded),
+                        immutable)
+
+    def put_file(
+            self,
+            end_point: str,
+            additional_arguments: dict,
+            filepath: str,
+            immutable: bool = None,
+    ) -> str:
+        '''
+        Stores a response that was streamed to disk, moving the file into the
+        cache rather than reading it into memory.
+
+        Args:
+            end_point: Which endpoint was requested.
+            additional_arguments: Additional arguments to the end point.
+            filepath: The body. Must be on the same filesystem as the cache,
+                e.g. a temporary file under `root`.
+            immutable: Overrides the default classification from
+                `is_immutable`.
+
+        Returns:
+            Filepath of the stored body.
+        '''
+        if not is_cacheable(end_point, additional_arguments):
+            raise RuntimeError(f'Responses from {end_point} are not cached.')
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as body:
+            for chunk in iter(lambda: body.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        size = os.path.getsize(filepath)
+        blob_path = self._blob_path(digest)
+        if os.path.exists(blob_path):
+            os.remove(filepath)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(filepath, blob_path)
+        self._add_entry(end_point, additional_arguments, digest, size,
+                        immutable)
+        return blob_path
+
+    def invalidate(self, end_point: str):
+        '''
+        Drops every mutable entry for an endpoint. Used after the client
+        changes server state, e.g. posting or deleting an input.
+
+        Args:
+            end_point: The endpoint whose listings are now stale.
+        '''
+        stale = [
+            key for key, entry in self._index.items()
+            if entry['end_point'] == end_point and not entry['immutable']
+        ]
+        for key in stale:
+            del self._index[key]
+        if stale:
+            self._collect_garbage()
+            self._save_index()
+
+    def flush(self):
+        '''
+        Writes out access times recorded by reads since the last write.
+        '''
+        if self._dirty:
+            self._save_index()
+
+    def close(self):
+        self.flush()
+
+    def size(self) -> int:
+        '''
+        Returns:
+            Total bytes of blobs referenced by the index.
+        '''
+        digests = {}
+        for entry in self._index.values():
+            digests[entry['digest']] = entry['size']
+        return sum(digests.values())
+
+    def _evict(self):
+        '''
+        Removes least recently used entries until the cache fits in
+        `max_bytes`.
+        '''
+        # Entries can share a blob, so the total is tracked per digest.
+        references: Dict[str, int] = {}
+        sizes: Dict[str, int] = {}
+        for entry in self._index.values():
+            references[entry['digest']] = \
+                references.get(entry['digest'], 0) + 1
+            sizes[entry['digest']] = entry['size']
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        by_age = sorted(
+            self._index.items(),
+            key=lambda item: item[1]['last_access'],
+        )
+        for key, entry in by_age:
+            del self._index[key]
+            references[entry['digest']] -= 1
+            if not references[entry['digest']]:
+                total -= sizes[entry['digest']]
+            if total <= self.max_bytes:
+                break
+        self._collect_garbage()
+
+    def _collect_garbage(self):
+        '''
+        Deletes blobs that are no longer referenced by any entry.
+        '''
+        referenced = {entry['digest'] for entry in self._index.values()}
+        objects_root = os.path.join(self.root, 'objects')
+        for directory, _, filenames in os.walk(objects_root):
+            for filename in filenames:
+                if filename not in referenced:
+                    os.remove(os.path.join(directory, filename))
+
+    def _add_entry(
+            self,
+            end_point: str,
+            additional_arguments: dict,
+            digest: str,
+            size: int,
+            immutable: bool = None,
+    ):
+        if immutable is None:
+            immutable = is_immutable(end_point, additional_arguments)
+        now = self.clock()
+        self._index[cache_key(end_point, additional_arguments)] = {
+            'end_point': end_point,
+            'digest': digest,
+            'size': size,
+            'immutable': immutable,
+            'stored_at': now,
+            'last_access': now,
+        }
+        self._evict()
+        self._save_index()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def _save_index(self):
+        self._dirty = False
+        temporary_fp = f'{self._index_fp}.tmp'
+        with open(temporary_fp, 'w') as index_file:
+            json.dump(self._index, index_file)
+        os.replace(temporary_fp, self._index_fp)
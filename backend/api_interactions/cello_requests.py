@@ -12,9 +12,11 @@ users would think about interacting with this service.)
 My critiques have only to do with my ardent fervor towards typical PEP-8
 standards, function documentation, and typing.
 """
+import contextlib
 import json
 import os
 import pprint
+import tempfile
 import time
 from typing import (
     Dict
@@ -22,10 +24,23 @@ from typing import (
 
 from colorama import Fore
 import requests
-from Bio import SeqIO
 from requests.auth import HTTPBasicAuth
 
+from backend.api_interactions.cache import (
+    ResultCache,
+    is_cacheable,
+)
+from backend.api_interactions.scheduler import Backoff
+from backend.parsing.genbank import iter_genbank_features
+
 REQUEST_RETRIES = 3
+# Bytes read per iteration when streaming a download to disk.
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Seconds before giving up on a single HTTP request. Without this a host that
+# accepts the connection and never answers hangs the caller forever.
+REQUEST_TIMEOUT = 30.0
+# Status codes worth retrying. Everything else is the server telling us no.
+RETRYABLE_STATUS_CODES = [429, 500, 502, 503, 504]
 
 
 class CelloAuth:
@@ -34,8 +49,13 @@ class CelloAuth:
             url: str,
             username: str = None,
             password: str = None,
+            retries: int = REQUEST_RETRIES,
+            retry_backoff: float = 1.0,
+            timeout: float = REQUEST_TIMEOUT,
     ):
         self.url_root = url
+        if retries < 1:
+            raise RuntimeError('At least one request attempt is required.')
         if username != password and None in [username, password]:
             raise RuntimeError(
                 'Both user name and password have to be set during the use of '
@@ -58,6 +78,13 @@ class CelloAuth:
             self.username = username
             self.password = password
         self.auth = HTTPBasicAuth(self.username, self.password)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        # Credentials don't change underneath us, so one successful round trip
+        # is enough. Otherwise every request would cost two.
+        self.validated = False
+        self.retry_count = 0
 
     def validate_authentication(self):
         '''
@@ -72,25 +99,47 @@ class CelloAuth:
         Returns:
             Whether the username and password are valid.
         '''
-        for i in range(REQUEST_RETRIES):
-            if i - 1 >= REQUEST_RETRIES:
+        if self.validated:
+            return True
+        backoff = Backoff(
+            initial=self.retry_backoff,
+            maximum=self.retry_backoff * 8,
+        )
+        for i in range(self.retries):
+            try:
+                resp = requests.get(
+                    f'{self.url_root}',
+                    auth=self.auth,
+                    timeout=self.timeout,
+                )
+                status_code = resp.status_code
+            except requests.RequestException:
+                status_code = None
+            if status_code == 200:
+                self.validated = True
+                return True
+            if status_code in (401, 403):
                 raise RuntimeError(
-                    'Unable to communicate with Cello  after three attempts. '
-                    'Please investigate internet connection or Cello API Status'
+                    f'Cello rejected the supplied credentials. '
+                    f'(HTTP {status_code})'
                 )
-            resp = requests.get(
-                f'{self.url_root}',
-                auth=self.auth,
-            )
-            if resp != 200:
+            if status_code is not None and \
+                    status_code not in RETRYABLE_STATUS_CODES:
+                raise RuntimeError(
+                    f'Unexpected response from Cello while authenticating. '
+                    f'(HTTP {status_code})'
+                )
+            if i + 1 < self.retries:
                 print(
                     f"Failed to successfully communicate with Cello."
                     f" Retrying. Attempt {i}"
                 )
-                time.sleep(1)
-                continue
-            else:
-                break
+                self.retry_count += 1
+                time.sleep(backoff.next())
+        raise RuntimeError(
+            f'Unable to communicate with Cello after {self.retries} attempts. '
+            f'Please investigate internet connection or Cello API Status'
+        )
 
     def __enter__(self):
         '''
@@ -130,15 +179,49 @@ class CelloAPI:
             routing_command: str = None,
             username: str = None,
             password: str = None,
+            cache: ResultCache = None,
+            retries: int = REQUEST_RETRIES,
+            retry_backoff: float = 1.0,
+            timeout: float = REQUEST_TIMEOUT,
             **kwargs,
     ):
         self.base_url = url
-        self.auth = CelloAuth(url, username, password)
+        self.auth = CelloAuth(
+            url,
+            username,
+            password,
+            retries=retries,
+            retry_backoff=retry_backoff,
+            timeout=timeout,
+        )
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.retry_count = 0
+        # Final non-200 answers, including those only printed and returned.
+        self.error_count = 0
+        # Optional on-disk cache. When set, GET requests are served locally
+        # whenever a fresh copy exists and never touch the network.
+        self.cache = cache
         self.cli_context = True if routing_command else False
 
         if self.cli_context:
             self.parse_cli_command(routing_command, kwargs)
 
+    def close(self):
+        '''
+        Flushes and closes the result cache, if any, so buffered access times
+        reach disk. Also called when the client is used as a context manager.
+        '''
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def parse_cli_command(self, routing_command: str, kwargs: Dict):
         '''
         Parses and routes CLI centric commands. Currently having some issues
@@ -168,6 +251,8 @@ class CelloAPI:
             end_point: str,
             additional_arguments: dict = None,
             operation: str = 'GET',
+            raise_on_error: bool = False,
+            refresh: bool = False,
     ) -> requests.request:
         '''
         Interacts with an API endpoint.
@@ -176,20 +261,38 @@ class CelloAPI:
             end_point: Which endpoint to interact with.
             operation: What operation to use [`POST` | `GET` | `DELETE`]
             additional_arguments: Additional arguments to the end point.
+            raise_on_error: Raise a RuntimeError on a final non-200 response
+                instead of printing it and returning its body.
+            refresh: Skip any cached copy. The response still updates the
+                cache.
 
         Returns:
             Unicode encoded message content.
         '''
+        cacheable = self.cache is not None and operation == 'GET' and \
+            is_cacheable(end_point, additional_arguments)
+        if cacheable and not refresh:
+            cached = self.cache.get(end_point, additional_arguments)
+            if cached is not None:
+                return cached
         with self.auth as cello_auth:
             base_endpoint = f'{self.base_url}/{end_point}'
             if additional_arguments is not None:
                 for argument in additional_arguments:
                     content = additional_arguments[argument]
                     base_endpoint += f'/{content}'
-            if operation == 'GET':
-                resp = requests.get(base_endpoint, auth=cello_auth)
-            if operation == 'DELETE':
-                resp = requests.delete(base_endpoint, auth=cello_auth)
+            resp = self._request_with_retries(
+                operation,
+                base_endpoint,
+                cello_auth,
+            )
+            if resp.status_code != 200:
+                self.error_count += 1
+            if resp.status_code != 200 and raise_on_error:
+                raise RuntimeError(
+                    f'Cello answered {end_point} with HTTP '
+                    f'{resp.status_code}: {resp.text}'
+                )
             if resp.status_code != 200:
                 # If we're already doing colored text why not...
                 print(Fore.RED + f'Failed to receive response from Cello API.'
@@ -197,14 +300,73 @@ class CelloAPI:
                       )
             if self.cli_context:
                 pprint.pprint(Fore.GREEN + resp.text)
+            if self.cache is not None and resp.status_code == 200:
+                if cacheable:
+                    self.cache.put(end_point, additional_arguments, resp.text)
+                else:
+                    self.cache.invalidate(end_point)
             return resp.text
 
+    def _request_with_retries(
+            self,
+            operation: str,
+            url: str,
+            cello_auth: HTTPBasicAuth,
+            stream: bool = False,
+    ) -> requests.Response:
+        '''
+        Issues a request, retrying connection failures and transient server
+        errors with exponential backoff.
+
+        Args:
+            operation: What operation to use [`GET` | `DELETE`]
+            url: Fully formed URL to request.
+            cello_auth: Auth object to attach to the request.
+            stream: Whether to defer downloading the body.
+
+        Returns:
+            The final response. Non-retryable or exhausted HTTP errors are
+            returned as-is for the caller to report.
+        '''
+        if operation == 'GET':
+            request_function = requests.get
+        elif operation == 'DELETE':
+            request_function = requests.delete
+        else:
+            raise RuntimeError(f'Unsupported operation {operation}')
+        backoff = Backoff(
+            initial=self.retry_backoff,
+            maximum=self.retry_backoff * 8,
+        )
+        for i in range(self.retries):
+            last_attempt = i + 1 == self.retries
+            try:
+                resp = request_function(
+                    url,
+                    auth=cello_auth,
+                    timeout=self.timeout,
+                    stream=stream,
+                )
+            except requests.RequestException as e:
+                if last_attempt:
+                    raise RuntimeError(
+                        f'Unable to communicate with Cello after '
+                        f'{self.retries} attempts. System exception: {e}'
+                    )
+            else:
+                if resp.status_code not in RETRYABLE_STATUS_CODES or \
+                        last_attempt:
+                    return resp
+            self.retry_count += 1
+            time.sleep(backoff.next())
+
     def get_results(
             self,
             job_id: str = None,
             keyword: str = None,
             extension: str = None,
-            filename: str = None
+            filename: str = None,
+            refresh: bool = False,
     ):
         '''
         Gets result from end point
@@ -214,6 +376,7 @@ class CelloAPI:
             keyword: Which keyword to search for, if passed in.
             extension: Which extension to search for, if passed in.
             filename: Which filename to search for, if passed in.
+            refresh: Skip the cache, e.g. when polling for a job to finish.
 
         Returns:
             Remote endpoint body content, encoded in unicode.
@@ -232,7 +395,7 @@ class CelloAPI:
                 'job_id': job_id,
                 'filename': filename,
             }
-        return self.fetch_resource(f'results', params)
+        return self.fetch_resource(f'results', params, refresh=refresh)
 
     def get_inputs(self, name: str = None):
         '''
@@ -387,7 +550,9 @@ class CelloAPI:
                     hill_climbing`
 
         Returns:
-            Remote endpoint body content, encoded in unicode.
+            Remote endpoint body content, encoded in unicode. A job Cello
+            doesn't accept raises a RuntimeError, so it is never mistaken for
+            a running one.
 
         '''
         try:
@@ -405,7 +570,7 @@ class CelloAPI:
             'verilog_text': verilog_text,
             'options': options,
         }
-        return self.fetch_resource('submit', params)
+        return self.fetch_resource('submit', params, raise_on_error=True)
 
     def fetch_extension(
             self,
@@ -504,12 +669,86 @@ class CelloAPI:
         print(Fore.GREEN +
               f"{self.fetch_extension(job_id=job_id, assignment=assignment, extension='reutable.txt')}")
 
+    def download_resource(
+            self,
+            end_point: str,
+            destination: str = None,
+            additional_arguments: dict = None,
+            chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    ) -> str:
+        '''
+        Streams an endpoint's body to disk in fixed size chunks, so result
+        files are never held in memory in their entirety. The file is written
+        under a temporary name and moved into place once complete, so an
+        existing destination is always a finished download and is reused
+        as-is.
+
+        Args:
+            end_point: Which endpoint to interact with.
+            destination: Filepath to write the body to. Without one the body
+                is kept in (and served from) the cache.
+            additional_arguments: Additional arguments to the end point.
+            chunk_size: Bytes read per iteration.
+
+        Returns:
+            The destination filepath, or the cached copy's.
+        '''
+        if destination is None:
+            if self.cache is None or \
+                    not is_cacheable(end_point, additional_arguments):
+                raise RuntimeError(
+                    f'Downloading {end_point} needs a destination.'
+                )
+            cached = self.cache.path(end_point, additional_arguments)
+            if cached is not None:
+                return cached
+        elif os.path.exists(destination):
+            return destination
+        with self.auth as cello_auth:
+            base_endpoint = f'{self.base_url}/{end_point}'
+            if additional_arguments is not None:
+                for argument in additional_arguments:
+                    content = additional_arguments[argument]
+                    base_endpoint += f'/{content}'
+            resp = self._request_with_retries(
+                'GET',
+                base_endpoint,
+                cello_auth,
+                stream=True,
+            )
+            with resp:
+                if resp.status_code != 200:
+                    raise RuntimeError(
+                        f'Failed to download {end_point} from Cello API. '
+                        f'(HTTP {resp.status_code})'
+                    )
+                if destination is None:
+                    handle, temporary_fp = tempfile.mkstemp(
+                        suffix='.part',
+                        dir=self.cache.root,
+                    )
+                    os.close(handle)
+                else:
+                    temporary_fp = f'{destination}.part'
+                with open(temporary_fp, 'wb') as output_file:
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        output_file.write(chunk)
+        if destination is None:
+            return self.cache.put_file(
+                end_point,
+                additional_arguments,
+                temporary_fp,
+            )
+        os.replace(temporary_fp, destination)
+        return destination
+
     def read_genbank(
             self,
             job_id: str,
             filename: str,
             seq: bool = False,
-    ):
+            destination: str = None,
+    ) -> str:
         '''
         Reads the passed in Genbank file.
 
@@ -518,19 +757,42 @@ class CelloAPI:
             filename: Filename of Genbank file.
             seq: Flag that determines if the sequence of the associated 
                 Genbank file will be printed.
+            destination: Where to keep the downloaded file. An existing file
+                there is reused. Without one the file is kept in the cache,
+                or, without a cache, read from a private temporary directory
+                that is removed again.
 
+        Returns:
+            Filepath of the downloaded Genbank file, or None when it was only
+            read once and not kept.
         '''
         # This is a bit interesting and deviates from the other established patterns.
         resp = self.fetch_resource('resultsroot')
-        server_root = resp
+        server_root = resp.strip()
         params = {
             'user_name': self.auth.username,
             'job_id': job_id,
             'filename': filename,
         }
-        filepath = self.fetch_resource(server_root, params)
-        genbank_record = SeqIO.read(open(filepath, 'r'), 'genbank')
-        for feature in genbank_record.features:
+        with contextlib.ExitStack() as scratch:
+            one_off = destination is None and self.cache is None
+            if one_off:
+                # Private, so nobody can plant a file for us to read.
+                destination = os.path.join(
+                    scratch.enter_context(
+                        tempfile.TemporaryDirectory(prefix='cello_')
+                    ),
+                    os.path.basename(filename),
+                )
+            filepath = self.download_resource(server_root, destination, params)
+            self._print_genbank(filepath, seq)
+        return None if one_off else filepath
+
+    def _print_genbank(self, filepath: str, seq: bool):
+        # Features are parsed one at a time and their sequences are views into
+        # a single memory-mapped buffer, so this runs in constant memory
+        # however large the plasmid.
+        for feature in iter_genbank_features(filepath, with_sequence=seq):
             # The F-strings in the API are a problematic choice. I like how
             # they parse visually, and they are more performant than
             # standard formatting. As a culture most Bioinformatics users
@@ -544,11 +806,10 @@ class CelloAPI:
             print(Fore.GREEN +
                   f'{feature.location},'
                   f'{feature.type},'
-                  f'{feature.qualifiers["label"]},'
-                  f'{feature.extract(genbank_record.seq)}'
+                  f'{feature.qualifiers.get("label")}'
                   )
             if seq:
-                print(Fore.GREEN + f'{feature.extract(genbank_record.seq)}')
+                print(Fore.GREEN + f'{feature.extract()}')
 
     def post_ucf(self, name: str, filepath: str):
         '''
@@ -0,0 +1,192 @@
+"""
+backend.api_interactions.load_test
+
+Load-testing harness for `CelloAPI`.
+
+Drives a client operation from a pool of threads and reports throughput, tail
+latency and how often the client had to retry. Pointed at `CelloStandIn` it is
+a safe way to size client concurrency and check backoff settings; it can be
+pointed at a real host too, but please don't.
+
+Usage:
+    python -m backend.api_interactions.load_test --concurrency 1 4 16
+
+W.R. Jackson 2020
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import (
+    Callable,
+    List,
+)
+
+import numpy as np
+
+from backend.api_interactions.cello_requests import CelloAPI
+from backend.api_interactions.stand_in import CelloStandIn
+
+
+@dataclass
+class LoadTestReport:
+    '''
+    Attributes:
+        concurrency: Number of client threads.
+        requests: Number of operations attempted.
+        failures: Operations that raised or got a non-200 final answer,
+            which `CelloAPI` returns as text rather than raising.
+        retries: Retries performed by the clients, including authentication.
+        duration: Wall clock seconds for the whole run.
+        throughput: Completed operations per second.
+        latency_p50: Median operation latency, in seconds.
+        latency_p95: 95th percentile operation latency, in seconds.
+        latency_p99: 99th percentile operation latency, in seconds.
+        latency_max: Slowest operation, in seconds.
+    '''
+    concurrency: int
+    requests: int
+    failures: int
+    retries: int
+    duration: float
+    throughput: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    latency_max: float
+
+    def __str__(self):
+        return (
+            f'concurrency={self.concurrency:<4} '
+            f'throughput={self.throughput:8.1f}/s '
+            f'p50={self.latency_p50 * 1000:7.1f}ms '
+            f'p95={self.latency_p95 * 1000:7.1f}ms '
+            f'p99={self.latency_p99 * 1000:7.1f}ms '
+            f'failures={self.failures} retries={self.retries}'
+        )
+
+
+def run_load_test(
+        api_factory: Callable[[], CelloAPI],
+        operation: Callable[[CelloAPI], object],
+        total_requests: int = 200,
+        concurrency: int = 4,
+) -> LoadTestReport:
+    '''
+    Runs `operation` `total_requests` times spread over `concurrency` threads.
+    Each thread gets its own client so that per-client state like retry
+    counters and authentication stays thread local.
+
+    Args:
+        api_factory: Builds a fresh client.
+        operation: What each request does, e.g. `lambda api: api.get_inputs()`.
+        total_requests: Number of operations to perform.
+        concurrency: Number of threads.
+
+    Returns:
+        The measured report.
+    '''
+    if concurrency < 1 or total_requests < 1:
+        raise RuntimeError('Load tests need at least one thread and request.')
+    clients = [api_factory() for _ in range(concurrency)]
+    base_share, remainder = divmod(total_requests, concurrency)
+    shares = [
+        base_share + (1 if index < remainder else 0)
+        for index in range(concurrency)
+    ]
+
+    def worker(client: CelloAPI, count: int):
+        latencies = []
+        failures = 0
+        for _ in range(count):
+            start = time.perf_counter()
+            errors = client.error_count
+            try:
+                operation(client)
+            except Exception:
+                failures += 1
+            else:
+                if client.error_count > errors:
+                    failures += 1
+            latencies.append(time.perf_counter() - start)
+        return latencies, failures
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(worker, clients, shares))
+    duration = time.perf_counter() - start
+
+    latencies = np.concatenate([np.asarray(o[0]) for o in outcomes])
+    failures = sum(o[1] for o in outcomes)
+    retries = sum(c.retry_count + c.auth.retry_count for c in clients)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return LoadTestReport(
+        concurrency=concurrency,
+        requests=total_requests,
+        failures=failures,
+        retries=retries,
+        duration=duration,
+        throughput=(total_requests - failures) / duration,
+        latency_p50=float(p50),
+        latency_p95=float(p95),
+        latency_p99=float(p99),
+        latency_max=float(latencies.max()),
+    )
+
+
+def sweep_concurrency(
+        api_factory: Callable[[], CelloAPI],
+        operation: Callable[[CelloAPI], object],
+        levels: List[int],
+        total_requests: int = 200,
+) -> List[LoadTestReport]:
+    '''
+    Runs the same load test at several concurrency levels.
+
+    Args:
+        api_factory: Builds a fresh client.
+        operation: What each request does.
+        levels: Concurrency levels to measure.
+        total_requests: Number of operations per level.
+
+    Returns:
+        One report per level, in order.
+    '''
+    return [
+        run_load_test(api_factory, operation, total_requests, level)
+        for level in levels
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Load test the Cello client against a local stand-in.'
+    )
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--failure-rate', type=float, default=0.05)
+    parser.add_argument('--retry-backoff', type=float, default=0.05)
+    args = parser.parse_args()
+
+    with CelloStandIn(
+            latency=args.latency,
+            latency_jitter=args.jitter,
+            failure_rate=args.failure_rate,
+    ) as stand_in:
+        def factory():
+            return CelloAPI(
+                url=stand_in.url,
+                username='load',
+                password='test',
+                retry_backoff=args.retry_backoff,
+            )
+
+        for report in sweep_concurrency(
+                factory,
+                lambda api: api.get_inputs(),
+                args.concurrency,
+                args.requests,
+        ):
+            print(report)
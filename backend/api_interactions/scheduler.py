@@ -0,0 +1,403 @@
+"""
+backend.api_interactions.scheduler
+
+Batch submission and polling of Cello jobs.
+
+`CelloAPI.submit` is fire and forget, so anything past a handful of designs
+turns into a hand-rolled polling loop. The scheduler keeps a bounded number of
+jobs in flight, polls each of them on its own backoff schedule, and writes its
+bookkeeping to disk after every state change so an interrupted campaign can
+pick up where it left off.
+
+W.R. Jackson 2020
+"""
+import glob
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import (
+    asdict,
+    dataclass,
+)
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Tuple,
+)
+
+JOB_PENDING = 'pending'
+JOB_SUBMITTED = 'submitted'
+JOB_COMPLETE = 'complete'
+JOB_FAILED = 'failed'
+
+
+@dataclass
+class CelloJob:
+    '''
+    Attributes:
+        job_id: Identification Number for the Job as sent to Cello.
+        verilog_fp: Filepath to the Verilog file for this design.
+        status: One of pending, submitted, complete or failed.
+        polls: How many times the results endpoint has been polled.
+        submitted_at: Epoch time of submission, if submitted.
+        completed_at: Epoch time the job finished or failed.
+        error: Error message for failed jobs.
+        result: Body of the final results listing. Not persisted.
+    '''
+    job_id: str
+    verilog_fp: str
+    status: str = JOB_PENDING
+    polls: int = 0
+    submitted_at: float = None
+    completed_at: float = None
+    error: str = None
+    result: str = None
+
+    def to_state(self) -> dict:
+        '''
+        Returns:
+            The persistable portion of the job. Results can be large and are
+            refetchable, so they stay out of the state file.
+        '''
+        state = asdict(self)
+        state.pop('result')
+        return state
+
+
+class Backoff:
+    '''
+    Adaptive polling interval. Each poll that shows no progress multiplies the
+    interval by `factor` up to `maximum`; a reset drops it back to `initial`.
+    A little jitter keeps a batch of jobs from polling in lock step.
+    '''
+
+    def __init__(
+            self,
+            initial: float = 2.0,
+            maximum: float = 60.0,
+            factor: float = 2.0,
+            jitter: float = 0.1,
+    ):
+        if initial <= 0 or maximum < initial or factor < 1:
+            raise RuntimeError(
+                'Backoff requires 0 < initial <= maximum and factor >= 1.'
+            )
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.current = initial
+
+    def next(self) -> float:
+        '''
+        Returns:
+            The number of seconds to wait before the next attempt. Advances
+            the schedule.
+        '''
+        delay = self.current
+        self.current = min(self.current * self.factor, self.maximum)
+        if self.jitter:
+            delay *= 1.0 + random.uniform(-self.jitter, self.jitter)
+        return delay
+
+    def reset(self):
+        '''
+        Drops the interval back to its initial value.
+        '''
+        self.current = self.initial
+
+
+def results_listed(response_text: str) -> bool:
+    '''
+    Default completion check. Cello lists the files produced for a job on the
+    results endpoint, and the listing stays empty until the run has written
+    its output.
+
+    Args:
+        response_text: Body returned by `CelloAPI.get_results(job_id)`.
+
+    Returns:
+        Whether the job has produced results.
+    '''
+    try:
+        listing = json.loads(response_text)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(listing, list) and len(listing) > 0
+
+
+class CelloScheduler:
+    '''
+    Submits a batch of designs to Cello with a cap on how many are in flight at
+    once and yields each job as it finishes.
+
+    Usage:
+        scheduler = CelloScheduler(api, 'Inputs.txt', 'Outputs.txt', 'state.json')
+        scheduler.add_directory('designs/')
+        for job in scheduler.run():
+            ...
+    '''
+
+    def __init__(
+            self,
+            api,
+            inputs_fp: str,
+            outputs_fp: str,
+            state_fp: str,
+            max_concurrent: int = 4,
+            options: str = None,
+            poll_initial: float = 2.0,
+            poll_max: float = 60.0,
+            job_timeout: float = None,
+            is_complete: Callable[[str], bool] = results_listed,
+            sleep: Callable[[float], None] = time.sleep,
+            clock: Callable[[], float] = time.time,
+    ):
+        '''
+        Args:
+            api: A `CelloAPI` instance (or anything exposing `submit` and
+                `get_results` with the same signatures).
+            inputs_fp: Filepath to the inputs shared by every design.
+            outputs_fp: Filepath to the outputs shared by every design.
+            state_fp: Where job state is persisted. An existing file is loaded
+                so that an interrupted batch resumes instead of resubmitting.
+            max_concurrent: Maximum number of jobs submitted but not finished.
+            options: Options string passed through to `CelloAPI.submit`.
+            poll_initial: First polling interval for a job, in seconds.
+            poll_max: Ceiling for the polling interval, in seconds.
+            job_timeout: Seconds after submission before a job is marked as
+                failed. `None` waits indefinitely.
+            is_complete: Predicate over the results listing for a job.
+            sleep: Sleep function, swappable for testing.
+            clock: Time function, swappable for testing.
+        '''
+        if max_concurrent < 1:
+            raise RuntimeError('The scheduler needs at least one job slot.')
+        self.api = api
+        self.inputs_fp = inputs_fp
+        self.outputs_fp = outputs_fp
+        self.state_fp = state_fp
+        self.max_concurrent = max_concurrent
+        self.options = options
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.job_timeout = job_timeout
+        self.is_complete = is_complete
+        self.sleep = sleep
+        self.clock = clock
+        # Insertion ordered, so designs are submitted in the order added.
+        self.jobs: Dict[str, CelloJob] = {}
+        self._load_state()
+
+    # --------------------------- Queue Management ----------------------------
+    def add_design(self, verilog_fp: str, job_id: str = None) -> CelloJob:
+        '''
+        Queues a single design. Designs that are already known (for example
+        from a resumed state file) are left untouched.
+
+        Args:
+            verilog_fp: Filepath to the Verilog file.
+            job_id: Identification Number for the Job. Defaults to the file
+                stem plus a digest of its contents, which keeps the id stable
+                across resumes and distinct across edited designs.
+
+        Returns:
+            The job tracking this design.
+        '''
+        if job_id is None:
+            job_id = _derive_job_id(verilog_fp)
+        if job_id not in self.jobs:
+            self.jobs[job_id] = CelloJob(job_id=job_id, verilog_fp=verilog_fp)
+            self._save_state()
+        return self.jobs[job_id]
+
+    def add_directory(
+            self,
+            directory: str,
+            pattern: str = '*.v',
+    ) -> List[CelloJob]:
+        '''
+        Queues every design in a directory.
+
+        Args:
+            directory: Directory containing Verilog files.
+            pattern: Glob pattern to match within the directory.
+
+        Returns:
+            The jobs tracking the matched designs, in filename order.
+        '''
+        filepaths = sorted(glob.glob(os.path.join(directory, pattern)))
+        if not filepaths:
+            raise RuntimeError(
+                f'No designs matching {pattern} found in {directory}'
+            )
+        return [self.add_design(filepath) for filepath in filepaths]
+
+    # ------------------------------- Execution --------------------------------
+    def run(self) -> Iterator[CelloJob]:
+        '''
+        Drives the batch to completion.
+
+        Jobs that were submitted before an interruption go straight back to
+        polling. Jobs already finished in a previous run are not yielded again.
+
+        Yields:
+            Each job as it completes or fails, with `result` populated for
+            completed jobs.
+        '''
+        pending = [
+            job for job in self.jobs.values() if job.status == JOB_PENDING
+        ]
+        pending.reverse()
+        in_flight = {}
+        for job in self.jobs.values():
+            if job.status == JOB_SUBMITTED:
+                in_flight[job.job_id] = self._new_poll_schedule()
+        # Last listing seen per job, to tell progress from a job standing still.
+        listings = {}
+        while pending or in_flight:
+            while pending and len(in_flight) < self.max_concurrent:
+                job = pending.pop()
+                if self._submit(job):
+                    in_flight[job.job_id] = self._new_poll_schedule()
+                else:
+                    yield job
+            if not in_flight:
+                continue
+            # Sleep until the earliest poll is due, then poll everything that
+            # is due. Schedules are (next poll time, backoff) pairs. A listing
+            # that changed means the job is moving, so its backoff starts over.
+            now = self.clock()
+            next_due = min(schedule[0] for schedule in in_flight.values())
+            if next_due > now:
+                self.sleep(next_due - now)
+                now = self.clock()
+            for job_id in list(in_flight):
+                due_at, backoff = in_flight[job_id]
+                if due_at > now:
+                    continue
+                job = self.jobs[job_id]
+                finished, listing = self._poll(job)
+                if finished:
+                    del in_flight[job_id]
+                    listings.pop(job_id, None)
+                    yield job
+                    continue
+                if listing is not None:
+                    if job_id in listings and listing != listings[job_id]:
+                        backoff.reset()
+                    listings[job_id] = listing
+                in_flight[job_id] = (now + backoff.next(), backoff)
+
+    def summary(self) -> Dict[str, int]:
+        '''
+        Returns:
+            A count of jobs per status.
+        '''
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _new_poll_schedule(self):
+        backoff = Backoff(initial=self.poll_initial, maximum=self.poll_max)
+        return self.clock() + backoff.next(), backoff
+
+    def _submit(self, job: CelloJob) -> bool:
+        '''
+        Returns:
+            Whether the job was accepted. Failed jobs are finalized here.
+        '''
+        try:
+            self.api.submit(
+                job.job_id,
+                job.verilog_fp,
+                self.inputs_fp,
+                self.outputs_fp,
+                self.options,
+            )
+        except Exception as e:
+            self._finish(job, JOB_FAILED, error=f'Submission failed: {e}')
+            return False
+        job.status = JOB_SUBMITTED
+        job.submitted_at = self.clock()
+        self._save_state()
+        return True
+
+    def _poll(self, job: CelloJob) -> Tuple[bool, str]:
+        '''
+        Returns:
+            Whether the job reached a final state on this poll, and the
+            listing polled (None if the poll failed).
+        '''
+        job.polls += 1
+        try:
+            listing = self.api.get_results(job_id=job.job_id, refresh=True)
+        except Exception as e:
+            # Transient network trouble is treated like "not done yet" and
+            # simply rides the backoff.
+            listing = None
+            job.error = f'Last poll failed: {e}'
+        if listing is not None and self.is_complete(listing):
+            self._finish(job, JOB_COMPLETE, result=listing)
+            return True, listing
+        if self.job_timeout is not None and \
+                self.clock() - job.submitted_at > self.job_timeout:
+            self._finish(
+                job,
+                JOB_FAILED,
+                error=f'Timed out after {self.job_timeout} seconds',
+            )
+            return True, listing
+        self._save_state()
+        return False, listing
+
+    def _finish(self, job: CelloJob, status: str, result=None, error=None):
+        job.status = status
+        job.completed_at = self.clock()
+        job.result = result
+        job.error = error
+        self._save_state()
+
+    # ------------------------------ Persistence -------------------------------
+    def _load_state(self):
+        if not os.path.exists(self.state_fp):
+            return
+        with open(self.state_fp, 'r') as state_file:
+            state = json.load(state_file)
+        for entry in state['jobs']:
+            job = CelloJob(**entry)
+            self.jobs[job.job_id] = job
+
+    def _save_state(self):
+        '''
+        Writes the state file atomically so that a kill mid-write never leaves
+        a truncated file behind.
+        '''
+        temporary_fp = f'{self.state_fp}.tmp'
+        with open(temporary_fp, 'w') as state_file:
+            json.dump(
+                {'jobs': [job.to_state() for job in self.jobs.values()]},
+                state_file,
+                indent=2,
+            )
+        os.replace(temporary_fp, self.state_fp)
+
+
+def _derive_job_id(verilog_fp: str) -> str:
+    stem = os.path.splitext(os.path.basename(verilog_fp))[0]
+    try:
+        with open(verilog_fp, 'rb') as verilog_file:
+            digest = hashlib.sha1(verilog_file.read()).hexdigest()[:8]
+    except OSError as e:
+        raise RuntimeError(
+            f'Unable to locate passed in file {verilog_fp}. System '
+            f'exception: {e}'
+        )
+    # Cello is picky about job ids, so keep them alphanumeric.
+    stem = ''.join(character for character in stem if character.isalnum())
+    return f'{stem}{digest}'
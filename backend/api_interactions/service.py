@@ -0,0 +1,757 @@
+"""
+backend.api_interactions.service
+
+A long-running local HTTP/JSON service around the design backend, for the
+frontend and other interactive callers.
+
+Running `main.py` per request would pay for importing scipy and parsing the
+UCF every time. Instead the service keeps parsed libraries in memory and
+hands jobs to a fixed pool of worker processes that keep them warm too:
+
+    POST /libraries     Register a library (UCF JSON or paths); returns its id.
+    GET  /libraries     List registered libraries.
+    POST /jobs          Queue a `score` or `optimize` job for a Verilog design.
+                        Answered straight from the result cache when the same
+                        job has run before, 429 when the queue is full.
+    GET  /jobs/<id>     Job status and result; `?wait=<seconds>` long-polls.
+    GET  /health        Queue depth, worker and cache counters.
+
+Every job runs under a time limit; a worker that overruns is terminated and
+replaced, and the job is reported as timed out.
+
+Libraries may be registered by local path, so browsers are only let in from
+the configured frontend origin: requests carrying any other `Origin` are
+refused with 403 before they are routed.
+
+Usage:
+    python -m backend.api_interactions.service --port 8000 --workers 4
+
+W.R. Jackson 2020
+"""
+import argparse
+import collections
+import hashlib
+import json
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from dataclasses import (
+    asdict,
+    dataclass,
+    field,
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from multiprocessing.connection import wait as wait_for_connections
+from typing import (
+    Dict,
+    List,
+)
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETE = 'complete'
+JOB_FAILED = 'failed'
+JOB_TIMEOUT = 'timeout'
+FINISHED_STATES = (JOB_COMPLETE, JOB_FAILED, JOB_TIMEOUT)
+
+JOB_KINDS = ('score', 'optimize')
+# Longest a client can block on `GET /jobs/<id>?wait=`.
+MAX_WAIT = 30.0
+# The frontend's development server.
+DEFAULT_ORIGIN = 'http://localhost:3000'
+
+
+@dataclass
+class ServiceJob:
+    '''
+    Attributes:
+        job_id: Identifier handed back to the client.
+        kind: `score` or `optimize`.
+        library_id: Library the job runs against.
+        spec: The job parameters, as posted.
+        key: Result cache key.
+        timeout: Seconds the job may run for.
+        status: One of the JOB_* constants.
+        cached: Whether the result came from the cache.
+        submitted_at, started_at, finished_at: Wall clock timestamps.
+        result: The design record, once complete.
+        error: Failure description, if any.
+    '''
+    job_id: str
+    kind: str
+    library_id: str
+    spec: dict
+    key: str
+    timeout: float
+    status: str = JOB_QUEUED
+    cached: bool = False
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    result: dict = None
+    error: str = None
+
+    def to_state(self) -> dict:
+        state = asdict(self)
+        state.pop('spec')
+        state.pop('key')
+        return state
+
+
+class QueueFull(RuntimeError):
+    '''
+    Raised when a job is submitted while the queue is at capacity.
+    '''
+
+
+class OptimizationService:
+    '''
+    Usage:
+        with OptimizationService(workers=2) as service:
+            library_id = service.add_library(
+                gates_csv_path='example_files/gates_Eco1C1G1T1.csv',
+                input_signals_path='example_files/Inputs.txt',
+            )
+            job = service.submit(library_id, 'score', verilog_text)
+            service.wait(job.job_id, timeout=10)
+    '''
+
+    def __init__(
+            self,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            workers: int = 2,
+            queue_size: int = 16,
+            job_timeout: float = 60.0,
+            cache_size: int = 1024,
+            max_jobs: int = 10000,
+            start_method: str = None,
+            allowed_origin: str = DEFAULT_ORIGIN,
+    ):
+        '''
+        Args:
+            host: Interface to listen on.
+            port: Port to listen on; 0 picks a free one.
+            workers: Worker processes.
+            queue_size: Jobs that may wait for a worker before submissions
+                are refused with 429.
+            job_timeout: Default and maximum seconds a job may run for.
+            cache_size: Completed results kept for repeat requests.
+            max_jobs: Finished jobs remembered for status queries.
+            start_method: multiprocessing start method for the workers.
+            allowed_origin: The only browser origin served, e.g. the
+                frontend's. None refuses every cross origin request.
+        '''
+        self.host = host
+        self.port = port
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self.job_timeout = job_timeout
+        self.cache_size = cache_size
+        self.max_jobs = max_jobs
+        self.allowed_origin = allowed_origin
+        self._context = multiprocessing.get_context(start_method)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self.libraries: Dict[str, dict] = {}
+        self.jobs: 'collections.OrderedDict[str, ServiceJob]' = \
+            collections.OrderedDict()
+        self._in_flight: Dict[str, str] = {}
+        self._results: 'collections.OrderedDict[str, dict]' = \
+            collections.OrderedDict()
+        self._workers: List[_Worker] = []
+        self._server = None
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        # Counters.
+        self.cache_hits = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    # ------------------------------- Lifecycle --------------------------------
+    def start(self) -> str:
+        '''
+        Starts the workers, the dispatcher and the HTTP server.
+
+        Returns:
+            The base URL of the service.
+        '''
+        if self._server is not None:
+            return self.url
+        self._stopping.clear()
+        self._workers = [self._spawn() for _ in range(self.worker_count)]
+        self._server = ThreadingHTTPServer(
+            (self.host, self.port),
+            _build_handler(self),
+        )
+        self._server.daemon_threads = True
+        self._threads = [
+            threading.Thread(target=self._dispatch, daemon=True),
+            threading.Thread(target=self._server.serve_forever, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self.url
+
+    def stop(self):
+        '''
+        Stops serving and shuts the workers down.
+        '''
+        if self._server is None:
+            return
+        self._stopping.set()
+        self._server.shutdown()
+        self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        for worker in self._workers:
+            worker.stop()
+        self._server = None
+        self._threads = []
+        self._workers = []
+
+    @property
+    def url(self) -> str:
+        if self._server is None:
+            raise RuntimeError('Service has not been started.')
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # ------------------------------ Public API --------------------------------
+    def add_library(
+            self,
+            ucf: list = None,
+            ucf_path: str = None,
+            gates_csv_path: str = None,
+            input_signals: List[dict] = None,
+            input_signals_path: str = None,
+    ) -> str:
+        '''
+        Parses and registers a gate library. Registering the same content
+        twice returns the same id.
+
+        Args:
+            ucf: UCF JSON contents, e.g. as parsed by the frontend.
+            ucf_path: UCF file to read instead.
+            gates_csv_path: Gates CSV, used when the UCF has no gate models.
+            input_signals: [{'name', 'off_value', 'on_value'}] sensors.
+            input_signals_path: Input sensor file to read instead.
+
+        Returns:
+            The library id.
+        '''
+        # Imported here so that importing the client side of this package
+        # doesn't pull in scipy.
+        from backend.parsing import (
+            parse_gates_csv,
+            parse_input_signals,
+        )
+        from backend.solvers import (
+            gate_models_from_csv,
+            gate_models_from_ucf,
+        )
+        if ucf is None and ucf_path is not None:
+            with open(ucf_path, 'r') as input_file:
+                ucf = json.load(input_file)
+        gate_models = gate_models_from_ucf(ucf) if ucf is not None else []
+        if not gate_models and gates_csv_path is not None:
+            gate_models = gate_models_from_csv(parse_gates_csv(gates_csv_path))
+        if not gate_models:
+            raise ValueError('The library holds no gate models.')
+        if input_signals is None and input_signals_path is not None:
+            input_signals = [
+                {
+                    'name': signal.label,
+                    'off_value': signal.off_value,
+                    'on_value': signal.on_value,
+                }
+                for signal in parse_input_signals(input_signals_path).values()
+            ]
+        if not input_signals:
+            raise ValueError('The library holds no input signals.')
+        payload = {
+            'gate_models': [asdict(model) for model in gate_models],
+            'signals': [
+                [signal['name'], float(signal['off_value']),
+                 float(signal['on_value'])]
+                for signal in input_signals
+            ],
+        }
+        library_id = _digest(payload)[:16]
+        with self._lock:
+            self.libraries[library_id] = payload
+        return library_id
+
+    def submit(
+            self,
+            library_id: str,
+            kind: str,
+            verilog: str,
+            repressor_max: int = None,
+            bio_optimization: str = 'DNA',
+            assignment_samples: int = 512,
+            seed: int = 0,
+            timeout: float = None,
+    ) -> ServiceJob:
+        '''
+        Queues a job, or answers it from the cache.
+
+        Args:
+            library_id: From `add_library`.
+            kind: `score` (assign and score) or `optimize` (also optimize
+                within `repressor_max` edits, default 1).
+            verilog: The Verilog source.
+            repressor_max: Edit budget for `optimize` jobs.
+            bio_optimization: 'DNA' or 'ALL'.
+            assignment_samples: Random repressor assignments scored.
+            seed: Seed for assignment and optimization.
+            timeout: Seconds the job may run for, capped at the service's
+                `job_timeout`.
+
+        Returns:
+            The job. Identical requests share a job while it's in flight.
+
+        Raises:
+            QueueFull: The queue is at capacity; retry later.
+        '''
+        if library_id not in self.libraries:
+            raise ValueError(f'Unknown library {library_id}')
+        if kind not in JOB_KINDS:
+            raise ValueError(f'Job kind must be one of {JOB_KINDS}')
+        if kind == 'score':
+            repressor_max = 0
+        elif repressor_max is None:
+            repressor_max = 1
+        spec = {
+            'verilog': verilog,
+            'repressor_max': int(repressor_max),
+            'bio_optimization': bio_optimization,
+            'assignment_samples': int(assignment_samples),
+            'seed': int(seed),
+        }
+        key = _digest({'library_id': library_id, 'kind': kind, **spec})
+        timeout = self.job_timeout if timeout is None \
+            else min(float(timeout), self.job_timeout)
+        job = ServiceJob(
+            job_id=uuid.uuid4().hex,
+            kind=kind,
+            library_id=library_id,
+            spec=spec,
+            key=key,
+            timeout=timeout,
+        )
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.cache_hits += 1
+                job.status = JOB_COMPLETE
+                job.cached = True
+                job.started_at = job.finished_at = time.time()
+                job.result = self._results[key]
+                self._remember(job)
+                return job
+            if key in self._in_flight:
+                return self.jobs[self._in_flight[key]]
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFull('Job queue is full; retry later.')
+            self._in_flight[key] = job.job_id
+            self._remember(job)
+        return job
+
+    def get(self, job_id: str) -> ServiceJob:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float = None) -> ServiceJob:
+        '''
+        Blocks until a job finishes or the timeout passes.
+
+        Returns:
+            The job, finished or not.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self._finished:
+            while True:
+                job = self.jobs.get(job_id)
+                if job is None or job.status in FINISHED_STATES:
+                    return job
+                remaining = None if deadline is None \
+                    else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return job
+                self._finished.wait(remaining)
+
+    def health(self) -> dict:
+        with self._lock:
+            statuses = collections.Counter(
+                job.status for job in self.jobs.values()
+            )
+            return {
+                'status': 'ok',
+                'workers': len(self._workers),
+                'busy_workers': sum(
+                    worker.job is not None for worker in self._workers
+                ),
+                'queue_depth': self._queue.qsize(),
+                'queue_size': self.queue_size,
+                'jobs': dict(statuses),
+                'libraries': len(self.libraries),
+                'cached_results': len(self._results),
+                'cache_hits': self.cache_hits,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
+
+    # ------------------------------- Dispatch ---------------------------------
+    def _spawn(self) -> '_Worker':
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child,),
+            daemon=True,
+        )
+        process.start()
+        child.close()
+        return _Worker(process, parent)
+
+    def _dispatch(self):
+        '''
+        Feeds idle workers, collects results and enforces time limits.
+        '''
+        while not self._stopping.is_set():
+            for worker in self._workers:
+                if worker.job is not None:
+                    continue
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._start(worker, job)
+            busy = [worker for worker in self._workers
+                    if worker.job is not None]
+            if not busy:
+                try:
+                    job = self._queue.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                self._start(self._workers[0], job)
+                continue
+            ready = wait_for_connections(
+                [worker.connection for worker in busy],
+                timeout=0.05,
+            )
+            for worker in busy:
+                if worker.connection in ready:
+                    self._collect(worker)
+                elif time.time() - worker.job.started_at > worker.job.timeout:
+                    self._expire(worker)
+
+    def _start(self, worker: '_Worker', job: ServiceJob):
+        payload = None
+        if job.library_id not in worker.libraries:
+            payload = self.libraries[job.library_id]
+        with self._lock:
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+        worker.job = job
+        try:
+            worker.connection.send(
+                (job.job_id, job.library_id, payload, job.spec)
+            )
+        except (BrokenPipeError, EOFError, OSError):
+            self._replace(worker, JOB_FAILED, 'Worker exited unexpectedly.')
+            return
+        worker.libraries.add(job.library_id)
+
+    def _collect(self, worker: '_Worker'):
+        try:
+            _, status, body = worker.connection.recv()
+        except (EOFError, OSError):
+            self._replace(worker, JOB_FAILED, 'Worker exited unexpectedly.')
+            return
+        job = worker.job
+        worker.job = None
+        if status == JOB_COMPLETE:
+            self._finish(job, JOB_COMPLETE, result=body)
+        else:
+            self._finish(job, JOB_FAILED, error=body)
+
+    def _expire(self, worker: '_Worker'):
+        with self._lock:
+            self.timeouts += 1
+        self._replace(
+            worker,
+            JOB_TIMEOUT,
+            f'Job exceeded its {worker.job.timeout:g}s time limit.',
+        )
+
+    def _replace(self, worker: '_Worker', status: str, error: str):
+        job = worker.job
+        worker.stop()
+        self._workers[self._workers.index(worker)] = self._spawn()
+        if job is not None:
+            self._finish(job, status, error=error)
+
+    def _finish(self, job: ServiceJob, status: str, result: dict = None,
+                error: str = None):
+        with self._finished:
+            job.status = status
+            job.finished_at = time.time()
+            job.result = result
+            job.error = error
+            self._in_flight.pop(job.key, None)
+            if status == JOB_COMPLETE:
+                self._results[job.key] = result
+                while len(self._results) > self.cache_size:
+                    self._results.popitem(last=False)
+            self._finished.notify_all()
+
+    def _remember(self, job: ServiceJob):
+        '''
+        Records a job, forgetting the oldest finished ones past `max_jobs`.
+        Callers hold the lock.
+        '''
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > self.max_jobs:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.status not in FINISHED_STATES:
+                break
+            self.jobs.popitem(last=False)
+
+    # --------------------------------- HTTP -----------------------------------
+    def handle(self, operation: str, path: str, body: bytes):
+        '''
+        Routes a request.
+
+        Returns:
+            A (status code, JSON serializable body, extra headers) triple.
+        '''
+        url = urlparse(path)
+        segments = [segment for segment in url.path.split('/') if segment]
+        query = parse_qs(url.query)
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {'error': 'Request body must be JSON.'}, {}
+        if segments == ['health'] and operation == 'GET':
+            return 200, self.health(), {}
+        if segments == ['libraries']:
+            if operation == 'GET':
+                with self._lock:
+                    return 200, {
+                        library_id: {
+                            'gates': len(library['gate_models']),
+                            'signals': [signal[0]
+                                        for signal in library['signals']],
+                        }
+                        for library_id, library in self.libraries.items()
+                    }, {}
+            if operation == 'POST':
+                try:
+                    library_id = self.add_library(**payload)
+                except (TypeError, ValueError, OSError, KeyError) as error:
+                    return 400, {'error': str(error)}, {}
+                return 201, {'library_id': library_id}, {}
+        if segments == ['jobs'] and operation == 'POST':
+            try:
+                job = self.submit(**payload)
+            except QueueFull as error:
+                return 429, {'error': str(error)}, {'Retry-After': '1'}
+            except (TypeError, ValueError) as error:
+                return 400, {'error': str(error)}, {}
+            status = 200 if job.status in FINISHED_STATES else 202
+            return status, job.to_state(), {}
+        if len(segments) == 2 and segments[0] == 'jobs' and \
+                operation == 'GET':
+            try:
+                wait = float(query.get('wait', ['0'])[0])
+            except ValueError:
+                return 400, {'error': 'wait must be a number of seconds.'}, {}
+            job = self.wait(segments[1], min(wait, MAX_WAIT)) if wait > 0 \
+                else self.get(segments[1])
+            if job is None:
+                return 404, {'error': f'Unknown job {segments[1]}'}, {}
+            return 200, job.to_state(), {}
+        return 404, {'error': f'Unknown endpoint {url.path}'}, {}
+
+
+class _Worker:
+    '''
+    Supervisor side handle on a worker process.
+    '''
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.job: ServiceJob = None
+        # Libraries this worker already holds.
+        self.libraries = set()
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=5)
+        self.connection.close()
+
+
+def _worker_main(connection):
+    '''
+    Worker process loop: keeps libraries warm and runs one job at a time.
+    '''
+    from backend.datastructures import InputSignal
+    from backend.parsing import parse_verilog
+    from backend.solvers import (
+        GateModel,
+        PipelineConfig,
+        design_record,
+    )
+
+    libraries = {}
+    while True:
+        try:
+            job_id, library_id, payload, spec = connection.recv()
+        except (EOFError, OSError):
+            return
+        if payload is not None:
+            libraries[library_id] = (
+                [GateModel(**model) for model in payload['gate_models']],
+                [
+                    InputSignal(label=name, off_value=off, on_value=on)
+                    for name, off, on in payload['signals']
+                ],
+            )
+        gate_models, signals = libraries[library_id]
+        start = time.perf_counter()
+        try:
+            record = design_record(
+                parse_verilog(spec['verilog']),
+                gate_models,
+                signals,
+                PipelineConfig(
+                    repressor_max=spec['repressor_max'],
+                    bio_optimization=spec['bio_optimization'],
+                    assignment_samples=spec['assignment_samples'],
+                    seed=spec['seed'],
+                ),
+            )
+            record['seconds'] = round(time.perf_counter() - start, 4)
+            reply = (job_id, JOB_COMPLETE, record)
+        except Exception as error:
+            reply = (job_id, JOB_FAILED, f'{type(error).__name__}: {error}')
+        connection.send(reply)
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+def _build_handler(service: OptimizationService):
+    class ServiceHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def do_OPTIONS(self):
+            # CORS preflight from the frontend dev server.
+            if not self._origin_allowed():
+                self._respond(403, {'error': 'Origin not allowed.'}, {})
+                return
+            self.send_response(204)
+            self._cors_headers()
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def _dispatch(self, operation: str):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            # Refused outright rather than just left without CORS headers, as
+            # a browser still sends simple cross origin POSTs and only hides
+            # the response.
+            if not self._origin_allowed():
+                self._respond(403, {'error': 'Origin not allowed.'}, {})
+                return
+            self._respond(*service.handle(operation, self.path, body))
+
+        def _respond(self, status: int, payload, headers: dict):
+            encoded = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self._cors_headers()
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(encoded)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def _origin_allowed(self) -> bool:
+            # Clients other than browsers send no Origin.
+            origin = self.headers.get('Origin')
+            return origin is None or origin == service.allowed_origin
+
+        def _cors_headers(self):
+            if service.allowed_origin is None:
+                return
+            self.send_header('Access-Control-Allow-Origin',
+                             service.allowed_origin)
+            self.send_header('Vary', 'Origin')
+            self.send_header('Access-Control-Allow-Methods',
+                             'GET, POST, OPTIONS')
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+
+        def log_message(self, format, *args):
+            pass
+
+    return ServiceHandler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve circuit scoring and optimization over HTTP.'
+    )
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--queue-size', type=int, default=16)
+    parser.add_argument('--job-timeout', type=float, default=60.0)
+    parser.add_argument('--allowed-origin', type=str, default=DEFAULT_ORIGIN)
+    args = parser.parse_args()
+    service = OptimizationService(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        job_timeout=args.job_timeout,
+        allowed_origin=args.allowed_origin,
+    )
+    print(f'Serving on {service.start()}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        service.stop()
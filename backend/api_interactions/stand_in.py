@@ -0,0 +1,336 @@
+"""
+backend.api_interactions.stand_in
+
+A local, in-process stand-in for the Cello HTTP API.
+
+The real host is frequently unreachable, which makes `CelloAPI` impossible to
+test or benchmark. This serves the endpoints that `fetch_resource` talks to
+(`in_out`, `submit`, `results`, `resultsroot`, `ucf`) from memory with
+configurable latency and failure injection, so retry and backoff behavior can
+be exercised deterministically.
+
+Arguments arrive as path segments, exactly as `fetch_resource` builds them.
+
+W.R. Jackson 2020
+"""
+import json
+import random
+import threading
+import time
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from typing import (
+    Dict,
+    List,
+)
+from urllib.parse import unquote
+
+# Where `resultsroot` points. `read_genbank` uses the body of that response as
+# the next endpoint.
+RESULTS_ROOT = 'files'
+
+
+class CelloStandIn:
+    '''
+    Threaded HTTP server imitating Cello.
+
+    Usage:
+        with CelloStandIn(latency=0.01, failure_rate=0.1) as stand_in:
+            api = CelloAPI(url=stand_in.url, username='u', password='p')
+            api.get_inputs()
+    '''
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            latency_jitter: float = 0.0,
+            failure_rate: float = 0.0,
+            failure_status: int = 503,
+            job_duration: float = 0.0,
+            seed: int = None,
+    ):
+        '''
+        Args:
+            latency: Seconds added to every response.
+            latency_jitter: Extra uniformly distributed latency, in seconds.
+            failure_rate: Probability that a request is answered with
+                `failure_status` instead of being served.
+            failure_status: Status code used for injected failures.
+            job_duration: Seconds between submission and a job listing its
+                results.
+            seed: Seed for the failure and jitter draws.
+        '''
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.job_duration = job_duration
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+        # Server side state.
+        self.in_out: Dict[str, str] = {}
+        self.ucfs: Dict[str, str] = {}
+        self.jobs: Dict[str, float] = {}
+        # Counters, keyed by endpoint.
+        self.requests_served: Dict[str, int] = {}
+        self.failures_injected = 0
+
+    # ------------------------------- Lifecycle --------------------------------
+    def start(self) -> str:
+        '''
+        Starts serving on an ephemeral localhost port.
+
+        Returns:
+            The base URL to hand to `CelloAPI`.
+        '''
+        if self._server is not None:
+            return self.url
+        self._server = ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            _build_handler(self),
+        )
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            daemon=True,
+        )
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        '''
+        Shuts the server down and waits for the serving thread to exit.
+        '''
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        if self._server is None:
+            raise RuntimeError('Stand-in server has not been started.')
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # ------------------------------- Dispatch ---------------------------------
+    def handle(self, operation: str, segments: List[str]):
+        '''
+        Routes a request.
+
+        Args:
+            operation: HTTP method.
+            segments: Decoded path segments.
+
+        Returns:
+            A (status code, body) pair.
+        '''
+        end_point = segments[0] if segments else ''
+        with self._lock:
+            self.requests_served[end_point] = \
+                self.requests_served.get(end_point, 0) + 1
+            inject_failure = self._random.random() < self.failure_rate
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            if inject_failure:
+                self.failures_injected += 1
+        if delay:
+            time.sleep(delay)
+        if inject_failure:
+            return self.failure_status, 'Injected failure'
+        arguments = segments[1:]
+        with self._lock:
+            if end_point == '':
+                return 200, 'Cello stand-in'
+            if end_point == 'in_out':
+                return self._in_out(operation, arguments)
+            if end_point == 'submit':
+                return self._submit(arguments)
+            if end_point == 'results':
+                return self._results(arguments)
+            if end_point == 'resultsroot':
+                return 200, RESULTS_ROOT
+            if end_point == RESULTS_ROOT:
+                return self._genbank(arguments)
+            if end_point == 'ucf':
+                return self._ucf(operation, arguments)
+        return 404, f'Unknown endpoint {end_point}'
+
+    def _in_out(self, operation: str, arguments: List[str]):
+        if not arguments:
+            return 200, json.dumps(sorted(self.in_out))
+        name = arguments[0]
+        if operation == 'DELETE':
+            if self.in_out.pop(name, None) is None:
+                return 404, f'{name} not found'
+            return 200, f'Deleted {name}'
+        if len(arguments) > 1 and name.endswith('.text'):
+            # Upload: filename followed by the file text.
+            self.in_out[name] = arguments[1]
+            return 200, f'Wrote {name}'
+        if name in self.in_out:
+            return 200, self.in_out[name]
+        # Keyword search, e.g. `input_` and `.txt`.
+        matches = [
+            filename for filename in sorted(self.in_out)
+            if filename.startswith(name)
+        ]
+        return 200, json.dumps(matches)
+
+    def _submit(self, arguments: List[str]):
+        if not arguments:
+            return 400, 'Missing job id'
+        self.jobs[arguments[0]] = time.time()
+        return 200, f'Submitted {arguments[0]}'
+
+    def _results(self, arguments: List[str]):
+        if not arguments:
+            return 200, json.dumps(sorted(self.jobs))
+        job_id = arguments[0]
+        if job_id not in self.jobs:
+            return 404, f'Unknown job {job_id}'
+        if time.time() - self.jobs[job_id] < self.job_duration:
+            return 200, '[]'
+        files = _job_files(job_id)
+        if len(arguments) > 1 and arguments[1] in files:
+            return 200, files[arguments[1]]
+        keywords = arguments[1:]
+        listing = [
+            filename for filename in sorted(files)
+            if all(keyword in filename for keyword in keywords)
+        ]
+        return 200, json.dumps(listing)
+
+    def _genbank(self, arguments: List[str]):
+        if len(arguments) < 3:
+            return 400, 'Expected user name, job id and filename'
+        _, job_id, filename = arguments[:3]
+        if job_id not in self.jobs:
+            return 404, f'Unknown job {job_id}'
+        files = _job_files(job_id)
+        if filename not in files:
+            return 404, f'{filename} not found'
+        return 200, files[filename]
+
+    def _ucf(self, operation: str, arguments: List[str]):
+        if not arguments:
+            return 200, json.dumps(sorted(self.ucfs))
+        if operation == 'DELETE':
+            if self.ucfs.pop(arguments[0], None) is None:
+                return 404, f'{arguments[0]} not found'
+            return 200, f'Deleted {arguments[0]}'
+        if arguments[-1] == 'validate':
+            if arguments[0] not in self.ucfs:
+                return 404, f'{arguments[0]} not found'
+            return 200, json.dumps({'status': 'valid'})
+        try:
+            json.loads(arguments[0])
+        except ValueError:
+            return 200, self.ucfs.get(arguments[0], '')
+        name = f'stand_in_{len(self.ucfs)}.UCF.json'
+        self.ucfs[name] = arguments[0]
+        return 200, f'Wrote {name}'
+
+
+def _build_handler(stand_in: CelloStandIn):
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_DELETE(self):
+            self._dispatch('DELETE')
+
+        def _dispatch(self, operation: str):
+            segments = [
+                unquote(segment) for segment in self.path.split('/')
+                if segment
+            ]
+            status, body = stand_in.handle(operation, segments)
+            encoded = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def log_message(self, format, *args):
+            # The default handler writes every request to stderr, which drowns
+            # out everything else during a load test.
+            pass
+
+    return StandInHandler
+
+
+# ------------------------------ Canned Results --------------------------------
+def _job_files(job_id: str) -> Dict[str, str]:
+    '''
+    The files a finished job exposes. Deterministic in the job id.
+    '''
+    return {
+        f'{job_id}_A000_reutable.txt': 'gate\tREU\nA1_AmtR\t0.06\n',
+        f'{job_id}_A000_parts_list.txt': 'A000: [pAmtR, BydvJ, A1, AmtR]',
+        f'{job_id}_A000_plasmid_circuit_P000.ape': genbank_record(job_id),
+    }
+
+
+def genbank_record(name: str, length: int = 1200, seed: int = 0) -> str:
+    '''
+    Renders a small synthetic GenBank record laid out the way Cello writes
+    plasmids: a promoter, RBS, CDS and terminator per cassette.
+
+    Args:
+        name: Locus name.
+        length: Length of the sequence.
+        seed: Seed for the sequence.
+
+    Returns:
+        The GenBank text.
+    '''
+    generator = random.Random(f'{name}{seed}')
+    sequence = ''.join(generator.choice('acgt') for _ in range(length))
+    features = []
+    parts = [
+        ('promoter', 'pAmtR', 60),
+        ('rbs', 'A1', 30),
+        ('CDS', 'AmtR', 600),
+        ('terminator', 'L3S2P11', 50),
+    ]
+    position = 1
+    for feature_type, label, part_length in parts:
+        end = min(position + part_length - 1, length)
+        features.append(
+            f'     {feature_type:<16}{position}..{end}\n'
+            f'                     /label="{label}"\n'
+        )
+        position = end + 1
+    lines = [
+        f'LOCUS       {name[:16]:<16} {length:>11} bp    DNA     circular '
+        f'SYN 01-JAN-2020\n',
+        'FEATURES             Location/Qualifiers\n',
+    ]
+    lines.extend(features)
+    lines.append('ORIGIN\n')
+    for offset in range(0, length, 60):
+        blocks = [
+            sequence[index:index + 10]
+            for index in range(offset, min(offset + 60, length), 10)
+        ]
+        lines.append(f'{offset + 1:>9} {" ".join(blocks)}\n')
+    lines.append('//\n')
+    return ''.join(lines)
@@ -1,5 +1,49 @@
+from .assembly import (
+    Assembly,
+    AssemblyFeature,
+    assemble_circuit,
+    gate_parts_from_library,
+    part_window,
+)
+from .circuit import (
+    Circuit,
+    score_responses,
+)
 from .library import Library
+from .motif_scanner import (
+    MotifHit,
+    MotifScanner,
+    TYPE_IIS_SITES,
+)
 from .repressor import (
     InputSignal,
     Repressor,
-)
\ No newline at end of file
+    dose_response_curves,
+    response_function,
+)
+from .rules import RuleSet
+from .sequence_store import (
+    SequenceHandle,
+    SequenceStore,
+)
+
+__all__ = [
+    'Assembly',
+    'AssemblyFeature',
+    'assemble_circuit',
+    'gate_parts_from_library',
+    'part_window',
+    'Circuit',
+    'score_responses',
+    'InputSignal',
+    'Repressor',
+    'dose_response_curves',
+    'response_function',
+    'RuleSet',
+    'SequenceHandle',
+    'SequenceStore',
+    'Library',
+    'MotifHit',
+    'MotifScanner',
+    'TYPE_IIS_SITES',
+]
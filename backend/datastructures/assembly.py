@@ -0,0 +1,425 @@
+"""
+backend.datastructures.assembly
+
+Local assembly of circuit DNA, streamed out as GenBank or FASTA.
+
+An `Assembly` is a list of references to part sequences (strings, or handles
+into a `SequenceStore`) with their offsets, never one big concatenated
+string. Feature coordinates fall out of the offsets, and writers pull the
+bases a line at a time, so writing a design costs one pass over its bases
+and no more than a part and a line of extra memory, however many designs
+share the same parts.
+
+`assemble_circuit` lays a circuit out the way Cello does: per gate, the
+promoters of everything driving it, then the gate's ribozyme, RBS, CDS and
+terminator; then the output promoter(s) and output cassette. Parts come
+from `parse_gates_csv` rows or, through `gate_parts_from_library`, from the
+UCF `gates`/`structures`/`parts` collections.
+
+W.R. Jackson 2020
+"""
+import bisect
+import contextlib
+import datetime
+from dataclasses import dataclass
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+from backend.datastructures.circuit import Circuit
+from backend.datastructures.library import Library
+from backend.datastructures.repressor import InputSignal
+from backend.datastructures.sequence_store import SequenceHandle
+
+PartSequence = Union[str, SequenceHandle]
+
+_COMPLEMENT = str.maketrans(
+    'ACGTacgtNnRYKMrykmBVDHbvdhSWsw',
+    'TGCAtgcaNnYRMKyrmkVBHDvbhdSWsw',
+)
+# Gate CSV columns, in transcription unit order, with their GenBank keys.
+GATE_PART_COLUMNS = [
+    ('ribozyme', 'misc_feature'),
+    ('rbs', 'RBS'),
+    ('cds', 'CDS'),
+    ('terminator', 'terminator'),
+]
+_GENBANK_LINE = 60
+_GENBANK_BLOCK = 10
+
+
+@dataclass
+class AssemblyFeature:
+    '''
+    Attributes:
+        name: Part name, written as the GenBank label.
+        type: GenBank feature key, e.g. `promoter` or `CDS`.
+        start: Zero based start.
+        end: Exclusive end.
+        strand: 1 or -1.
+    '''
+    name: str
+    type: str
+    start: int
+    end: int
+    strand: int = 1
+
+    @property
+    def location(self) -> str:
+        '''
+        Returns:
+            The GenBank location string.
+        '''
+        location = f'{self.start + 1}..{self.end}'
+        return location if self.strand > 0 else f'complement({location})'
+
+
+class Assembly:
+    '''
+    Usage:
+        assembly = assemble_circuit(circuit, parse_gates_csv(gates_fp),
+                                    signals)
+        assembly.write_genbank('design.gb')
+    '''
+
+    def __init__(self, name: str = 'circuit', circular: bool = True):
+        self.name = name
+        self.circular = circular
+        self.features: List[AssemblyFeature] = []
+        # (sequence reference, offset, strand) per segment.
+        self._segments: List[Tuple[PartSequence, int, int]] = []
+        self._offsets: List[int] = []
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(
+            self,
+            sequence: PartSequence,
+            name: str = None,
+            feature_type: str = 'misc_feature',
+            strand: int = 1,
+    ) -> AssemblyFeature:
+        '''
+        Adds a part to the end without copying its bases.
+
+        Args:
+            sequence: The part's bases (as read on the forward strand of the
+                part).
+            name: Label of the feature. No feature is recorded without one.
+            feature_type: GenBank feature key.
+            strand: -1 to place the part reverse complemented.
+
+        Returns:
+            The part's feature, or None when unnamed.
+        '''
+        if sequence is None or not len(sequence):
+            raise RuntimeError(f'Part {name} has no sequence.')
+        start = self._length
+        self._segments.append((sequence, start, strand))
+        self._offsets.append(start)
+        self._length += len(sequence)
+        if name is None:
+            return None
+        feature = AssemblyFeature(name, feature_type, start, self._length,
+                                  strand)
+        self.features.append(feature)
+        return feature
+
+    # -------------------------------- Reading ---------------------------------
+    def iter_chunks(self, size: int = 4096) -> Iterator[str]:
+        '''
+        Yields the bases in chunks of exactly `size` (the last may be
+        shorter). Each part is decoded once, as it's reached, so at most one
+        part's worth of bases is held beyond the current chunk.
+        '''
+        pending = []
+        pending_length = 0
+        for sequence, _, strand in self._segments:
+            bases = part_window(sequence, strand, 0, len(sequence))
+            position = 0
+            while position < len(bases):
+                take = min(size - pending_length, len(bases) - position)
+                pending.append(bases[position:position + take])
+                pending_length += take
+                position += take
+                if pending_length == size:
+                    yield ''.join(pending)
+                    pending = []
+                    pending_length = 0
+        if pending:
+            yield ''.join(pending)
+
+    def sequence(self) -> str:
+        '''
+        Returns:
+            The whole assembled sequence. This is the only full copy made.
+        '''
+        return ''.join(self.iter_chunks(max(self._length, 1)))
+
+    @property
+    def segments(self) -> List[Tuple[PartSequence, int, int]]:
+        '''
+        Returns:
+            (sequence reference, offset, strand) of every part, in order.
+        '''
+        return list(self._segments)
+
+    def window(self, start: int, stop: int) -> str:
+        '''
+        Returns:
+            Bases [start, stop) on the forward strand, decoding only the
+            parts that overlap them.
+        '''
+        window = []
+        first = max(bisect.bisect_right(self._offsets, start) - 1, 0)
+        for sequence, offset, strand in self._segments[first:]:
+            if offset >= stop:
+                break
+            end = offset + len(sequence)
+            if end <= start:
+                continue
+            window.append(part_window(
+                sequence,
+                strand,
+                max(start - offset, 0),
+                min(stop, end) - offset,
+            ))
+        return ''.join(window)
+
+    def extract(self, feature: AssemblyFeature) -> str:
+        '''
+        Returns:
+            A feature's bases, as read on its own strand.
+        '''
+        bases = self.window(feature.start, feature.end)
+        return bases if feature.strand > 0 else _reverse_complement(bases)
+
+    # -------------------------------- Writing ---------------------------------
+    def write_fasta(
+            self,
+            destination: Union[str, TextIO],
+            line_width: int = 80,
+    ):
+        '''
+        Args:
+            destination: Filepath to write (replacing the file), or an open
+                text file to write to at its current position, e.g. to put
+                several records in one file.
+            line_width: Bases per sequence line.
+        '''
+        with _opened(destination) as output:
+            output.write(f'>{self.name}\n')
+            for line in self.iter_chunks(line_width):
+                output.write(line)
+                output.write('\n')
+
+    def write_genbank(self, destination: Union[str, TextIO]):
+        '''
+        Writes a single GenBank record, features labelled with part names.
+
+        Args:
+            destination: Filepath to write (replacing the file), or an open
+                text file to write to at its current position, e.g. to put
+                several records in one file.
+        '''
+        topology = 'circular' if self.circular else 'linear'
+        date = datetime.date.today().strftime('%d-%b-%Y').upper()
+        with _opened(destination) as output:
+            output.write(
+                f'LOCUS       {self.name[:16]:<16} {self._length:>11} bp    '
+                f'DNA     {topology:<8} SYN {date}\n'
+                f'DEFINITION  {self.name}.\n'
+                f'FEATURES             Location/Qualifiers\n'
+            )
+            for feature in self.features:
+                output.write(
+                    f'     {feature.type:<16}{feature.location}\n'
+                    f'                     /label="{feature.name}"\n'
+                )
+            output.write('ORIGIN\n')
+            position = 1
+            for line in self.iter_chunks(_GENBANK_LINE):
+                blocks = ' '.join(
+                    line[start:start + _GENBANK_BLOCK]
+                    for start in range(0, len(line), _GENBANK_BLOCK)
+                )
+                output.write(f'{position:>9} {blocks.lower()}\n')
+                position += len(line)
+            output.write('//\n')
+
+
+# ------------------------ Publicly Available Functions ------------------------
+def assemble_circuit(
+        circuit: Circuit,
+        gates: Dict[str, dict],
+        signals: Dict[str, InputSignal],
+        output: Tuple[str, PartSequence] = None,
+        name: str = 'circuit',
+) -> Assembly:
+    '''
+    Lays out a circuit's DNA, one transcription unit per gate in gate order.
+
+    Args:
+        circuit: The assigned circuit; `gate_labels` name the gates' rows.
+        gates: Gate name to row with `promoter`, `ribozyme`, `rbs`, `cds` and
+            `terminator` names and their `...DNA` sequences, as from
+            `parse_gates_csv` or `gate_parts_from_library`.
+        signals: Input signal label to signal, with promoter sequences.
+        output: (name, sequence) of the output cassette, e.g. from
+            `parse_output_signals`. It is driven by the output gate's
+            promoter. Without it the layout ends at the last gate.
+        name: Record name.
+
+    Returns:
+        The assembly.
+    '''
+    assembly = Assembly(name)
+    for label in circuit.gate_labels:
+        if label not in gates:
+            raise RuntimeError(f'No parts for gate {label}.')
+
+    def add_promoter(node: int):
+        if node < circuit.signal_count:
+            label = circuit.signal_labels[node]
+            if label not in signals:
+                raise RuntimeError(f'No promoter for input signal {label}.')
+            assembly.append(signals[label].sequence, label, 'promoter')
+            return
+        row = gates[circuit.gate_labels[node - circuit.signal_count]]
+        assembly.append(row['promoterDNA'], row['promoter'], 'promoter')
+
+    for gate, label in enumerate(circuit.gate_labels):
+        for node in circuit.gate_inputs(gate):
+            add_promoter(int(node))
+        row = gates[label]
+        for column, feature_type in GATE_PART_COLUMNS:
+            if row.get(f'{column}DNA'):
+                assembly.append(row[f'{column}DNA'], row[column],
+                                feature_type)
+    if output is not None:
+        add_promoter(circuit.signal_count + circuit.output)
+        assembly.append(output[1], output[0], 'misc_feature')
+    return assembly
+
+
+def gate_parts_from_library(library: Library = None) -> Dict[str, dict]:
+    '''
+    Collects each UCF gate's parts into the gates CSV row layout.
+
+    A gate's `structure` lists its output promoter and devices whose
+    components are part names, `#` input placeholders or other devices;
+    parts are looked up by name in the `parts` collection and filed under
+    their type.
+
+    Args:
+        library: The parsed UCF library. Defaults to the singleton.
+
+    Returns:
+        Gate name to row, for `assemble_circuit`. Gates missing a structure
+        are skipped.
+    '''
+    library = library if library is not None else Library()
+    rows = {}
+    for gate_name, gate in library.gates.items():
+        structure = library.structures.get(gate.get('structure'))
+        if structure is None:
+            continue
+        row = {'name': gate_name}
+        promoters = structure.get('outputs', [])
+        if promoters and promoters[0] in library.parts:
+            row['promoter'] = promoters[0]
+            row['promoterDNA'] = library.parts[promoters[0]].get('dnasequence')
+        devices = {
+            device['name']: device.get('components', [])
+            for device in structure.get('devices', [])
+        }
+        for part_name in _flatten_components(devices):
+            part = library.parts.get(part_name)
+            if part is None:
+                continue
+            part_type = part.get('type', '').lower()
+            if part_type in dict(GATE_PART_COLUMNS):
+                row[part_type] = part_name
+                row[f'{part_type}DNA'] = part.get('dnasequence')
+        rows[gate_name] = row
+    return rows
+
+
+def part_window(
+        sequence: PartSequence,
+        strand: int,
+        start: int,
+        stop: int,
+) -> str:
+    '''
+    Reads part of a part without decoding the rest of it.
+
+    Args:
+        sequence: The part's bases, as read on the forward strand of the part.
+        strand: -1 if the part is placed reverse complemented.
+        start: Zero based start, in placed coordinates.
+        stop: Exclusive end, in placed coordinates.
+
+    Returns:
+        Bases [start, stop) of the part as placed on the given strand.
+    '''
+    if strand > 0:
+        return sequence[start:stop] if isinstance(sequence, str) \
+            else sequence[start:stop].decode()
+    length = len(sequence)
+    piece = sequence[length - stop:length - start]
+    if not isinstance(piece, str):
+        piece = piece.decode()
+    return _reverse_complement(piece)
+
+
+# ----------------------------- Private Functions ------------------------------
+def _reverse_complement(bases: str) -> str:
+    return bases.translate(_COMPLEMENT)[::-1]
+
+
+def _flatten_components(devices: Dict[str, List[str]]) -> List[str]:
+    '''
+    Expands nested devices into part names, in order. The device that no
+    other device includes is the root.
+    '''
+    nested = {
+        component for components in devices.values()
+        for component in components
+    }
+    roots = [name for name in devices if name not in nested] or \
+        list(devices)[:1]
+    parts = []
+
+    def expand(name: str, seen: frozenset):
+        for component in devices.get(name, []):
+            if component.startswith('#'):
+                continue
+            if component in devices and component not in seen:
+                expand(component, seen | {component})
+            elif component not in devices:
+                parts.append(component)
+
+    for root in roots:
+        expand(root, frozenset([root]))
+    return parts
+
+
+@contextlib.contextmanager
+def _opened(destination: Union[str, TextIO]) -> Iterator[TextIO]:
+    '''
+    Opens a filepath for writing, truncating it, or passes an already open
+    file through.
+    '''
+    if hasattr(destination, 'write'):
+        yield destination
+        return
+    with open(destination, 'w') as output:
+        yield output
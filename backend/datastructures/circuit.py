@@ -0,0 +1,779 @@
+"""
+backend.datastructures.circuit
+
+Array-backed representation of a repressor circuit.
+
+A circuit built out of `Repressor` objects is a web of Python lists, dicts and
+mixed tuple/`InputSignal`/`Repressor` inputs dispatched on `type()`. That's
+fine for one circuit, but a search over thousands of candidates needs
+something denser. `Circuit` keeps gate parameters in contiguous arrays, wiring
+as CSR index arrays and input signals as an off/on level table, and evaluates
+every row of the truth table (and optionally many parameter sets) in one
+vectorized pass.
+
+Node numbering: input signals are nodes [0, S) and gates are nodes
+[S, S + G). Gates are stored in topological order, so every gate's inputs
+have a smaller index than the gate itself and the last gate is the output.
+
+W.R. Jackson 2020
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
+
+import numpy as np
+
+from backend.datastructures.repressor import (
+    InputSignal,
+    LogicFunction,
+    Repressor,
+    response_function,
+)
+
+# Truth tables larger than this are scored in chunks by `Circuit.score`.
+STREAMING_ROWS = 2 ** 16
+
+# Signal bit value meaning "on/off is decided by the consuming gate's own
+# logical output", which is how `Repressor.calculate_response_function` works.
+GATE_SELECTED = -1
+
+
+class Circuit:
+    '''
+    Attributes:
+        signal_labels: Label for each input signal.
+        signal_levels: (S, 2) array of [off, on] levels.
+        signal_bits: Per signal, the truth table bit that switches it, or
+            `GATE_SELECTED`.
+        y_min, y_max, k, n: (G,) response function parameters.
+        dna_edits, protein_edits: (G,) edit counters.
+        number_of_inputs: (G,) declared input count per gate.
+        logic: (G,) `LogicFunction` values.
+        input_indptr, input_indices: CSR biological inputs per gate, as node
+            ids.
+        logic_indptr, logic_indices: CSR logical inputs per gate. Values below
+            `n_bits` are truth table bits, the rest are `n_bits + gate`.
+        n_bits: Number of truth table inputs. The table has 2^n_bits rows.
+        active_low: Whether a true logical output means a low response. This
+            is the convention `Repressor.score_self` uses.
+    '''
+
+    def __init__(
+            self,
+            signal_labels: List[str],
+            signal_levels: np.ndarray,
+            signal_bits: np.ndarray,
+            y_min: np.ndarray,
+            y_max: np.ndarray,
+            k: np.ndarray,
+            n: np.ndarray,
+            number_of_inputs: np.ndarray,
+            logic: np.ndarray,
+            input_indptr: np.ndarray,
+            input_indices: np.ndarray,
+            logic_indptr: np.ndarray,
+            logic_indices: np.ndarray,
+            n_bits: int,
+            active_low: bool = True,
+            gate_labels: List[str] = None,
+            dna_edits: np.ndarray = None,
+            protein_edits: np.ndarray = None,
+    ):
+        self.signal_labels = list(signal_labels)
+        self.signal_levels = np.asarray(signal_levels, dtype=np.float64)
+        self.signal_bits = _frozen(signal_bits, np.int64)
+        self.y_min = np.asarray(y_min, dtype=np.float64)
+        self.y_max = np.asarray(y_max, dtype=np.float64)
+        self.k = np.asarray(k, dtype=np.float64)
+        self.n = np.asarray(n, dtype=np.float64)
+        gate_count = len(self.y_min)
+        self.number_of_inputs = _frozen(number_of_inputs, np.int64)
+        self.logic = _frozen(logic, np.int8)
+        self.input_indptr = _frozen(input_indptr, np.int64)
+        self.input_indices = _frozen(input_indices, np.int64)
+        self.logic_indptr = _frozen(logic_indptr, np.int64)
+        self.logic_indices = _frozen(logic_indices, np.int64)
+        self.n_bits = int(n_bits)
+        self.active_low = active_low
+        self.gate_labels = list(gate_labels) if gate_labels is not None \
+            else [f'G{index}' for index in range(gate_count)]
+        self.dna_edits = np.zeros(gate_count, dtype=np.int64) \
+            if dna_edits is None else np.asarray(dna_edits, dtype=np.int64)
+        self.protein_edits = np.zeros(gate_count, dtype=np.int64) \
+            if protein_edits is None \
+            else np.asarray(protein_edits, dtype=np.int64)
+        self._validate()
+
+    # ------------------------------- Properties -------------------------------
+    @property
+    def gate_count(self) -> int:
+        return len(self.y_min)
+
+    @property
+    def signal_count(self) -> int:
+        return len(self.signal_labels)
+
+    @property
+    def output(self) -> int:
+        '''
+        Returns:
+            Index of the output gate.
+        '''
+        return self.gate_count - 1
+
+    def gate_inputs(self, gate: int) -> np.ndarray:
+        '''
+        Returns:
+            Node ids feeding a gate's biological input.
+        '''
+        return self.input_indices[
+            self.input_indptr[gate]:self.input_indptr[gate + 1]
+        ]
+
+    def gate_logic_inputs(self, gate: int) -> np.ndarray:
+        '''
+        Returns:
+            Logical input sources of a gate (bits, or `n_bits + gate`).
+        '''
+        return self.logic_indices[
+            self.logic_indptr[gate]:self.logic_indptr[gate + 1]
+        ]
+
+    def parameters(self) -> np.ndarray:
+        '''
+        Returns:
+            (G, 4) array of [y_min, y_max, k, n] per gate.
+        '''
+        return np.stack([self.y_min, self.y_max, self.k, self.n], axis=1)
+
+    def depths(self) -> np.ndarray:
+        '''
+        Returns:
+            (G,) topological depth of every gate: 0 for gates fed only by
+            input signals, otherwise one more than the deepest gate feeding it.
+        '''
+        depths = np.zeros(self.gate_count, dtype=np.int64)
+        for gate in range(self.gate_count):
+            upstream = self.gate_inputs(gate)
+            upstream = upstream[upstream >= self.signal_count] - \
+                self.signal_count
+            if len(upstream):
+                depths[gate] = depths[upstream].max() + 1
+        return depths
+
+    def fanout_cone(self, gates) -> np.ndarray:
+        '''
+        Args:
+            gates: Gate indices.
+
+        Returns:
+            Sorted indices of the given gates and every gate downstream of
+            them, i.e. every response that changes when their parameters do.
+        '''
+        affected = np.zeros(self.gate_count, dtype=bool)
+        affected[np.asarray(gates, dtype=np.int64)] = True
+        for gate in range(self.gate_count):
+            upstream = self.gate_inputs(gate)
+            upstream = upstream[upstream >= self.signal_count] - \
+                self.signal_count
+            if len(upstream) and affected[upstream].any():
+                affected[gate] = True
+        return np.flatnonzero(affected)
+
+    # ------------------------------- Conversion -------------------------------
+    @classmethod
+    def from_repressor(cls, output_repressor: Repressor) -> 'Circuit':
+        '''
+        Flattens a `Repressor` graph into arrays.
+
+        Logical inputs follow `Repressor.score_self`: the output gate sees one
+        truth table bit per declared input, a gate feeding input slot `i` of a
+        multi input gate sees that gate's bit `i`, and a single input gate
+        passes its bits through to the gates feeding it. Signals are switched
+        by the logical output of the gate they feed.
+
+        Args:
+            output_repressor: The repressor whose output is the circuit
+                output.
+
+        Returns:
+            The equivalent circuit.
+        '''
+        signals: List[Tuple[str, float, float]] = []
+        signal_ids: Dict[int, int] = {}
+        gates: List[Repressor] = []
+        gate_ids: Dict[int, int] = {}
+        gate_edges: List[List[Tuple[str, int]]] = []
+        gate_bits: Dict[int, List[int]] = {}
+
+        def assign_bits(repressor: Repressor, bits: List[int]):
+            if id(repressor) in gate_bits:
+                return
+            gate_bits[id(repressor)] = bits
+            for slot, biological_input in enumerate(
+                    repressor.biological_inputs):
+                if type(biological_input) is Repressor:
+                    if len(bits) > 1 and slot < len(bits):
+                        assign_bits(biological_input, [bits[slot]])
+                    else:
+                        assign_bits(biological_input, bits)
+
+        def visit(repressor: Repressor) -> int:
+            if id(repressor) in gate_ids:
+                return gate_ids[id(repressor)]
+            edges = []
+            for biological_input in repressor.biological_inputs:
+                if type(biological_input) is Repressor:
+                    edges.append(('gate', visit(biological_input)))
+                    continue
+                if type(biological_input) is InputSignal:
+                    key = id(biological_input)
+                    entry = (
+                        biological_input.label,
+                        biological_input.off_value,
+                        biological_input.on_value,
+                    )
+                elif type(biological_input) is tuple:
+                    # Anonymous (off, on) pairs are never shared.
+                    key = None
+                    entry = ('N/A', biological_input[0], biological_input[1])
+                else:
+                    raise RuntimeError(
+                        f'Unsupported biological input {biological_input!r}'
+                    )
+                if key is None or key not in signal_ids:
+                    signals.append(entry)
+                    if key is not None:
+                        signal_ids[key] = len(signals) - 1
+                    edges.append(('signal', len(signals) - 1))
+                else:
+                    edges.append(('signal', signal_ids[key]))
+            gate_ids[id(repressor)] = len(gates)
+            gates.append(repressor)
+            gate_edges.append(edges)
+            return gate_ids[id(repressor)]
+
+        n_bits = output_repressor.number_of_inputs
+        assign_bits(output_repressor, list(range(n_bits)))
+        visit(output_repressor)
+
+        signal_count = len(signals)
+        input_indptr = [0]
+        input_indices = []
+        logic_indptr = [0]
+        logic_indices = []
+        for repressor, edges in zip(gates, gate_edges):
+            for kind, index in edges:
+                input_indices.append(
+                    index if kind == 'signal' else signal_count + index
+                )
+            input_indptr.append(len(input_indices))
+            logic_indices.extend(gate_bits[id(repressor)])
+            logic_indptr.append(len(logic_indices))
+        return cls(
+            signal_labels=[signal[0] for signal in signals],
+            signal_levels=np.asarray(
+                [[signal[1], signal[2]] for signal in signals],
+                dtype=np.float64,
+            ).reshape(-1, 2),
+            signal_bits=np.full(signal_count, GATE_SELECTED),
+            y_min=[gate.y_min for gate in gates],
+            y_max=[gate.y_max for gate in gates],
+            k=[gate.k for gate in gates],
+            n=[gate.n for gate in gates],
+            number_of_inputs=[gate.number_of_inputs for gate in gates],
+            logic=[gate.logical_function.value for gate in gates],
+            input_indptr=input_indptr,
+            input_indices=input_indices,
+            logic_indptr=logic_indptr,
+            logic_indices=logic_indices,
+            n_bits=n_bits,
+            active_low=True,
+            dna_edits=[gate.dna_edits for gate in gates],
+            protein_edits=[gate.protein_edits for gate in gates],
+        )
+
+    def to_repressor(self) -> Repressor:
+        '''
+        Rebuilds the `Repressor` graph. Only circuits using the `Repressor`
+        conventions (signals switched by their gate, bits as assigned by
+        `from_repressor`) round trip exactly.
+
+        Returns:
+            The output repressor.
+        '''
+        signals = [
+            InputSignal(
+                label=label,
+                off_value=float(levels[0]),
+                on_value=float(levels[1]),
+            )
+            for label, levels in zip(self.signal_labels, self.signal_levels)
+        ]
+        repressors = []
+        for gate in range(self.gate_count):
+            repressor = Repressor(
+                n=float(self.n[gate]),
+                k=float(self.k[gate]),
+                y_min=float(self.y_min[gate]),
+                y_max=float(self.y_max[gate]),
+                number_of_inputs=int(self.number_of_inputs[gate]),
+            )
+            repressor.dna_edits = int(self.dna_edits[gate])
+            repressor.protein_edits = int(self.protein_edits[gate])
+            repressor.logical_function = LogicFunction(int(self.logic[gate]))
+            repressor.biological_inputs = [
+                signals[node] if node < self.signal_count
+                else repressors[node - self.signal_count]
+                for node in self.gate_inputs(gate)
+            ]
+            repressors.append(repressor)
+        return repressors[self.output]
+
+    def copy(self) -> 'Circuit':
+        '''
+        Copies the mutable per gate state. Wiring arrays are read only and
+        shared, so copies are cheap.
+
+        Returns:
+            An independent copy of the circuit.
+        '''
+        duplicate = Circuit.__new__(Circuit)
+        duplicate.__dict__.update(self.__dict__)
+        for attribute in ('signal_levels', 'y_min', 'y_max', 'k', 'n',
+                          'dna_edits', 'protein_edits'):
+            setattr(duplicate, attribute, getattr(self, attribute).copy())
+        duplicate.signal_labels = list(self.signal_labels)
+        duplicate.gate_labels = list(self.gate_labels)
+        return duplicate
+
+    # ------------------------------- Evaluation -------------------------------
+    def truth_table_bits(self) -> np.ndarray:
+        '''
+        Returns:
+            (2^n_bits, n_bits) boolean table in `itertools.product` order, the
+            first bit being the most significant.
+        '''
+        rows = np.arange(2 ** self.n_bits)
+        shifts = np.arange(self.n_bits - 1, -1, -1)
+        return ((rows[:, None] >> shifts) & 1).astype(bool)
+
+    def logic_outputs(self, bits: np.ndarray = None) -> np.ndarray:
+        '''
+        Evaluates the logical output of every gate.
+
+        Args:
+            bits: (R, n_bits) boolean input rows. Defaults to the full truth
+                table.
+
+        Returns:
+            (R, G) boolean array.
+        '''
+        if bits is None:
+            bits = self.truth_table_bits()
+        outputs = np.zeros((bits.shape[0], self.gate_count), dtype=bool)
+        for gate in range(self.gate_count):
+            sources = [
+                bits[:, source] if source < self.n_bits
+                else outputs[:, source - self.n_bits]
+                for source in self.gate_logic_inputs(gate)
+            ]
+            outputs[:, gate] = _apply_logic(int(self.logic[gate]), sources)
+        return outputs
+
+    def simulate(
+            self,
+            y_min: np.ndarray = None,
+            y_max: np.ndarray = None,
+            k: np.ndarray = None,
+            n: np.ndarray = None,
+            signal_levels: np.ndarray = None,
+            bits: np.ndarray = None,
+            responses: np.ndarray = None,
+            gates: np.ndarray = None,
+    ) -> np.ndarray:
+        '''
+        Computes the steady state response of every gate for every truth
+        table row, optionally for many parameter sets at once.
+
+        Parameters default to the circuit's own. Passing (P, G) arrays (or
+        (P, S, 2) signal levels) evaluates P parameter sets in one go.
+
+        When only some gates' parameters change, pass the previous
+        `responses` along with the `gates` to recompute (e.g. a
+        `fanout_cone`); every other gate keeps its previous response.
+
+        Args:
+            y_min: Minimum response per gate.
+            y_max: Maximum response per gate.
+            k: Response threshold per gate.
+            n: Hill coefficient per gate.
+            signal_levels: [off, on] level per input signal.
+            bits: (R, n_bits) boolean input rows. Defaults to the full truth
+                table.
+            responses: (R, G) or (P, R, G) previously computed responses.
+            gates: Sorted gates to recompute. Defaults to all of them.
+
+        Returns:
+            (P, R, G) responses, or (R, G) if nothing was batched.
+        '''
+        y_min, y_max, k, n, signal_levels, batched = self._batch_parameters(
+            y_min, y_max, k, n, signal_levels,
+        )
+        if bits is None:
+            bits = self.truth_table_bits()
+        logic = self.logic_outputs(bits)
+        batch_size = y_min.shape[0]
+        if responses is not None and np.ndim(responses) == 3 and \
+                batch_size == 1:
+            batch_size = len(responses)
+            y_min, y_max, k, n = (
+                np.broadcast_to(array, (batch_size, self.gate_count))
+                for array in (y_min, y_max, k, n)
+            )
+            signal_levels = np.broadcast_to(
+                signal_levels,
+                (batch_size, self.signal_count, 2),
+            )
+        row_count = bits.shape[0]
+        shape = (batch_size, row_count, self.gate_count)
+        if responses is None:
+            responses = np.empty(shape)
+        else:
+            responses = np.asarray(responses, dtype=np.float64)
+            batched = batched or responses.ndim == 3
+            responses = np.broadcast_to(responses, shape).copy()
+        if gates is None:
+            gates = range(self.gate_count)
+        for gate in gates:
+            x = self._gate_input(gate, responses, logic, bits, signal_levels)
+            responses[:, :, gate] = response_function(
+                x,
+                y_min[:, gate][:, None],
+                y_max[:, gate][:, None],
+                k[:, gate][:, None],
+                n[:, gate][:, None],
+                out=x,
+            )
+        return responses if batched else responses[0]
+
+    def score(self, **parameters) -> float:
+        '''
+        Scores the circuit the same way `Repressor.score_self` does: the log
+        ratio of the highest response among rows expected high to the lowest
+        response among rows expected low.
+
+        Args:
+            parameters: Optional overrides, as for `simulate`.
+
+        Returns:
+            The score, or an array of scores if parameters were batched.
+        '''
+        if not parameters and 2 ** self.n_bits > STREAMING_ROWS:
+            return self.score_streaming()
+        responses = self.simulate(**parameters)
+        logic = self.logic_outputs()[:, self.output]
+        return score_responses(responses[..., self.output], logic,
+                               self.active_low)
+
+    def score_streaming(
+            self,
+            chunk_size: int = 4096,
+            n_jobs: int = 1,
+    ) -> float:
+        '''
+        Scores the circuit in bounded memory, for wide truth tables.
+
+        Rows are streamed in Gray code order, in aligned chunks. Within a
+        chunk only the low input bits change, so gates that don't depend on
+        them are evaluated once for the chunk and reused; only the rest are
+        evaluated row by row. The running highest expected-high and lowest
+        expected-low responses are folded chunk by chunk.
+
+        Args:
+            chunk_size: Rows per chunk, rounded down to a power of two.
+            n_jobs: Worker processes to split the chunks across. -1 uses
+                every core.
+
+        Returns:
+            The same score as `score`.
+        '''
+        chunk_bits = min(max(int(chunk_size), 1).bit_length() - 1,
+                         self.n_bits)
+        chunk_count = 2 ** (self.n_bits - chunk_bits)
+        if n_jobs == -1:
+            n_jobs = os.cpu_count() or 1
+        if n_jobs <= 1 or chunk_count == 1:
+            high, low = _fold_chunks(self, range(chunk_count), chunk_bits)
+        else:
+            groups = np.array_split(np.arange(chunk_count),
+                                    min(n_jobs, chunk_count))
+            with ProcessPoolExecutor(max_workers=len(groups)) as pool:
+                partials = list(pool.map(
+                    _fold_chunks,
+                    [self] * len(groups),
+                    groups,
+                    [chunk_bits] * len(groups),
+                ))
+            high = max(partial[0] for partial in partials)
+            low = min(partial[1] for partial in partials)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.log10(np.float64(high) / low)
+
+    def bit_dependencies(self) -> np.ndarray:
+        '''
+        Returns:
+            (G, n_bits) boolean array, True where a gate's response depends on
+            a truth table bit, directly through a signal or through the
+            logical output that selects one.
+        '''
+        logic = np.zeros((self.gate_count, self.n_bits), dtype=bool)
+        response = np.zeros((self.gate_count, self.n_bits), dtype=bool)
+        for gate in range(self.gate_count):
+            for source in self.gate_logic_inputs(gate):
+                if source < self.n_bits:
+                    logic[gate, source] = True
+                else:
+                    logic[gate] |= logic[source - self.n_bits]
+            for node in self.gate_inputs(gate):
+                if node >= self.signal_count:
+                    response[gate] |= response[node - self.signal_count]
+                elif self.signal_bits[node] == GATE_SELECTED:
+                    response[gate] |= logic[gate]
+                else:
+                    response[gate, self.signal_bits[node]] = True
+        return response
+
+    def input_levels(self, bits: np.ndarray = None) -> np.ndarray:
+        '''
+        Args:
+            bits: (R, n_bits) boolean input rows. Defaults to the full truth
+                table.
+
+        Returns:
+            (R, G) total biological input arriving at every gate, for the
+            circuit's own parameters.
+        '''
+        if bits is None:
+            bits = self.truth_table_bits()
+        responses = self.simulate(bits=bits)[None]
+        logic = self.logic_outputs(bits)
+        return np.stack([
+            self._gate_input(
+                gate,
+                responses,
+                logic,
+                bits,
+                self.signal_levels[None],
+            )[0]
+            for gate in range(self.gate_count)
+        ], axis=1)
+
+    def signal_inputs(self, bits: np.ndarray = None) -> np.ndarray:
+        '''
+        Args:
+            bits: (R, n_bits) boolean input rows. Defaults to the full truth
+                table.
+
+        Returns:
+            (R, G) input level every gate receives straight from input
+            signals, leaving out what upstream gates contribute.
+        '''
+        if bits is None:
+            bits = self.truth_table_bits()
+        responses = np.zeros((1, bits.shape[0], self.gate_count))
+        logic = self.logic_outputs(bits)
+        return np.stack([
+            self._gate_input(
+                gate,
+                responses,
+                logic,
+                bits,
+                self.signal_levels[None],
+            )[0]
+            for gate in range(self.gate_count)
+        ], axis=1)
+
+    def _gate_input(self, gate, responses, logic, bits, signal_levels):
+        '''
+        Sums a gate's biological inputs: (P, R) from (P, R, G) responses and
+        (P, S, 2) signal levels.
+        '''
+        x = np.zeros(responses.shape[:2])
+        for node in self.gate_inputs(gate):
+            if node >= self.signal_count:
+                x += responses[:, :, node - self.signal_count]
+                continue
+            bit = self.signal_bits[node]
+            selector = logic[:, gate] if bit == GATE_SELECTED \
+                else bits[:, bit]
+            x += np.where(
+                selector[None, :],
+                signal_levels[:, node, 1][:, None],
+                signal_levels[:, node, 0][:, None],
+            )
+        return x
+
+    def _batch_parameters(self, y_min, y_max, k, n, signal_levels):
+        arrays = []
+        batched = False
+        for supplied, own in ((y_min, self.y_min), (y_max, self.y_max),
+                              (k, self.k), (n, self.n)):
+            array = own if supplied is None \
+                else np.asarray(supplied, dtype=np.float64)
+            batched = batched or array.ndim == 2
+            arrays.append(array)
+        levels = self.signal_levels if signal_levels is None \
+            else np.asarray(signal_levels, dtype=np.float64)
+        batched = batched or levels.ndim == 3
+        batch_size = max(
+            [array.shape[0] for array in arrays if array.ndim == 2] +
+            ([levels.shape[0]] if levels.ndim == 3 else []) + [1]
+        )
+        arrays = [
+            np.broadcast_to(np.atleast_2d(array), (batch_size, self.gate_count))
+            for array in arrays
+        ]
+        if levels.ndim == 2:
+            levels = levels[None]
+        levels = np.broadcast_to(
+            levels.reshape(-1, self.signal_count, 2),
+            (batch_size, self.signal_count, 2),
+        )
+        return arrays[0], arrays[1], arrays[2], arrays[3], levels, batched
+
+    def _validate(self):
+        gate_count = self.gate_count
+        for name in ('y_max', 'k', 'n'):
+            if getattr(self, name).shape != (gate_count,):
+                raise RuntimeError(f'{name} must have one entry per gate.')
+        if len(self.input_indptr) != gate_count + 1 or \
+                len(self.logic_indptr) != gate_count + 1:
+            raise RuntimeError('CSR index pointers must have G + 1 entries.')
+        if self.signal_levels.shape != (self.signal_count, 2):
+            raise RuntimeError('Signal levels must be an (S, 2) array.')
+        for gate in range(gate_count):
+            inputs = self.gate_inputs(gate)
+            if np.any(inputs >= self.signal_count + gate):
+                raise RuntimeError(
+                    'Gates must be in topological order; gate '
+                    f'{gate} reads from a later gate.'
+                )
+            sources = self.gate_logic_inputs(gate)
+            if np.any(sources >= self.n_bits + gate):
+                raise RuntimeError(
+                    f'Gate {gate} takes its logic from a later gate.'
+                )
+
+
+# ------------------------ Publicly Available Functions ------------------------
+def score_responses(
+        responses: np.ndarray,
+        logic: np.ndarray,
+        active_low: bool = True,
+) -> np.ndarray:
+    '''
+    Reduces output responses over the truth table to a score.
+
+    Args:
+        responses: (..., R) output responses.
+        logic: (R,) logical output per row.
+        active_low: Whether a true logical output means a low response.
+
+    Returns:
+        log10(max response of rows expected high / min response of rows
+        expected low), per leading index.
+    '''
+    expected_low = logic if active_low else ~logic
+    high_rows = responses[..., ~expected_low]
+    low_rows = responses[..., expected_low]
+    high = high_rows.max(axis=-1) if high_rows.shape[-1] \
+        else np.full(responses.shape[:-1], float('-inf'))
+    low = low_rows.min(axis=-1) if low_rows.shape[-1] \
+        else np.full(responses.shape[:-1], float('inf'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log10(high / low)
+
+
+# ----------------------------- Private Functions ------------------------------
+def _gray_code_bits(start: int, stop: int, n_bits: int) -> np.ndarray:
+    '''
+    Truth table rows for Gray code positions [start, stop), as booleans with
+    the first bit most significant.
+    '''
+    positions = np.arange(start, stop, dtype=np.int64)
+    codes = positions ^ (positions >> 1)
+    shifts = np.arange(n_bits - 1, -1, -1)
+    return ((codes[:, None] >> shifts) & 1).astype(bool)
+
+
+def _fold_chunks(circuit: 'Circuit', chunks, chunk_bits: int):
+    '''
+    Streams the given chunks of the Gray code ordered truth table.
+
+    Returns:
+        (highest response among rows expected high, lowest among rows expected
+        low).
+    '''
+    size = 2 ** chunk_bits
+    # Bits that change inside an aligned Gray code chunk are its lowest ones,
+    # the last columns.
+    varying = circuit.bit_dependencies()[:, circuit.n_bits - chunk_bits:]
+    varying_gates = np.flatnonzero(varying.any(axis=1))
+    high = float('-inf')
+    low = float('inf')
+    for chunk in chunks:
+        bits = _gray_code_bits(chunk * size, (chunk + 1) * size,
+                               circuit.n_bits)
+        with np.errstate(all='ignore'):
+            constant = circuit.simulate(bits=bits[:1])
+            responses = circuit.simulate(
+                bits=bits,
+                responses=np.broadcast_to(constant, (size,
+                                                     circuit.gate_count)),
+                gates=varying_gates,
+            )
+        logic = circuit.logic_outputs(bits)[:, circuit.output]
+        expected_low = logic if circuit.active_low else ~logic
+        output = responses[:, circuit.output]
+        if (~expected_low).any():
+            high = max(high, output[~expected_low].max())
+        if expected_low.any():
+            low = min(low, output[expected_low].min())
+    return high, low
+
+
+def _frozen(values, dtype) -> np.ndarray:
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+def _apply_logic(logic: int, sources: List[np.ndarray]) -> np.ndarray:
+    function = LogicFunction(logic)
+    if function == LogicFunction.INITIAL:
+        raise RuntimeError('Logical Function has not been set.')
+    if function == LogicFunction.NOT:
+        if len(sources) != 1:
+            raise RuntimeError('Cannot NOT multiple inputs.')
+        return ~sources[0]
+    if len(sources) != 2:
+        raise RuntimeError(
+            'Need two binary inputs to perform logical operations'
+        )
+    a, b = sources
+    if function == LogicFunction.AND:
+        return a & b
+    if function == LogicFunction.OR:
+        return a | b
+    if function == LogicFunction.XOR:
+        return a ^ b
+    if function == LogicFunction.NAND:
+        return ~(a & b)
+    if function == LogicFunction.NOR:
+        return ~(a | b)
+    return ~(a ^ b)
@@ -0,0 +1,359 @@
+"""
+backend.datastructures.motif_scanner
+
+Screening of parts and assembled circuits for forbidden sites.
+
+Every motif (restriction sites, homopolymer runs, anything we can't order)
+is expanded from its IUPAC letters into concrete sequences, together with
+their reverse complements, and all of them are compiled into a single
+Aho-Corasick automaton. The automaton is stored as a flat deterministic
+transition table, so a sequence is scanned in one pass whatever the number
+of motifs.
+
+Parts repeat across every candidate design, so `MotifScanner` caches the hits
+of each distinct part sequence. Screening an `Assembly` then only takes the
+cached hits shifted to each part's offset, plus a scan of the few bases
+around every junction for sites created by the assembly itself.
+
+W.R. Jackson 2020
+"""
+import itertools
+from collections import deque
+from dataclasses import dataclass
+from typing import (
+    Dict,
+    Hashable,
+    List,
+    Tuple,
+    Union,
+)
+
+from backend.datastructures.assembly import (
+    Assembly,
+    part_window,
+)
+from backend.datastructures.sequence_store import SequenceHandle
+
+IUPAC = {
+    'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T',
+    'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC',
+    'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT',
+}
+# Recognition sites of the type IIS enzymes used for Golden Gate assembly.
+TYPE_IIS_SITES = {
+    'BsaI': 'GGTCTC',
+    'BsmBI': 'CGTCTC',
+    'BbsI': 'GAAGAC',
+    'SapI': 'GCTCTTC',
+    'PaqCI': 'CACCTGC',
+}
+# Largest number of concrete sequences a single motif may expand into.
+MAX_EXPANSIONS = 1 << 16
+
+_COMPLEMENT = str.maketrans('ACGT', 'TGCA')
+# Bytes -> symbol: A, C, G, T (either case) and everything else, which no
+# motif matches.
+_SYMBOLS = 5
+_OTHER = 4
+_CODES = bytes(
+    'ACGTacgt'.find(chr(byte)) % 4 if chr(byte) in 'ACGTacgt' else _OTHER
+    for byte in range(256)
+)
+
+
+@dataclass(frozen=True)
+class MotifHit:
+    '''
+    Attributes:
+        motif: Name of the motif found.
+        start: Zero based start on the scanned sequence's forward strand.
+        end: Exclusive end. For sites across the origin of a circular
+            assembly this runs past its length.
+        strand: 1 or -1 for the strand the motif reads on, 0 for motifs
+            that are their own reverse complement.
+    '''
+    motif: str
+    start: int
+    end: int
+    strand: int
+
+
+class MotifScanner:
+    '''
+    Usage:
+        scanner = MotifScanner(TYPE_IIS_SITES)
+        scanner.scan_parts(parse_output_signals(outputs_fp))
+        hits = scanner.scan_assembly(assemble_circuit(circuit, gates, inputs))
+    '''
+
+    def __init__(
+            self,
+            motifs: Dict[str, str],
+            reverse_complement: bool = True,
+    ):
+        '''
+        Args:
+            motifs: Motif name to IUPAC sequence.
+            reverse_complement: Whether to also look for every motif on the
+                reverse strand.
+        '''
+        self.motifs = dict(motifs)
+        patterns: Dict[str, List[Tuple[str, int]]] = {}
+        for name, motif in self.motifs.items():
+            forward = _expand(name, motif)
+            reverse = {
+                pattern.translate(_COMPLEMENT)[::-1] for pattern in forward
+            }
+            palindromic = reverse == forward
+            for pattern in forward:
+                patterns.setdefault(pattern, []).append(
+                    (name, 0 if palindromic else 1)
+                )
+            if reverse_complement and not palindromic:
+                for pattern in reverse:
+                    patterns.setdefault(pattern, []).append((name, -1))
+        self.max_length = max(
+            (len(pattern) for pattern in patterns), default=0
+        )
+        self._transitions, self._outputs = _compile(patterns)
+        self._cache: Dict[Hashable, Tuple[MotifHit, ...]] = {}
+        self._edges: Dict[Hashable, Tuple[str, str, bool]] = {}
+
+    # -------------------------------- Scanning --------------------------------
+    def scan(self, sequence: Union[str, SequenceHandle]) -> List[MotifHit]:
+        '''
+        Args:
+            sequence: The sequence to scan, in one pass.
+
+        Returns:
+            Every hit, ordered by end position.
+        '''
+        if isinstance(sequence, SequenceHandle):
+            sequence = sequence.decode()
+        transitions = self._transitions
+        outputs = self._outputs
+        hits = []
+        state = 0
+        for position, code in enumerate(
+                sequence.encode('ascii').translate(_CODES)):
+            state = transitions[state + code]
+            found = outputs[state // _SYMBOLS]
+            if found:
+                end = position + 1
+                hits.extend(
+                    MotifHit(name, end - length, end, strand)
+                    for name, length, strand in found
+                )
+        return hits
+
+    def scan_part(
+            self,
+            sequence: Union[str, SequenceHandle],
+    ) -> Tuple[MotifHit, ...]:
+        '''
+        Scans a part, or returns the cached hits of an identical one.
+        '''
+        key = _cache_key(sequence)
+        hits = self._cache.get(key)
+        if hits is None:
+            hits = tuple(self.scan(sequence))
+            self._cache[key] = hits
+        return hits
+
+    def scan_parts(
+            self,
+            parts: Dict[str, Union[str, SequenceHandle]],
+    ) -> Dict[str, Tuple[MotifHit, ...]]:
+        '''
+        Args:
+            parts: Part name to sequence, e.g. from `parse_output_signals`.
+
+        Returns:
+            Part name to hits, for the parts that have any.
+        '''
+        found = {}
+        for name, sequence in parts.items():
+            if sequence is None:
+                continue
+            hits = self.scan_part(sequence)
+            if hits:
+                found[name] = hits
+        return found
+
+    def scan_assembly(self, assembly: Assembly) -> List[MotifHit]:
+        '''
+        Screens an assembly from cached part hits and its junctions only.
+
+        Args:
+            assembly: The assembly. For circular ones sites across the
+                origin are found as well.
+
+        Returns:
+            Every hit on the assembly's forward strand coordinates, sorted.
+        '''
+        hits = set()
+        segments = assembly.segments
+        for sequence, offset, strand in segments:
+            length = len(sequence)
+            for hit in self.scan_part(sequence):
+                if strand > 0:
+                    hits.add(MotifHit(hit.motif, offset + hit.start,
+                                      offset + hit.end, hit.strand))
+                else:
+                    hits.add(MotifHit(hit.motif, offset + length - hit.end,
+                                      offset + length - hit.start,
+                                      -hit.strand))
+        reach = self.max_length - 1
+        total = len(assembly)
+        if reach <= 0 or not total:
+            return sorted(hits, key=_hit_order)
+        edges = [
+            self._part_edges(sequence, strand, reach)
+            for sequence, _, strand in segments
+        ]
+
+        def scan_junction(index: int, boundary: int):
+            # `reach` bases either side of the start of segment `index`.
+            left = []
+            length = 0
+            for head, tail, whole in reversed(edges[:index]):
+                left.append(tail)
+                length += len(tail)
+                if length >= reach or not whole:
+                    break
+            right = []
+            length = 0
+            for head, tail, whole in edges[index:]:
+                right.append(head)
+                length += len(head)
+                if length >= reach or not whole:
+                    break
+            left = ''.join(reversed(left))[-reach:]
+            start = boundary - len(left)
+            for hit in self.scan(left + ''.join(right)[:reach]):
+                if hit.start < len(left) < hit.end:
+                    hits.add(MotifHit(hit.motif, hit.start + start,
+                                      hit.end + start, hit.strand))
+
+        for index in range(1, len(segments)):
+            scan_junction(index, segments[index][1])
+        if assembly.circular:
+            # Back into the first segments, from the end of the assembly.
+            edges = edges + edges
+            scan_junction(len(segments), total)
+        return sorted(hits, key=_hit_order)
+
+    def _part_edges(
+            self,
+            sequence: Union[str, SequenceHandle],
+            strand: int,
+            reach: int,
+    ) -> Tuple[str, str, bool]:
+        '''
+        Returns:
+            The first and last `reach` bases of a part as placed, and whether
+            that is the whole part. Cached alongside the part's hits.
+        '''
+        key = (_cache_key(sequence), strand)
+        edges = self._edges.get(key)
+        if edges is None:
+            length = len(sequence)
+            if length <= reach:
+                bases = part_window(sequence, strand, 0, length)
+                edges = (bases, bases, True)
+            else:
+                edges = (
+                    part_window(sequence, strand, 0, reach),
+                    part_window(sequence, strand, length - reach, length),
+                    False,
+                )
+            self._edges[key] = edges
+        return edges
+
+
+# ----------------------------- Private Functions ------------------------------
+def _expand(name: str, motif: str) -> set:
+    '''
+    Returns:
+        Every concrete sequence an IUPAC motif stands for.
+    '''
+    motif = motif.upper()
+    unknown = set(motif) - set(IUPAC)
+    if unknown or not motif:
+        raise RuntimeError(f'Motif {name} is not an IUPAC sequence: {motif}')
+    expansions = 1
+    for base in motif:
+        expansions *= len(IUPAC[base])
+    if expansions > MAX_EXPANSIONS:
+        raise RuntimeError(
+            f'Motif {name} expands into {expansions} sequences, more than '
+            f'{MAX_EXPANSIONS}.'
+        )
+    return {
+        ''.join(bases)
+        for bases in itertools.product(*(IUPAC[base] for base in motif))
+    }
+
+
+def _compile(patterns: Dict[str, List[Tuple[str, int]]]):
+    '''
+    Builds the Aho-Corasick automaton over concrete ACGT patterns.
+
+    Returns:
+        (transitions, outputs). `transitions` is flat and pre-multiplied:
+        from state s (stored as s * 5) on symbol c the next state is
+        `transitions[s * 5 + c]`, again multiplied by 5. `outputs[s]` holds
+        the (motif, length, strand) of everything ending in state s,
+        including through suffix links, or None.
+    '''
+    goto = [[-1] * _SYMBOLS]
+    matches = [[]]
+    for pattern, owners in patterns.items():
+        state = 0
+        for base in pattern:
+            code = 'ACGT'.index(base)
+            if goto[state][code] < 0:
+                goto[state][code] = len(goto)
+                goto.append([-1] * _SYMBOLS)
+                matches.append([])
+            state = goto[state][code]
+        matches[state].extend(
+            (name, len(pattern), strand) for name, strand in owners
+        )
+    # Breadth first: fill in missing transitions from the failure links so
+    # the automaton never has to backtrack.
+    failure = [0] * len(goto)
+    queue = deque()
+    for code in range(_SYMBOLS):
+        child = goto[0][code]
+        if child < 0:
+            goto[0][code] = 0
+        else:
+            queue.append(child)
+    while queue:
+        state = queue.popleft()
+        matches[state].extend(matches[failure[state]])
+        for code in range(_SYMBOLS):
+            child = goto[state][code]
+            if child < 0:
+                goto[state][code] = goto[failure[state]][code]
+            else:
+                failure[child] = goto[failure[state]][code]
+                queue.append(child)
+    # Nothing spans a base outside ACGT.
+    for row in goto:
+        row[_OTHER] = 0
+    transitions = [target * _SYMBOLS for row in goto for target in row]
+    outputs = [tuple(found) or None for found in matches]
+    return transitions, outputs
+
+
+def _cache_key(sequence: Union[str, SequenceHandle]) -> Hashable:
+    if isinstance(sequence, SequenceHandle):
+        return (sequence.store, sequence.sequence_id, sequence.start,
+                sequence.stop)
+    return sequence
+
+
+def _hit_order(hit: MotifHit):
+    return hit.start, hit.end, hit.motif, hit.strand
@@ -9,13 +9,18 @@ from dataclasses import dataclass
 from enum import Enum
 import itertools
 from typing import (
+    TYPE_CHECKING,
     List,
     Tuple,
     Union,
 )
 
 import numpy as np
-import pandas as pd
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+from backend.datastructures.sequence_store import SequenceHandle
 
 
 @dataclass
@@ -26,11 +31,13 @@ class InputSignal:
         on_value: Value when signal is 'on'
         off_value: Value when signal is 'off'
         binary_value: The (4-bit?) binary value of the input signal.
+        sequence: The promoter DNA sequence, if known.
     '''
     label: str
     on_value: float
     off_value: float
     binary_value: int = None
+    sequence: Union[str, SequenceHandle] = None
 
     def __len__(self):
         return 1
@@ -115,24 +122,65 @@ class Repressor:
         Returns:
             The biological output of the circuit
         '''
-        current_x = 0
-        signal_index = 1 if self.get_logical_output() else 0
-        for index, input_signal in enumerate(self.biological_inputs):
-            if type(input_signal) is Repressor:
-                current_x += input_signal.calculate_response_function()
-            if type(input_signal) is tuple:
-                current_x += input_signal[signal_index]
-            if type(input_signal) is InputSignal:
-                if signal_index:
-                    current_x += input_signal.on_value
-                else:
-                    current_x += input_signal.off_value
+        current_x = sum(self.resolve_biological_inputs())
         self.biological_output = self.y_min + (
                 (self.y_max - self.y_min) /
                 (1.0 + (current_x / self.k) ** self.n)
         )
         return self.biological_output
 
+    def response(
+            self,
+            x: np.ndarray,
+            dtype: np.dtype = None,
+            out: np.ndarray = None,
+    ) -> np.ndarray:
+        '''
+        Evaluates the response function over an array of input levels,
+        without touching the repressor's state.
+
+        Args:
+            x: Input levels, any shape.
+            dtype: Output dtype, e.g. np.float32 to halve memory. Defaults to
+                float64.
+            out: Preallocated output of x's shape, reused across calls.
+
+        Returns:
+            The response at every input level.
+        '''
+        return response_function(
+            x,
+            self.y_min,
+            self.y_max,
+            self.k,
+            self.n,
+            dtype=dtype,
+            out=out,
+        )
+
+    def resolve_biological_inputs(self) -> List[float]:
+        '''
+        Resolves every biological input into the signal level it contributes
+        under the current logical state. Upstream repressors are evaluated
+        recursively.
+
+        Returns:
+            One float per biological input, in order.
+        '''
+        signal_index = 1 if self.get_logical_output() else 0
+        resolved = []
+        for input_signal in self.biological_inputs:
+            if type(input_signal) is Repressor:
+                resolved.append(input_signal.calculate_response_function())
+            elif type(input_signal) is tuple:
+                resolved.append(input_signal[signal_index])
+            elif type(input_signal) is InputSignal:
+                if signal_index:
+                    resolved.append(input_signal.on_value)
+                else:
+                    resolved.append(input_signal.off_value)
+        return resolved
+
     def set_biological_inputs(
             self,
             biological_inputs: List[
@@ -315,41 +363,183 @@ class Repressor:
     def score_self(self, score_table: bool = False):
         '''
         Function to score efficacy of a gate.
+
+        Args:
+            score_table: Whether to print the per row score table.
+
+        Returns:
+            log10 of the highest OFF response over the lowest ON response.
+        '''
+        table = self.build_score_table()
+        if score_table:
+            print(score_table_to_dataframe(table))
+        on_responses = table['response'][table['on']]
+        off_responses = table['response'][~table['on']]
+        low_on = on_responses.min() if len(on_responses) else float('inf')
+        high_off = off_responses.max() if len(off_responses) \
+            else float('-inf')
+        return np.log10(high_off / low_on)
+
+    def build_score_table(
+            self,
+            as_dataframe: bool = False,
+    ) -> Union[np.ndarray, 'pd.DataFrame']:
         '''
-        df = pd.DataFrame(columns=[
-            'logical_input',
-            'biological_input',
-            'response'
+        Evaluates every row of the truth table into preallocated columns.
+
+        Args:
+            as_dataframe: Whether to convert the result into a DataFrame.
+
+        Returns:
+            A structured array with one record per row of the truth table:
+                logical_input: The logical input bits, one per input.
+                biological_input: The signal level arriving on each
+                    biological input.
+                response: The response of this repressor.
+                on: Whether the row is classified as ON.
+        '''
+        row_count = 2 ** self.number_of_inputs
+        slot_count = max(len(self.biological_inputs), 1)
+        table = np.zeros(row_count, dtype=[
+            ('logical_input', np.int64, (self.number_of_inputs,)),
+            ('biological_input', np.float64, (slot_count,)),
+            ('response', np.float64),
+            ('on', np.bool_),
         ])
-        logical_inputs = list(itertools.product(
+        logical_inputs = itertools.product(
             [0b0000, 0b1111],
             repeat=self.number_of_inputs
-        ))
-        high_off = float('-inf')
-        low_on = float('inf')
-        for logical_input in logical_inputs:
+        )
+        for row, logical_input in enumerate(logical_inputs):
             self.set_logical_inputs([x for x in logical_input])
             if self.number_of_inputs > 1:
                 for index, biological_input in enumerate(self.biological_inputs):
                     if type(biological_input) == Repressor:
                         biological_input.set_logical_inputs([logical_input[index]])
-            response = self.calculate_response_function()
+            resolved = self.resolve_biological_inputs()
+            response = self.y_min + (
+                    (self.y_max - self.y_min) /
+                    (1.0 + (sum(resolved) / self.k) ** self.n)
+            )
+            self.biological_output = response
+            table['logical_input'][row] = logical_input
+            table['biological_input'][row, :len(resolved)] = resolved
+            table['response'][row] = response
             # If this is True, our signal is high. If it is False, our signal
             # is low. We use this to get the lowest one and highest off
             # respectively.
-            if self.get_logical_output():
-                if response < low_on:
-                    low_on = response
-            if not self.get_logical_output():
-                if response > high_off:
-                    high_off = response
-            if score_table:
-                df_dict = {
-                    'logical_input': logical_input,
-                    'biological_input': str(self.get_input_signals()),
-                    'response': self.calculate_response_function()
-                }
-                df = df.append(df_dict, ignore_index=True)
-        if score_table:
-            print(df)
-        return np.log10(high_off / low_on)
+            table['on'][row] = bool(self.get_logical_output())
+        if as_dataframe:
+            return score_table_to_dataframe(table)
+        return table
+
+
+def score_table_to_dataframe(table: np.ndarray) -> 'pd.DataFrame':
+    '''
+    Flattens a score table from `Repressor.build_score_table` into a
+    DataFrame, with one column per logical and biological input.
+
+    Args:
+        table: The structured score table.
+
+    Returns:
+        The equivalent DataFrame.
+    '''
+    # pandas is only needed here, so it isn't paid for on import.
+    import pandas as pd
+
+    columns = {}
+    for field in ('logical_input', 'biological_input'):
+        values = table[field]
+        for index in range(values.shape[1]):
+            columns[f'{field}_{index}'] = values[:, index]
+    columns['response'] = table['response']
+    columns['on'] = table['on']
+    return pd.DataFrame(columns)
+
+
+def response_function(
+        x: np.ndarray,
+        y_min: np.ndarray,
+        y_max: np.ndarray,
+        k: np.ndarray,
+        n: np.ndarray,
+        dtype: np.dtype = None,
+        out: np.ndarray = None,
+) -> np.ndarray:
+    '''
+    Array form of `Repressor.calculate_response_function`. Input levels and
+    parameters broadcast against each other, so e.g. (L,) levels against
+    (P, 1) parameters give (P, L) dose-response curves.
+
+    Args:
+        x: Input levels.
+        y_min, y_max, k, n: Response function parameters.
+        dtype: Output (and working) dtype. Defaults to `out`'s dtype, or
+            float64.
+        out: Preallocated output with the broadcast shape. The computation
+            runs in place in it, so repeated sweeps don't allocate.
+
+    Returns:
+        The responses, `out` if it was passed in. A scalar when every
+        argument is.
+    '''
+    if out is None and dtype is None and np.isscalar(x) and \
+            np.isscalar(y_min) and np.isscalar(y_max) and np.isscalar(k) and \
+            np.isscalar(n):
+        # Scalar fast path, for the one level at a time callers.
+        y_min, y_max, k, n = map(np.float64, (y_min, y_max, k, n))
+        return y_min + ((y_max - y_min) / (1.0 + (x / k) ** n))
+    # np.broadcast rather than np.broadcast_shapes, which needs numpy 1.20.
+    shape = np.broadcast(x, y_min, y_max, k, n).shape
+    scalar = out is None and shape == ()
+    if out is None:
+        out = np.empty(shape, dtype=dtype if dtype is not None else np.float64)
+    elif out.shape != shape:
+        raise RuntimeError(
+            f'Output buffer has shape {out.shape}, expected {shape}.'
+        )
+    elif dtype is not None and out.dtype != dtype:
+        raise RuntimeError(f'Output buffer is {out.dtype}, not {dtype}.')
+    working = out.dtype
+    y_min = np.asarray(y_min, dtype=working)
+    np.divide(np.asarray(x, dtype=working), np.asarray(k, dtype=working),
+              out=out)
+    np.power(out, np.asarray(n, dtype=working), out=out)
+    np.add(out, 1.0, out=out)
+    np.divide(np.asarray(y_max, dtype=working) - y_min, out, out=out)
+    np.add(out, y_min, out=out)
+    return out[()] if scalar else out
+
+
+def dose_response_curves(
+        parameters: np.ndarray,
+        levels: np.ndarray,
+        dtype: np.dtype = None,
+        out: np.ndarray = None,
+) -> np.ndarray:
+    '''
+    Sweeps many gates over the same input levels, e.g. the whole library for
+    a QC report.
+
+    Args:
+        parameters: (P, 4) [y_min, y_max, k, n] per gate, as from
+            `Circuit.parameters`.
+        levels: (L,) input levels.
+        dtype: Output dtype.
+        out: Preallocated (P, L) output.
+
+    Returns:
+        (P, L) responses.
+    '''
+    parameters = np.asarray(parameters)
+    y_min, y_max, k, n = (parameters[:, index, None] for index in range(4))
+    return response_function(
+        np.asarray(levels)[None, :],
+        y_min,
+        y_max,
+        k,
+        n,
+        dtype=dtype,
+        out=out,
+    )
@@ -0,0 +1,389 @@
+"""
+backend.datastructures.rules
+
+Checker for UCF `device_rules` and `circuit_rules`.
+
+The UCF describes which part orderings are allowed as a tree of AND/OR nodes
+over Eugene style rule strings, e.g.
+
+    {"function": "AND", "rules": [
+        "STARTSWITH L3S2P55",
+        "pTac BEFORE pTet",
+        "NOT pAmtR NEXTTO pTet",
+        {"function": "OR", "rules": ["[0] EQUALS #in0", "[0] EQUALS #in1"]}
+    ]}
+
+`RuleSet` parses the tree once, maps every part name to an integer and turns
+each rule into a pair of closures: one over a per-candidate index (first and
+last position, count and neighbours of every part) for checking a single
+candidate in microseconds with early exit, and one over an (N, L) integer
+matrix for checking many candidates in a handful of vectorized passes.
+
+Supported rules, for parts A and B (`#name` placeholders are bound at compile
+time) and count c:
+    A BEFORE B, A AFTER B       Every A precedes (follows) every B.
+    A NEXTTO B                  Some A is adjacent to some B; negated, a
+                                forbidden pair.
+    A WITH B, A NOTWITH B       Both appear (or neither), never both.
+    [i] EQUALS A                The part at position i is A.
+    STARTSWITH A, ENDSWITH A    The first (last) part is A.
+    CONTAINS A, NOTCONTAINS A   A appears, never appears.
+    A EXACTLY c, A MORETHAN c, A NOTMORETHAN c, A SAMECOUNT B
+    ALL_FORWARD, ALL_REVERSE, FORWARD A, REVERSE A
+    NOT <rule>
+
+BEFORE and AFTER hold vacuously when either part is missing, as in Eugene.
+
+W.R. Jackson 2020
+"""
+import re
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+from backend.datastructures.library import Library
+
+# Candidate matrices are padded with this, parts outside the rules' vocabulary
+# are encoded as `UNKNOWN_PART`.
+PADDING = -1
+UNKNOWN_PART = -2
+
+_POSITION = re.compile(r'^\[(\d+)\]$')
+_BINARY = {'BEFORE', 'AFTER', 'NEXTTO', 'WITH', 'NOTWITH', 'EQUALS',
+           'SAMECOUNT'}
+_COUNTS = {'EXACTLY', 'MORETHAN', 'NOTMORETHAN'}
+_UNARY = {'STARTSWITH', 'ENDSWITH', 'CONTAINS', 'NOTCONTAINS', 'FORWARD',
+          'REVERSE'}
+_NULLARY = {'ALL_FORWARD', 'ALL_REVERSE'}
+
+
+class RuleSet:
+    '''
+    Usage:
+        rules = RuleSet.from_library(kind='circuit_rules')
+        rules.check(['L3S2P55', 'pTac', 'A1_AmtR', 'pTet'])
+        valid = rules.check_many(candidates)
+    '''
+
+    def __init__(
+            self,
+            rules: Union[dict, list, str],
+            bindings: Dict[str, str] = None,
+    ):
+        '''
+        Args:
+            rules: The rule tree: a UCF `rules` entry, a list of rules (ANDed
+                together) or a single rule string.
+            bindings: Values for `#placeholder` part names.
+        '''
+        self.bindings = dict(bindings or {})
+        self.vocabulary: Dict[str, int] = {}
+        self.expressions: List[str] = []
+        self._check, self._check_many = self._compile(rules)
+
+    @classmethod
+    def from_library(
+            cls,
+            library: Library = None,
+            kind: str = 'circuit_rules',
+            bindings: Dict[str, str] = None,
+    ) -> 'RuleSet':
+        '''
+        Args:
+            library: The parsed UCF library. Defaults to the singleton.
+            kind: `circuit_rules` or `device_rules`.
+            bindings: Values for `#placeholder` part names.
+
+        Returns:
+            The compiled rules; an empty set if the library has none.
+        '''
+        library = library if library is not None else Library()
+        entry = getattr(library, kind)
+        if entry is None:
+            return cls([], bindings)
+        return cls(entry.get('rules', entry), bindings)
+
+    # -------------------------------- Checking --------------------------------
+    def check(
+            self,
+            parts: Sequence[str],
+            strands: Sequence[int] = None,
+    ) -> bool:
+        '''
+        Args:
+            parts: Part names in placement order.
+            strands: +1/-1 orientation per part, for the orientation rules.
+                Parts are taken as forward without it.
+
+        Returns:
+            Whether every rule holds. Stops at the first violated rule.
+        '''
+        return self._check(_SequenceIndex(self.encode_one(parts), strands))
+
+    def check_many(
+            self,
+            candidates: Union[np.ndarray, Sequence[Sequence[str]]],
+            strands: np.ndarray = None,
+    ) -> np.ndarray:
+        '''
+        Args:
+            candidates: Part name sequences, or an (N, L) matrix from
+                `encode`.
+            strands: (N, L) +1/-1 orientations, if known.
+
+        Returns:
+            (N,) boolean validity per candidate.
+        '''
+        if not isinstance(candidates, np.ndarray):
+            candidates = self.encode(candidates)
+        if strands is None:
+            strands = np.ones(candidates.shape, dtype=np.int8)
+        return np.broadcast_to(
+            self._check_many(_MatrixIndex(candidates, strands)),
+            (len(candidates),),
+        ).copy()
+
+    def encode_one(self, parts: Sequence[str]) -> List[int]:
+        return [self.vocabulary.get(part, UNKNOWN_PART) for part in parts]
+
+    def encode(self, candidates: Sequence[Sequence[str]]) -> np.ndarray:
+        '''
+        Returns:
+            (N, L) part ids, padded with `PADDING`, for `check_many`.
+        '''
+        length = max((len(parts) for parts in candidates), default=0)
+        encoded = np.full((len(candidates), length), PADDING, dtype=np.int32)
+        for row, parts in enumerate(candidates):
+            encoded[row, :len(parts)] = self.encode_one(parts)
+        return encoded
+
+    # ------------------------------- Compiling --------------------------------
+    def _compile(self, node) -> Tuple[Callable, Callable]:
+        if isinstance(node, str):
+            self.expressions.append(node)
+            return self._compile_rule(node.split())
+        if isinstance(node, dict):
+            function = node.get('function', 'AND').upper()
+            children = [
+                self._compile(child) for child in node.get('rules', [])
+            ]
+        else:
+            function = 'AND'
+            children = [self._compile(child) for child in node]
+        scalars = [scalar for scalar, _ in children]
+        bulks = [bulk for _, bulk in children]
+        if function == 'AND':
+            return (
+                lambda index: all(check(index) for check in scalars),
+                lambda index: _reduce(np.logical_and, bulks, index, True),
+            )
+        if function == 'OR':
+            return (
+                lambda index: any(check(index) for check in scalars),
+                lambda index: _reduce(np.logical_or, bulks, index, False),
+            )
+        raise RuntimeError(f'Unknown rule function {function}')
+
+    def _part(self, name: str) -> int:
+        if name.startswith('#'):
+            if name not in self.bindings:
+                raise RuntimeError(f'No binding for placeholder {name}')
+            name = self.bindings[name]
+        return self.vocabulary.setdefault(name, len(self.vocabulary))
+
+    def _compile_rule(self, tokens: List[str]) -> Tuple[Callable, Callable]:
+        if tokens and tokens[0].upper() == 'NOT':
+            scalar, bulk = self._compile_rule(tokens[1:])
+            return (
+                lambda index: not scalar(index),
+                lambda index: ~bulk(index),
+            )
+        upper = [token.upper() for token in tokens]
+        if len(tokens) == 1 and upper[0] in _NULLARY:
+            sign = 1 if upper[0] == 'ALL_FORWARD' else -1
+            return (
+                lambda index: all(strand == sign for strand in index.strands),
+                lambda index: np.all(
+                    (index.strands == sign) | (index.parts == PADDING),
+                    axis=1,
+                ),
+            )
+        if len(tokens) == 2 and upper[0] in _UNARY:
+            return self._unary(upper[0], self._part(tokens[1]))
+        if len(tokens) == 3 and _POSITION.match(tokens[0]) and \
+                upper[1] == 'EQUALS':
+            position = int(_POSITION.match(tokens[0]).group(1))
+            part = self._part(tokens[2])
+            return (
+                lambda index: len(index.parts) > position and
+                index.parts[position] == part,
+                lambda index: index.parts[:, position] == part
+                if index.parts.shape[1] > position
+                else np.zeros(len(index.parts), dtype=bool),
+            )
+        if len(tokens) == 3 and upper[1] in _COUNTS:
+            return self._count(upper[1], self._part(tokens[0]),
+                               int(tokens[2]))
+        if len(tokens) == 3 and upper[1] in _BINARY:
+            return self._binary(upper[1], self._part(tokens[0]),
+                                self._part(tokens[2]))
+        raise RuntimeError(f'Unable to parse rule {" ".join(tokens)}')
+
+    @staticmethod
+    def _unary(operation: str, part: int):
+        if operation == 'STARTSWITH':
+            return (
+                lambda index: bool(index.parts) and index.parts[0] == part,
+                lambda index: index.parts[:, 0] == part
+                if index.parts.shape[1] else np.zeros(len(index.parts), bool),
+            )
+        if operation == 'ENDSWITH':
+            return (
+                lambda index: bool(index.parts) and index.parts[-1] == part,
+                lambda index: index.last_parts() == part,
+            )
+        if operation == 'CONTAINS':
+            return (
+                lambda index: part in index.first,
+                lambda index: index.count(part) > 0,
+            )
+        if operation == 'NOTCONTAINS':
+            return (
+                lambda index: part not in index.first,
+                lambda index: index.count(part) == 0,
+            )
+        sign = 1 if operation == 'FORWARD' else -1
+        return (
+            lambda index: all(
+                strand == sign
+                for value, strand in zip(index.parts, index.strands)
+                if value == part
+            ),
+            lambda index: np.all(
+                (index.strands == sign) | (index.parts != part),
+                axis=1,
+            ),
+        )
+
+    @staticmethod
+    def _count(operation: str, part: int, count: int):
+        compare = {
+            'EXACTLY': np.equal,
+            'MORETHAN': np.greater,
+            'NOTMORETHAN': np.less_equal,
+        }[operation]
+        return (
+            lambda index: bool(compare(index.counts.get(part, 0), count)),
+            lambda index: compare(index.count(part), count),
+        )
+
+    @staticmethod
+    def _binary(operation: str, a: int, b: int):
+        if operation in ('BEFORE', 'AFTER'):
+            if operation == 'AFTER':
+                a, b = b, a
+            return (
+                lambda index: a not in index.first or b not in index.first
+                or index.last[a] < index.first[b],
+                lambda index: (index.count(a) == 0) | (index.count(b) == 0) |
+                (index.last_position(a) < index.first_position(b)),
+            )
+        if operation == 'NEXTTO':
+            return (
+                lambda index: (a, b) in index.neighbours,
+                lambda index: index.adjacent(a, b),
+            )
+        if operation == 'WITH':
+            return (
+                lambda index: (a in index.first) == (b in index.first),
+                lambda index: (index.count(a) > 0) == (index.count(b) > 0),
+            )
+        if operation == 'NOTWITH':
+            return (
+                lambda index: a not in index.first or b not in index.first,
+                lambda index: (index.count(a) == 0) | (index.count(b) == 0),
+            )
+        if operation == 'SAMECOUNT':
+            return (
+                lambda index: index.counts.get(a, 0) ==
+                index.counts.get(b, 0),
+                lambda index: index.count(a) == index.count(b),
+            )
+        # A EQUALS B: the same part, once bindings are resolved.
+        return (
+            lambda index: a == b,
+            lambda index: np.full(len(index.parts), a == b),
+        )
+
+
+class _SequenceIndex:
+    '''
+    First/last position, count and neighbour pairs of one candidate.
+    '''
+    __slots__ = ('parts', 'strands', 'first', 'last', 'counts',
+                 'neighbours')
+
+    def __init__(self, parts: List[int], strands: Sequence[int] = None):
+        self.parts = parts
+        self.strands = strands if strands is not None else [1] * len(parts)
+        self.first = {}
+        self.last = {}
+        self.counts = {}
+        for position, part in enumerate(parts):
+            self.first.setdefault(part, position)
+            self.last[part] = position
+            self.counts[part] = self.counts.get(part, 0) + 1
+        self.neighbours = set(zip(parts, parts[1:])) | \
+            set(zip(parts[1:], parts))
+
+
+class _MatrixIndex:
+    '''
+    Lazily computed, cached per part columns over an (N, L) candidate matrix.
+    '''
+
+    def __init__(self, parts: np.ndarray, strands: np.ndarray):
+        self.parts = parts
+        self.strands = strands
+        self._masks = {}
+        self._positions = np.arange(parts.shape[1])
+
+    def mask(self, part: int) -> np.ndarray:
+        if part not in self._masks:
+            self._masks[part] = self.parts == part
+        return self._masks[part]
+
+    def count(self, part: int) -> np.ndarray:
+        return self.mask(part).sum(axis=1)
+
+    def first_position(self, part: int) -> np.ndarray:
+        return np.where(self.mask(part), self._positions,
+                        self.parts.shape[1]).min(axis=1)
+
+    def last_position(self, part: int) -> np.ndarray:
+        return np.where(self.mask(part), self._positions, -1).max(axis=1)
+
+    def last_parts(self) -> np.ndarray:
+        lengths = np.sum(self.parts != PADDING, axis=1)
+        last = self.parts[np.arange(len(self.parts)),
+                          np.maximum(lengths - 1, 0)]
+        return np.where(lengths > 0, last, PADDING)
+
+    def adjacent(self, a: int, b: int) -> np.ndarray:
+        left, right = self.mask(a), self.mask(b)
+        return np.any(left[:, :-1] & right[:, 1:], axis=1) | \
+            np.any(right[:, :-1] & left[:, 1:], axis=1)
+
+
+def _reduce(operation, bulks, index, identity: bool) -> np.ndarray:
+    result = np.full(len(index.parts), identity)
+    for bulk in bulks:
+        result = operation(result, bulk(index))
+    return result
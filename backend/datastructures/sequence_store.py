@@ -0,0 +1,258 @@
+"""
+backend.datastructures.sequence_store
+
+Deduplicated, 2-bit packed storage for DNA sequences.
+
+Part sequences repeat heavily across gates and UCFs (every BM3R1 variant
+carries the same CDS, for instance), and as Python strings each copy costs a
+byte per base plus object overhead. Here every distinct sequence is stored
+once, four bases to a byte, with anything that isn't an uppercase A/C/G/T
+recorded on the side: lowercase as runs, other characters as point
+exceptions. Callers get small `SequenceHandle` objects that decode on demand.
+
+W.R. Jackson 2020
+"""
+import hashlib
+from typing import (
+    Dict,
+    List,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+_BASES = b'ACGT'
+_INVALID = 255
+# ASCII byte -> 2-bit code, or _INVALID for anything else (after uppercasing).
+_ENCODE = np.full(256, _INVALID, dtype=np.uint8)
+for _code, _base in enumerate(_BASES):
+    _ENCODE[_base] = _code
+# Packed byte -> the four ASCII bases it holds.
+_DECODE = np.array(
+    [
+        [_BASES[(byte >> shift) & 0b11] for shift in (6, 4, 2, 0)]
+        for byte in range(256)
+    ],
+    dtype=np.uint8,
+)
+_CASE_BIT = 0x20
+
+
+class SequenceHandle:
+    '''
+    A lightweight reference to (a window of) a sequence in a `SequenceStore`.
+    Slicing returns another handle without decoding anything.
+    '''
+    __slots__ = ('store', 'sequence_id', 'start', 'stop')
+
+    def __init__(
+            self,
+            store: 'SequenceStore',
+            sequence_id: int,
+            start: int,
+            stop: int,
+    ):
+        self.store = store
+        self.sequence_id = sequence_id
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                raise RuntimeError('Sequence handles only support unit steps.')
+            stop = max(start, stop)
+            return SequenceHandle(
+                self.store,
+                self.sequence_id,
+                self.start + start,
+                self.start + stop,
+            )
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError('Sequence index out of range')
+        position = self.start + item
+        return self.store.decode(self.sequence_id, position, position + 1)
+
+    def __str__(self):
+        return self.decode()
+
+    def __repr__(self):
+        return (
+            f'SequenceHandle(id={self.sequence_id}, '
+            f'start={self.start}, stop={self.stop})'
+        )
+
+    def __eq__(self, other):
+        if isinstance(other, SequenceHandle):
+            if other.store is self.store and \
+                    other.sequence_id == self.sequence_id and \
+                    other.start == self.start and other.stop == self.stop:
+                return True
+            return len(other) == len(self) and \
+                other.decode() == self.decode()
+        if isinstance(other, str):
+            return other == self.decode()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.decode())
+
+    def decode(self) -> str:
+        '''
+        Returns:
+            The bases this handle covers, as a string.
+        '''
+        return self.store.decode(self.sequence_id, self.start, self.stop)
+
+
+class SequenceStore:
+    '''
+    Interning store for DNA sequences.
+
+    Usage:
+        store = SequenceStore()
+        handle = store.intern('ATGCatgcN')
+        str(handle[2:6])  # 'GCat'
+    '''
+
+    def __init__(self):
+        # All packed sequences live in one buffer; each starts on a byte
+        # boundary.
+        self._buffer = bytearray()
+        self._offsets: List[int] = []
+        self._lengths: List[int] = []
+        # Per sequence, sorted (position, original byte) for non ACGT bases.
+        self._exceptions: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # Per sequence, (starts, stops) of lowercase runs.
+        self._lowercase: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._ids: Dict[bytes, int] = {}
+        self.interned = 0
+
+    def __len__(self):
+        '''
+        Returns:
+            The number of distinct sequences stored.
+        '''
+        return len(self._lengths)
+
+    @property
+    def nbytes(self) -> int:
+        '''
+        Returns:
+            Approximate bytes used by sequence data, including side tables.
+        '''
+        side_tables = sum(
+            positions.nbytes + values.nbytes
+            for positions, values in self._exceptions.values()
+        ) + sum(
+            starts.nbytes + stops.nbytes
+            for starts, stops in self._lowercase.values()
+        )
+        return len(self._buffer) + side_tables
+
+    def intern(self, sequence: Union[str, bytes]) -> SequenceHandle:
+        '''
+        Stores a sequence if it hasn't been seen before.
+
+        Args:
+            sequence: The sequence to store. Case and non ACGT characters are
+                preserved exactly.
+
+        Returns:
+            A handle covering the whole sequence.
+        '''
+        if isinstance(sequence, SequenceHandle):
+            return sequence
+        if isinstance(sequence, str):
+            sequence = sequence.encode('ascii')
+        self.interned += 1
+        key = hashlib.blake2b(sequence, digest_size=16).digest()
+        sequence_id = self._ids.get(key)
+        if sequence_id is None:
+            sequence_id = self._pack(sequence)
+            self._ids[key] = sequence_id
+        return SequenceHandle(
+            self,
+            sequence_id,
+            0,
+            self._lengths[sequence_id],
+        )
+
+    def decode(self, sequence_id: int, start: int, stop: int) -> str:
+        '''
+        Decodes a window of a stored sequence. Only the packed bytes covering
+        the window are touched.
+
+        Args:
+            sequence_id: Which sequence.
+            start: Zero based start.
+            stop: Exclusive end.
+
+        Returns:
+            The bases as a string.
+        '''
+        if stop <= start:
+            return ''
+        first_byte = start // 4
+        last_byte = (stop + 3) // 4
+        packed = np.frombuffer(
+            self._buffer,
+            dtype=np.uint8,
+            count=last_byte - first_byte,
+            offset=self._offsets[sequence_id] + first_byte,
+        )
+        bases = _DECODE[packed].ravel()[start - first_byte * 4:
+                                        stop - first_byte * 4].copy()
+        del packed
+        if sequence_id in self._lowercase:
+            starts, stops = self._lowercase[sequence_id]
+            first = np.searchsorted(stops, start, side='right')
+            last = np.searchsorted(starts, stop, side='left')
+            for run_start, run_stop in zip(starts[first:last],
+                                           stops[first:last]):
+                window = slice(
+                    max(run_start, start) - start,
+                    min(run_stop, stop) - start,
+                )
+                bases[window] |= _CASE_BIT
+        if sequence_id in self._exceptions:
+            positions, values = self._exceptions[sequence_id]
+            first = np.searchsorted(positions, start, side='left')
+            last = np.searchsorted(positions, stop, side='left')
+            bases[positions[first:last] - start] = values[first:last]
+        return bases.tobytes().decode('ascii')
+
+    def _pack(self, sequence: bytes) -> int:
+        raw = np.frombuffer(sequence, dtype=np.uint8)
+        is_lower = (raw >= ord('a')) & (raw <= ord('z'))
+        codes = _ENCODE[np.where(is_lower, raw - _CASE_BIT, raw)]
+        invalid = codes == _INVALID
+        sequence_id = len(self._lengths)
+        if invalid.any():
+            positions = np.flatnonzero(invalid).astype(np.int64)
+            self._exceptions[sequence_id] = (positions, raw[positions].copy())
+            codes = np.where(invalid, 0, codes).astype(np.uint8)
+        lowercase = is_lower & ~invalid
+        if lowercase.any():
+            edges = np.diff(np.concatenate(([0], lowercase.view(np.int8), [0])))
+            self._lowercase[sequence_id] = (
+                np.flatnonzero(edges == 1),
+                np.flatnonzero(edges == -1),
+            )
+        padding = (-len(codes)) % 4
+        if padding:
+            codes = np.concatenate((codes, np.zeros(padding, dtype=np.uint8)))
+        quads = codes.reshape(-1, 4)
+        packed = (quads[:, 0] << 6) | (quads[:, 1] << 4) | \
+            (quads[:, 2] << 2) | quads[:, 3]
+        self._offsets.append(len(self._buffer))
+        self._lengths.append(len(raw))
+        self._buffer.extend(packed.astype(np.uint8).tobytes())
+        return sequence_id
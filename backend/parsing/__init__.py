@@ -1 +1,39 @@
-from .parser import parse_ucf_file
+from .genbank import (
+    GenbankFeature,
+    iter_genbank_features,
+    origin_bases,
+    parse_feature_table,
+    parse_location,
+    reverse_complement,
+)
+from .genbank_index import (
+    FeatureHit,
+    GenbankIndex,
+)
+from .parser import (
+    VerilogDesign,
+    parse_gates_csv,
+    parse_input_signals,
+    parse_output_signals,
+    parse_ucf_file,
+    parse_verilog,
+    parse_verilog_file,
+)
+
+__all__ = [
+    'GenbankFeature',
+    'iter_genbank_features',
+    'origin_bases',
+    'parse_feature_table',
+    'parse_location',
+    'reverse_complement',
+    'FeatureHit',
+    'GenbankIndex',
+    'VerilogDesign',
+    'parse_gates_csv',
+    'parse_input_signals',
+    'parse_output_signals',
+    'parse_ucf_file',
+    'parse_verilog',
+    'parse_verilog_file',
+]
@@ -0,0 +1,347 @@
+"""
+backend.parsing.genbank
+
+Lazy, constant memory iteration over the features of a GenBank file.
+
+`SeqIO.read` materializes the whole record (every feature plus the sequence as
+a Python string) before handing anything back. For plasmid-scale Cello output
+we only ever walk the feature table once, so here the sequence is compacted
+into a memory-mapped scratch buffer and features are parsed one at a time,
+each exposing its bases as a view into that single buffer.
+
+Only single record files are supported, which is what Cello writes.
+
+W.R. Jackson 2020
+"""
+import mmap
+import tempfile
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    Tuple,
+)
+
+_COMPLEMENT = bytes.maketrans(
+    b'ACGTacgtNnRYKMrykmBVDHbvdhSWsw',
+    b'TGCAtgcaNnYRMKyrmkVBHDvbhdSWsw',
+)
+# Everything in an ORIGIN line that isn't a base.
+_ORIGIN_NOISE = b'0123456789 \t\r\n'
+# Column at which feature keys start, and at which qualifiers start.
+_FEATURE_KEY_COLUMN = 5
+_QUALIFIER_COLUMN = 21
+
+
+@dataclass
+class GenbankFeature:
+    '''
+    Attributes:
+        type: Feature key, e.g. `CDS` or `terminator`.
+        location: Location string as written in the file.
+        qualifiers: Qualifier name to list of values, mirroring Biopython.
+        spans: Zero based, half open (start, end, strand) pieces in the order
+            they are read to produce the feature sequence.
+        offset: Byte offset of the feature's first line within the file.
+        length: Length in bytes of the feature's lines within the file.
+    '''
+    type: str
+    location: str
+    qualifiers: Dict[str, List[str]]
+    spans: List[Tuple[int, int, int]]
+    offset: int
+    length: int
+    _sequence: memoryview = field(default=None, repr=False)
+
+    @property
+    def label(self) -> str:
+        labels = self.qualifiers.get('label')
+        return labels[0] if labels else None
+
+    @property
+    def start(self) -> int:
+        return min(span[0] for span in self.spans)
+
+    @property
+    def end(self) -> int:
+        return max(span[1] for span in self.spans)
+
+    @property
+    def strand(self) -> int:
+        strands = {span[2] for span in self.spans}
+        return strands.pop() if len(strands) == 1 else 0
+
+    def view(self) -> memoryview:
+        '''
+        Returns:
+            A zero copy view over the bases between `start` and `end` on the
+            forward strand. Use `extract` to honor strand and joins.
+        '''
+        if self._sequence is None:
+            raise RuntimeError('Feature was parsed without its sequence.')
+        return self._sequence[self.start:self.end]
+
+    def extract(self) -> str:
+        '''
+        Returns:
+            The feature sequence, reverse complemented and joined as the
+            location demands. This is the only point a copy is made.
+        '''
+        if self._sequence is None:
+            raise RuntimeError('Feature was parsed without its sequence.')
+        pieces = []
+        for start, end, strand in self.spans:
+            piece = bytes(self._sequence[start:end])
+            if strand < 0:
+                piece = reverse_complement(piece)
+            pieces.append(piece)
+        return b''.join(pieces).decode('ascii')
+
+
+# ------------------------ Publicly Available Functions ------------------------
+def iter_genbank_features(
+        filepath: str,
+        with_sequence: bool = True,
+) -> Iterator[GenbankFeature]:
+    '''
+    Lazily yields the features of a GenBank file.
+
+    The file is streamed twice: once to copy the ORIGIN section into a compact
+    memory-mapped buffer, and once to parse the feature table. Neither pass
+    holds more than a line at a time.
+
+    Args:
+        filepath: Filepath to the GenBank file.
+        with_sequence: Whether features should carry views over the sequence.
+            Skipping it saves the first pass when only coordinates matter.
+
+    Yields:
+        One `GenbankFeature` per entry in the feature table.
+    '''
+    sequence_file = None
+    sequence_map = None
+    sequence = None
+    try:
+        with open(filepath, 'rb') as genbank_file:
+            if with_sequence:
+                sequence_file = tempfile.TemporaryFile()
+                if _copy_origin(genbank_file, sequence_file):
+                    sequence_file.flush()
+                    sequence_map = mmap.mmap(
+                        sequence_file.fileno(),
+                        0,
+                        access=mmap.ACCESS_READ,
+                    )
+                    sequence = memoryview(sequence_map)
+                else:
+                    sequence = memoryview(b'')
+                genbank_file.seek(0)
+            for feature in parse_feature_table(genbank_file):
+                feature._sequence = sequence
+                yield feature
+    finally:
+        # Features the caller kept hold a view into the mapping, and closing
+        # it would pull the bases out from under them. In that case the
+        # mapping goes away once the last of them is garbage collected.
+        del sequence
+        if sequence_map is not None:
+            try:
+                sequence_map.close()
+            except BufferError:
+                pass
+        if sequence_file is not None:
+            sequence_file.close()
+
+
+def parse_location(location: str) -> List[Tuple[int, int, int]]:
+    '''
+    Parses a GenBank location string.
+
+    Supports plain ranges, single bases, between-base sites, fuzzy ends and
+    arbitrarily nested `complement`, `join` and `order` operators. Remote
+    references into other records are not supported.
+
+    Args:
+        location: Location string, e.g. `complement(join(1..10,20..30))`.
+
+    Returns:
+        Zero based, half open (start, end, strand) spans in reading order.
+    '''
+    location = location.strip().replace('<', '').replace('>', '')
+    if location.startswith('complement(') and location.endswith(')'):
+        inner = parse_location(location[len('complement('):-1])
+        return [(start, end, -strand) for start, end, strand in reversed(inner)]
+    for operator in ('join(', 'order('):
+        if location.startswith(operator) and location.endswith(')'):
+            spans = []
+            for piece in _split_top_level(location[len(operator):-1]):
+                spans.extend(parse_location(piece))
+            return spans
+    if ':' in location:
+        raise RuntimeError(f'Remote locations are not supported: {location}')
+    try:
+        if '..' in location:
+            start, end = location.split('..')
+            return [(int(start) - 1, int(end), 1)]
+        if '^' in location:
+            # Between two bases; zero length.
+            start, _ = location.split('^')
+            return [(int(start), int(start), 1)]
+        return [(int(location) - 1, int(location), 1)]
+    except ValueError:
+        raise RuntimeError(f'Unable to parse GenBank location {location}')
+
+
+def parse_feature_table(genbank_file: BinaryIO) -> Iterator[GenbankFeature]:
+    '''
+    Walks the feature table, yielding features as soon as their last
+    qualifier line has been read.
+
+    Args:
+        genbank_file: The GenBank file, opened in binary mode. Feature byte
+            offsets are counted from where it is positioned, normally its
+            start.
+
+    Yields:
+        One `GenbankFeature` per entry, without its sequence.
+    '''
+    offset = 0
+    table_end = 0
+    in_features = False
+    current = None
+    for raw_line in genbank_file:
+        line_offset = offset
+        offset += len(raw_line)
+        line = raw_line.decode('ascii', errors='replace').rstrip('\r\n')
+        if not in_features:
+            in_features = line.startswith('FEATURES')
+            continue
+        # Anything starting in column zero ends the table (ORIGIN, CONTIG,
+        # BASE COUNT, ...).
+        if line and not line[0].isspace():
+            table_end = line_offset
+            break
+        if len(line) > _FEATURE_KEY_COLUMN and \
+                line[_FEATURE_KEY_COLUMN] != ' ':
+            if current is not None:
+                yield _finish_feature(current, line_offset)
+            key = line[_FEATURE_KEY_COLUMN:_QUALIFIER_COLUMN].strip()
+            current = {
+                'type': key,
+                'location': [line[_QUALIFIER_COLUMN:].strip()],
+                'qualifier_lines': [],
+                'offset': line_offset,
+            }
+            continue
+        if current is None:
+            continue
+        content = line[_QUALIFIER_COLUMN:].strip()
+        if content.startswith('/') or current['qualifier_lines']:
+            current['qualifier_lines'].append(content)
+        else:
+            # Location continued over several lines.
+            current['location'].append(content)
+    else:
+        table_end = offset
+    if current is not None:
+        yield _finish_feature(current, table_end)
+
+
+def origin_bases(data: bytes) -> bytes:
+    '''
+    Returns:
+        The bases of (part of) an ORIGIN section, without position numbers or
+        whitespace.
+    '''
+    return data.translate(None, _ORIGIN_NOISE)
+
+
+def reverse_complement(bases: bytes) -> bytes:
+    '''
+    Returns:
+        The reverse complement of ASCII bases, IUPAC codes included.
+    '''
+    return bases.translate(_COMPLEMENT)[::-1]
+
+
+# ----------------------------- Private Functions ------------------------------
+def _split_top_level(text: str) -> List[str]:
+    pieces = []
+    depth = 0
+    current = []
+    for character in text:
+        if character == ',' and depth == 0:
+            pieces.append(''.join(current))
+            current = []
+            continue
+        if character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        current.append(character)
+    pieces.append(''.join(current))
+    return pieces
+
+
+def _copy_origin(genbank_file: BinaryIO, destination: BinaryIO) -> bool:
+    '''
+    Copies the bases of the ORIGIN section into `destination`, dropping the
+    position numbers and whitespace.
+
+    Returns:
+        Whether any sequence was found.
+    '''
+    in_origin = False
+    found = False
+    for line in genbank_file:
+        if not in_origin:
+            in_origin = line.startswith(b'ORIGIN')
+            continue
+        if line.startswith(b'//'):
+            break
+        bases = origin_bases(line)
+        if bases:
+            destination.write(bases)
+            found = True
+    return found
+
+
+def _finish_feature(pending: dict, end_offset: int) -> GenbankFeature:
+    location = ''.join(pending['location'])
+    return GenbankFeature(
+        type=pending['type'],
+        location=location,
+        qualifiers=_parse_qualifiers(pending['qualifier_lines']),
+        spans=parse_location(location),
+        offset=pending['offset'],
+        length=end_offset - pending['offset'],
+    )
+
+
+def _parse_qualifiers(lines: List[str]) -> Dict[str, List[str]]:
+    qualifiers = {}
+    name = None
+    value = None
+    open_quote = False
+    for line in lines:
+        if open_quote:
+            # Free text wraps with a space, sequences (translations) don't.
+            separator = '' if name == 'translation' else ' '
+            value += separator + line
+            open_quote = value.count('"') % 2 == 1
+            if not open_quote:
+                qualifiers.setdefault(name, []).append(value.strip('"'))
+            continue
+        if not line.startswith('/'):
+            continue
+        name, _, value = line[1:].partition('=')
+        if value.startswith('"') and value.count('"') % 2 == 1:
+            open_quote = True
+            continue
+        qualifiers.setdefault(name, []).append(value.strip('"'))
+    return qualifiers
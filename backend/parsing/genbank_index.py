@@ -0,0 +1,367 @@
+"""
+backend.parsing.genbank_index
+
+Persistent index over a directory of GenBank result files.
+
+Each file is scanned once; every feature's type, label, coordinates and byte
+offset go into a small SQLite database, along with where the ORIGIN section
+starts. Queries like "which designs use terminator L3S2P11" are then a single
+indexed lookup, and a feature's sequence is read straight out of a
+memory-mapped file by computing where its bases sit in the ORIGIN block,
+touching only those bytes.
+
+W.R. Jackson 2020
+"""
+import glob
+import mmap
+import os
+import sqlite3
+from dataclasses import dataclass
+from typing import (
+    List,
+    Tuple,
+)
+
+from backend.parsing.genbank import (
+    origin_bases,
+    parse_feature_table,
+    parse_location,
+    reverse_complement,
+)
+
+# Standard ORIGIN layout: a nine character right aligned position, then six
+# space separated blocks of ten bases.
+_BASES_PER_LINE = 60
+_BASES_PER_BLOCK = 10
+_POSITION_WIDTH = 10
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    origin_offset INTEGER,
+    origin_end INTEGER,
+    sequence_length INTEGER,
+    line_stride INTEGER
+);
+CREATE TABLE IF NOT EXISTS features (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    label TEXT,
+    location TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    strand INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS features_by_type_label ON features(type, label);
+CREATE INDEX IF NOT EXISTS features_by_label ON features(label);
+CREATE INDEX IF NOT EXISTS features_by_file ON features(file_id);
+'''
+
+
+@dataclass
+class FeatureHit:
+    '''
+    Attributes:
+        path: File containing the feature.
+        type: Feature key.
+        label: First `label` qualifier, if any.
+        location: Location string as written in the file.
+        start: Zero based start on the forward strand.
+        end: Zero based, exclusive end on the forward strand.
+        strand: 1, -1, or 0 for mixed strand joins.
+        offset: Byte offset of the feature's entry in the file.
+        length: Length in bytes of the feature's entry.
+    '''
+    path: str
+    type: str
+    label: str
+    location: str
+    start: int
+    end: int
+    strand: int
+    offset: int
+    length: int
+
+
+class GenbankIndex:
+    '''
+    Usage:
+        index = GenbankIndex('results.sqlite')
+        index.add_directory('results/', '*.ape')
+        for hit in index.query(type='terminator', label='L3S2P11'):
+            print(hit.path, index.read_sequence(hit))
+    '''
+
+    def __init__(self, db_path: str):
+        '''
+        Args:
+            db_path: Filepath of the SQLite database. Created if missing.
+        '''
+        self.db_path = db_path
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # -------------------------------- Indexing --------------------------------
+    def add_file(self, filepath: str) -> bool:
+        '''
+        Indexes a GenBank file. Files whose size and modification time match
+        what's already indexed are skipped.
+
+        Args:
+            filepath: Filepath to the GenBank file.
+
+        Returns:
+            Whether the file was (re)scanned.
+        '''
+        path = os.path.abspath(filepath)
+        stat = os.stat(path)
+        row = self._connection.execute(
+            'SELECT id, size, mtime FROM files WHERE path = ?',
+            (path,),
+        ).fetchone()
+        if row is not None and row[1] == stat.st_size and \
+                row[2] == stat.st_mtime:
+            return False
+        features = []
+        with open(path, 'rb') as genbank_file:
+            table_end = 0
+            for feature in parse_feature_table(genbank_file):
+                features.append(feature)
+                table_end = feature.offset + feature.length
+            origin_offset, origin_end, sequence_length, line_stride = \
+                _scan_origin(genbank_file, table_end)
+        with self._connection:
+            if row is not None:
+                self._connection.execute(
+                    'DELETE FROM files WHERE id = ?',
+                    (row[0],),
+                )
+            cursor = self._connection.execute(
+                'INSERT INTO files (path, size, mtime, origin_offset, '
+                'origin_end, sequence_length, line_stride) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (path, stat.st_size, stat.st_mtime, origin_offset,
+                 origin_end, sequence_length, line_stride),
+            )
+            file_id = cursor.lastrowid
+            self._connection.executemany(
+                'INSERT INTO features (file_id, type, label, location, '
+                'start, end, strand, offset, length) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (file_id, feature.type, feature.label, feature.location,
+                     feature.start, feature.end, feature.strand,
+                     feature.offset, feature.length)
+                    for feature in features
+                ],
+            )
+        return True
+
+    def add_directory(self, directory: str, pattern: str = '*') -> int:
+        '''
+        Indexes every matching file in a directory.
+
+        Args:
+            directory: Directory containing GenBank files.
+            pattern: Glob pattern to match within the directory.
+
+        Returns:
+            How many files were (re)scanned.
+        '''
+        scanned = 0
+        for filepath in sorted(glob.glob(os.path.join(directory, pattern))):
+            if os.path.isfile(filepath) and self.add_file(filepath):
+                scanned += 1
+        return scanned
+
+    def remove_missing(self) -> int:
+        '''
+        Drops files from the index that no longer exist on disk.
+
+        Returns:
+            How many files were dropped.
+        '''
+        missing = [
+            (file_id,) for file_id, path in
+            self._connection.execute('SELECT id, path FROM files')
+            if not os.path.exists(path)
+        ]
+        with self._connection:
+            self._connection.executemany(
+                'DELETE FROM files WHERE id = ?',
+                missing,
+            )
+        return len(missing)
+
+    # -------------------------------- Queries ---------------------------------
+    def query(self, type: str = None, label: str = None) -> List[FeatureHit]:
+        '''
+        Looks up features by type, label, or both.
+
+        Args:
+            type: Feature key to match, e.g. `terminator`.
+            label: Label to match, e.g. `L3S2P11`.
+
+        Returns:
+            Matching features, ordered by file then position.
+        '''
+        clauses = []
+        arguments = []
+        if type is not None:
+            clauses.append('features.type = ?')
+            arguments.append(type)
+        if label is not None:
+            clauses.append('features.label = ?')
+            arguments.append(label)
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        rows = self._connection.execute(
+            'SELECT files.path, features.type, features.label, '
+            'features.location, features.start, features.end, '
+            'features.strand, features.offset, features.length '
+            'FROM features JOIN files ON features.file_id = files.id '
+            f'{where} ORDER BY files.path, features.offset',
+            arguments,
+        ).fetchall()
+        return [FeatureHit(*row) for row in rows]
+
+    def files_with(self, label: str, type: str = None) -> List[str]:
+        '''
+        Args:
+            label: Label to match.
+            type: Feature key to match, if passed in.
+
+        Returns:
+            Sorted paths of the files containing a matching feature.
+        '''
+        return sorted({hit.path for hit in self.query(type=type, label=label)})
+
+    def read_entry(self, hit: FeatureHit) -> str:
+        '''
+        Returns:
+            The raw feature table entry for a hit, read through a memory map.
+        '''
+        with open(hit.path, 'rb') as genbank_file, \
+                mmap.mmap(genbank_file.fileno(), 0,
+                          access=mmap.ACCESS_READ) as mapped:
+            return mapped[hit.offset:hit.offset + hit.length].decode('ascii')
+
+    def read_sequence(self, hit: FeatureHit) -> str:
+        '''
+        Reads a feature's sequence, honoring strand and joins. With a standard
+        ORIGIN layout only the bytes spanning each piece are touched.
+
+        Args:
+            hit: A result from `query`.
+
+        Returns:
+            The feature sequence.
+        '''
+        origin_offset, origin_end, line_stride = self._connection.execute(
+            'SELECT origin_offset, origin_end, line_stride FROM files '
+            'WHERE path = ?',
+            (hit.path,),
+        ).fetchone()
+        if origin_offset is None:
+            raise RuntimeError(f'{hit.path} has no sequence.')
+        pieces = []
+        with open(hit.path, 'rb') as genbank_file, \
+                mmap.mmap(genbank_file.fileno(), 0,
+                          access=mmap.ACCESS_READ) as mapped:
+            for start, end, strand in parse_location(hit.location):
+                if start == end:
+                    continue
+                if line_stride:
+                    first = origin_offset + _base_offset(start, line_stride)
+                    last = origin_offset + _base_offset(end - 1, line_stride)
+                    piece = origin_bases(mapped[first:last + 1])
+                else:
+                    # Nonstandard layout, fall back to compacting the whole
+                    # ORIGIN block of this one file.
+                    piece = origin_bases(
+                        mapped[origin_offset:origin_end]
+                    )[start:end]
+                if strand < 0:
+                    piece = reverse_complement(piece)
+                pieces.append(piece)
+        return b''.join(pieces).decode('ascii')
+
+
+def _base_offset(position: int, line_stride: int) -> int:
+    '''
+    Byte offset of a zero based base position relative to the first ORIGIN
+    sequence line, for the standard layout.
+    '''
+    line, column = divmod(position, _BASES_PER_LINE)
+    block, within = divmod(column, _BASES_PER_BLOCK)
+    return line * line_stride + _POSITION_WIDTH + \
+        block * (_BASES_PER_BLOCK + 1) + within
+
+
+def _scan_origin(genbank_file, table_end: int) -> Tuple[int, int, int, int]:
+    '''
+    Continues a scan from the end of the feature table through the ORIGIN
+    section, checking whether it follows the standard layout.
+
+    Returns:
+        (origin offset, origin end, sequence length, line stride). Offsets are
+        `None` without an ORIGIN section; the stride is `None` when the layout
+        is nonstandard and bases can't be located arithmetically.
+    '''
+    genbank_file.seek(table_end)
+    offset = table_end
+    origin_offset = None
+    for line in genbank_file:
+        offset += len(line)
+        if line.startswith(b'ORIGIN'):
+            origin_offset = offset
+            break
+    if origin_offset is None:
+        return None, None, None, None
+    sequence_length = 0
+    line_stride = None
+    standard = True
+    previous_full = True
+    origin_end = offset
+    for line in genbank_file:
+        if line.startswith(b'//'):
+            break
+        origin_end = offset + len(line)
+        offset = origin_end
+        body = line.rstrip(b'\r\n')
+        bases = origin_bases(body)
+        if standard:
+            expected = b' '.join(
+                bases[index:index + _BASES_PER_BLOCK]
+                for index in range(0, len(bases), _BASES_PER_BLOCK)
+            )
+            position = str(sequence_length + 1).rjust(
+                _POSITION_WIDTH - 1).encode('ascii')
+            standard = previous_full and \
+                body == position + b' ' + expected
+            previous_full = len(bases) == _BASES_PER_LINE
+            if line_stride is None:
+                line_stride = len(line)
+            elif previous_full and len(line) != line_stride:
+                standard = False
+        sequence_length += len(bases)
+    return (
+        origin_offset,
+        origin_end,
+        sequence_length,
+        line_stride if standard else None,
+    )
@@ -6,12 +6,66 @@ of intake into the optimization program as a whole.
 
 W.R. Jackson 2020
 """
+import csv
 import json
+import re
+from dataclasses import dataclass
+from typing import (
+    Dict,
+    List,
+    Union,
+)
+
+import numpy as np
+
 from backend.datastructures import (
+    InputSignal,
     Library,
+    SequenceHandle,
+    SequenceStore,
+)
+
+# Columns of the gates CSV holding DNA and numeric values respectively.
+GATE_SEQUENCE_COLUMNS = [
+    'promoterDNA',
+    'ribozymeDNA',
+    'rbsDNA',
+    'cdsDNA',
+    'terminatorDNA',
+]
+GATE_NUMERIC_COLUMNS = ['ymax', 'ymin', 'K', 'n', 'IL', 'IH']
+
+_VERILOG_COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_VERILOG_MODULE = re.compile(r'\bmodule\s+(\w+)\s*\((.*?)\)\s*;', re.DOTALL)
+_VERILOG_DECLARATION = re.compile(r'\b(input|output)\b([^;]*);')
+_VERILOG_CASE = re.compile(
+    r'\bcase\s*\(\s*(\{[^}]*\}|\w+)\s*\)(.*?)\bendcase\b',
+    re.DOTALL,
+)
+_VERILOG_CASE_ITEM = re.compile(
+    r"(\d+'[bB][01_]+|default)\s*:\s*(\{[^}]*\}|\w+)\s*=\s*"
+    r"(\d+'[bB][01_]+|[01])\s*;"
 )
 
 
+@dataclass
+class VerilogDesign:
+    '''
+    A combinational design given as a truth table.
+
+    Attributes:
+        name: Module name.
+        inputs: Input port names, most significant bit first.
+        outputs: Output port names.
+        truth_table: (2^inputs, outputs) boolean table, rows in counting
+            order (the first input being the most significant bit).
+    '''
+    name: str
+    inputs: List[str]
+    outputs: List[str]
+    truth_table: np.ndarray
+
+
 def _pop_and_assign(ucf_entry: dict) -> dict:
     '''
     Convenience function to remove some of the spurious data from the JSON and
@@ -47,7 +101,7 @@ def _pop_and_insert(ucf_entry: dict, container: dict):
     container[key] = ucf_entry
 
 
-def parse_ucf_file(filepath: str):
+def parse_ucf_file(filepath: str, sequence_store: SequenceStore = None):
     '''
     Parses in the passed in UCF (User Constraint File). Files are assigned
     to a global singleton due to the UCF acting as the global point of reference
@@ -55,6 +109,9 @@ def parse_ucf_file(filepath: str):
 
     Args:
         filepath: The filepath to the UCF FIle.
+        sequence_store: If passed in, part sequences are interned into the
+            store and replaced with handles, so parts shared between UCFs
+            are only held in memory once.
 
     Returns:
 
@@ -106,23 +163,221 @@ def parse_ucf_file(filepath: str):
                     _pop_and_insert(entry, functions)
     # Some of the above are not useful in our optimization problem but could
     # be useful if this were further expanded in the future.
-    for library in motif_library:
-        pass
-    for gate in gates:
-        pass
-    for model in models:
-        pass
-    for structure in structures:
-        pass
-    for part in parts:
-        pass
-    for function in functions:
-        pass
-
-def parse_verilog_file():
+    if sequence_store is not None:
+        for part in parts.values():
+            if 'dnasequence' in part:
+                part['dnasequence'] = sequence_store.intern(
+                    part['dnasequence']
+                )
+    lib.motifs = motif_library
+    lib.gates = gates
+    lib.models = models
+    lib.structures = structures
+    lib.parts = parts
+    lib.functions = functions
+
+
+def parse_gates_csv(
+        filepath: str,
+        sequence_store: SequenceStore = None,
+) -> Dict[str, dict]:
     '''
+    Parses a gates CSV (e.g. `gates_Eco1C1G1T1.csv`), one row per gate.
+
+    Args:
+        filepath: The filepath to the CSV file.
+        sequence_store: If passed in, the DNA columns are interned into the
+            store and replaced with handles.
+
+    Returns:
+        Gate name to row. Response function parameters and input thresholds
+        are converted to floats.
+    '''
+    gates = {}
+    with open(filepath, 'r', newline='') as input_file:
+        for row in csv.DictReader(input_file):
+            for column in GATE_NUMERIC_COLUMNS:
+                if row.get(column):
+                    row[column] = float(row[column])
+            if sequence_store is not None:
+                for column in GATE_SEQUENCE_COLUMNS:
+                    if row.get(column):
+                        row[column] = sequence_store.intern(row[column])
+            gates[row['name']] = row
+    return gates
+
+
+def parse_input_signals(
+        filepath: str,
+        sequence_store: SequenceStore = None,
+) -> Dict[str, InputSignal]:
+    '''
+    Parses an inputs file (e.g. `Inputs.txt`). Each line holds a name, the
+    low and high signal and the promoter sequence, separated by whitespace.
+
+    Args:
+        filepath: The filepath to the inputs file.
+        sequence_store: If passed in, sequences are interned into the store.
 
     Returns:
+        Input name to signal.
+    '''
+    signals = {}
+    with open(filepath, 'r') as input_file:
+        for line in input_file:
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) != 4:
+                raise RuntimeError(
+                    f'Malformed input signal line in {filepath}: {line!r}'
+                )
+            name, low, high, sequence = fields
+            if sequence_store is not None:
+                sequence = sequence_store.intern(sequence)
+            signals[name] = InputSignal(
+                label=name,
+                off_value=float(low),
+                on_value=float(high),
+                sequence=sequence,
+            )
+    return signals
+
 
+def parse_output_signals(
+        filepath: str,
+        sequence_store: SequenceStore = None,
+) -> Dict[str, Union[str, SequenceHandle]]:
     '''
-    pass
+    Parses an outputs file (e.g. `Outputs.txt`). Each line holds a name and
+    the output cassette sequence.
+
+    Args:
+        filepath: The filepath to the outputs file.
+        sequence_store: If passed in, sequences are interned into the store.
+
+    Returns:
+        Output name to sequence (or handle).
+    '''
+    outputs = {}
+    with open(filepath, 'r') as input_file:
+        for line in input_file:
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) != 2:
+                raise RuntimeError(
+                    f'Malformed output line in {filepath}: {line!r}'
+                )
+            name, sequence = fields
+            if sequence_store is not None:
+                sequence = sequence_store.intern(sequence)
+            outputs[name] = sequence
+    return outputs
+
+
+def parse_verilog_file(filepath: str) -> VerilogDesign:
+    '''
+    Parses a Verilog module describing its outputs with a `case` statement
+    over its inputs, which is how Cello designs (e.g. `0xFE.v`) are written.
+
+    Args:
+        filepath: The filepath to the Verilog file.
+
+    Returns:
+        The design's truth table. Rows missing from the case statement take
+        the `default` value.
+    '''
+    with open(filepath, 'r') as input_file:
+        return parse_verilog(input_file.read(), filepath)
+
+
+def parse_verilog(source: str, filepath: str = '<string>') -> VerilogDesign:
+    '''
+    As `parse_verilog_file`, for Verilog source already in memory.
+
+    Args:
+        source: The Verilog source.
+        filepath: Where the source came from, for error messages.
+
+    Returns:
+        The design's truth table.
+    '''
+    source = _VERILOG_COMMENT.sub('', source)
+    module = _VERILOG_MODULE.search(source)
+    if module is None:
+        raise RuntimeError(f'No module declaration found in {filepath}')
+    inputs, outputs = [], []
+    direction = None
+    for port in module.group(2).split(','):
+        words = port.split()
+        if words and words[0] in ('input', 'output'):
+            direction = words[0]
+        if words and direction is not None:
+            (inputs if direction == 'input' else outputs).append(words[-1])
+    # Non-ANSI style: directions declared in the module body.
+    for declaration in _VERILOG_DECLARATION.finditer(source[module.end():]):
+        names = [name.split()[-1] for name in declaration.group(2).split(',')
+                 if name.split()]
+        target = inputs if declaration.group(1) == 'input' else outputs
+        target.extend(name for name in names if name not in target)
+    case = _VERILOG_CASE.search(source)
+    if case is None:
+        raise RuntimeError(f'No case statement found in {filepath}')
+    selector = _verilog_names(case.group(1))
+    if sorted(selector) != sorted(inputs):
+        raise RuntimeError(
+            f'The case statement in {filepath} must select on every input.'
+        )
+    inputs = selector
+    rows = 2 ** len(inputs)
+    table = np.zeros((rows, len(outputs)), dtype=bool)
+    assigned = np.zeros((rows, len(outputs)), dtype=bool)
+    default = {}
+    for label, targets, value in _VERILOG_CASE_ITEM.findall(case.group(2)):
+        targets = _verilog_names(targets)
+        bits = _verilog_bits(value, len(targets))
+        for target, bit in zip(targets, bits):
+            if target not in outputs:
+                # Cello designs sometimes assign through a register that is
+                # aliased to the output port.
+                if len(outputs) != 1:
+                    raise RuntimeError(
+                        f'Unknown output {target} in {filepath}'
+                    )
+                target = outputs[0]
+            column = outputs.index(target)
+            if label == 'default':
+                default[column] = bit
+                continue
+            row = int(label.split("'")[1][1:].replace('_', ''), 2)
+            table[row, column] = bit
+            assigned[row, column] = True
+    for column in range(len(outputs)):
+        missing = ~assigned[:, column]
+        if missing.any():
+            if column not in default:
+                raise RuntimeError(
+                    f'{filepath} leaves output {outputs[column]} undefined '
+                    f'for some inputs and has no default.'
+                )
+            table[missing, column] = default[column]
+    return VerilogDesign(
+        name=module.group(1),
+        inputs=inputs,
+        outputs=outputs,
+        truth_table=table,
+    )
+
+
+def _verilog_names(expression: str) -> List[str]:
+    return [
+        name.strip() for name in expression.strip().strip('{}').split(',')
+        if name.strip()
+    ]
+
+
+def _verilog_bits(value: str, width: int) -> List[bool]:
+    digits = value.split("'")[1][1:].replace('_', '') if "'" in value \
+        else value
+    return [digit == '1' for digit in digits.zfill(width)[-width:]]
@@ -2,3 +2,98 @@ from .optimize_repressor import (
     graph_response_function,
     optimize_repressor,
 )
+from .robustness import (
+    RobustnessReport,
+    RobustnessScorer,
+    robustness_score,
+)
+from .sensitivity import (
+    SensitivityResult,
+    morris_screening,
+    sobol_indices,
+)
+from .pareto import (
+    ParetoDesign,
+    cheapest_design,
+    edit_cost,
+    pareto_optimize,
+)
+from .budget import (
+    BudgetResult,
+    budget_optimize,
+)
+from .optimize_circuit import (
+    CircuitOptimizationResult,
+    optimize_circuit,
+)
+from .synthesis import (
+    GateModel,
+    NorNetwork,
+    assign_gates,
+    build_circuit,
+    gate_models_from_csv,
+    gate_models_from_library,
+    gate_models_from_ucf,
+    synthesize_nor,
+)
+from .surrogate import surrogate_minimize
+from .dynamics import (
+    TransitionReport,
+    simulate_transitions,
+)
+from .warm_start import (
+    WarmStartIndex,
+    repressor_features,
+)
+from .run_store import (
+    OptimizationRun,
+    RunStore,
+    circuit_hashes,
+    run_optimization,
+)
+from .pipeline import (
+    PipelineConfig,
+    collect_designs,
+    design_record,
+    run_pipeline,
+)
+
+__all__ = [
+    'graph_response_function',
+    'optimize_repressor',
+    'RobustnessReport',
+    'RobustnessScorer',
+    'robustness_score',
+    'SensitivityResult',
+    'morris_screening',
+    'sobol_indices',
+    'ParetoDesign',
+    'cheapest_design',
+    'edit_cost',
+    'pareto_optimize',
+    'BudgetResult',
+    'budget_optimize',
+    'CircuitOptimizationResult',
+    'optimize_circuit',
+    'GateModel',
+    'NorNetwork',
+    'assign_gates',
+    'build_circuit',
+    'gate_models_from_csv',
+    'gate_models_from_library',
+    'gate_models_from_ucf',
+    'synthesize_nor',
+    'surrogate_minimize',
+    'TransitionReport',
+    'simulate_transitions',
+    'WarmStartIndex',
+    'repressor_features',
+    'OptimizationRun',
+    'RunStore',
+    'circuit_hashes',
+    'run_optimization',
+    'PipelineConfig',
+    'collect_designs',
+    'design_record',
+    'run_pipeline',
+]
@@ -0,0 +1,206 @@
+"""
+backend.solvers.batch
+
+Batched circuit scoring and chunked parallel evaluation.
+
+The global analyses and population based optimizers all boil down to "score
+this matrix of parameter multipliers". `score_multipliers` does that in one
+vectorized pass through `Circuit.score`, and `parallel_map_chunks` splits a
+large matrix into chunks spread across worker processes.
+
+W.R. Jackson 2020
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable
+
+import numpy as np
+
+from backend.datastructures import Circuit
+
+# Order of the per gate multipliers.
+PARAMETER_NAMES = ('y_min', 'y_max', 'k', 'n')
+# Order of the per gate edit multipliers, as in `optimize_repressor`: the first
+# two are DNA edits (promoter strength scaling y_min and y_max, RBS scaling K),
+# the last two are protein edits (stretching the sigmoid, changing the slope).
+EDIT_NAMES = ('expression', 'rbs', 'stretch', 'slope')
+DNA_EDIT_COUNT = 2
+# Edit multipliers within this (log) distance of one count as no edit.
+EDIT_TOLERANCE = 1e-3
+
+
+def score_multipliers(circuit: Circuit, multipliers: np.ndarray) -> np.ndarray:
+    '''
+    Scores many variants of a circuit at once.
+
+    Args:
+        circuit: The nominal circuit.
+        multipliers: (N, G, 4) or (N, 4G) multipliers applied to each gate's
+            [y_min, y_max, k, n], gate major.
+
+    Returns:
+        (N,) scores. Non finite scores (e.g. from a zero response) come back
+        as -inf so that maximizers never prefer them.
+    '''
+    multipliers = np.asarray(multipliers, dtype=np.float64)
+    multipliers = multipliers.reshape(
+        multipliers.shape[0],
+        circuit.gate_count,
+        len(PARAMETER_NAMES),
+    )
+    with np.errstate(all='ignore'):
+        scores = np.asarray(circuit.score(
+            y_min=circuit.y_min * multipliers[:, :, 0],
+            y_max=circuit.y_max * multipliers[:, :, 1],
+            k=circuit.k * multipliers[:, :, 2],
+            n=circuit.n * multipliers[:, :, 3],
+        ), dtype=np.float64).reshape(-1)
+    scores[~np.isfinite(scores)] = float('-inf')
+    return scores
+
+
+def edit_multipliers(edits: np.ndarray) -> np.ndarray:
+    '''
+    Converts edit multipliers into parameter multipliers.
+
+    Args:
+        edits: (..., 2) DNA only or (..., 4) DNA and protein edit multipliers,
+            ordered as `EDIT_NAMES`.
+
+    Returns:
+        (..., 4) multipliers on [y_min, y_max, k, n].
+    '''
+    edits = _pad_edits(edits)
+    expression, rbs, stretch, slope = np.moveaxis(edits, -1, 0)
+    return np.stack([
+        expression / stretch,
+        expression * stretch,
+        rbs,
+        slope,
+    ], axis=-1)
+
+
+def edit_counts(edits: np.ndarray, tolerance: float = EDIT_TOLERANCE):
+    '''
+    Args:
+        edits: (..., 2) or (..., 4) edit multipliers.
+        tolerance: Log distance from one below which a multiplier is no edit.
+
+    Returns:
+        (dna edits, protein edits), each summed over the last axis.
+    '''
+    changed = np.abs(np.log(_pad_edits(edits))) > tolerance
+    return (
+        changed[..., :DNA_EDIT_COUNT].sum(axis=-1),
+        changed[..., DNA_EDIT_COUNT:].sum(axis=-1),
+    )
+
+
+def score_edits(circuit: Circuit, edits: np.ndarray) -> np.ndarray:
+    '''
+    Scores many edited variants of a circuit at once.
+
+    Args:
+        circuit: The nominal circuit.
+        edits: (N, G, V) or (N, G * V) edit multipliers, with V 2 (DNA only)
+            or 4 (DNA and protein).
+
+    Returns:
+        (N,) scores, as `score_multipliers`.
+    '''
+    edits = np.asarray(edits, dtype=np.float64)
+    edits = edits.reshape(edits.shape[0], circuit.gate_count, -1)
+    return score_multipliers(circuit, edit_multipliers(edits))
+
+
+def apply_edits(
+        circuit: Circuit,
+        edits: np.ndarray,
+        tolerance: float = EDIT_TOLERANCE,
+) -> Circuit:
+    '''
+    Args:
+        circuit: The nominal circuit.
+        edits: (G, V) or (G * V,) edit multipliers.
+        tolerance: Log distance from one below which a multiplier is no edit.
+
+    Returns:
+        A copy of the circuit with the edits applied and its `dna_edits` and
+        `protein_edits` counters incremented.
+    '''
+    edits = np.asarray(edits, dtype=np.float64).reshape(circuit.gate_count, -1)
+    multipliers = edit_multipliers(edits)
+    edited = circuit.copy()
+    for column, name in enumerate(PARAMETER_NAMES):
+        getattr(edited, name)[:] *= multipliers[:, column]
+    dna, protein = edit_counts(edits, tolerance)
+    edited.dna_edits += dna
+    edited.protein_edits += protein
+    return edited
+
+
+def parallel_map_chunks(
+        function: Callable[[np.ndarray], np.ndarray],
+        matrix: np.ndarray,
+        n_jobs: int = 1,
+        chunk_size: int = 4096,
+) -> np.ndarray:
+    '''
+    Applies a batched function to row chunks of a matrix and concatenates the
+    results, in order.
+
+    Args:
+        function: Maps an (n, ...) chunk to an (n,) array. Must be picklable
+            when `n_jobs` is not 1 (module level functions and `partial`s of
+            them are).
+        matrix: The rows to evaluate.
+        n_jobs: Worker processes to use. 1 runs in process, -1 uses every
+            core.
+        chunk_size: Rows per chunk.
+
+    Returns:
+        The concatenated results.
+    '''
+    matrix = np.asarray(matrix)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if len(matrix) == 0:
+        return np.empty(0)
+    chunks = [
+        matrix[start:start + chunk_size]
+        for start in range(0, len(matrix), chunk_size)
+    ]
+    if n_jobs == 1 or len(chunks) == 1:
+        return np.concatenate([function(chunk) for chunk in chunks])
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(chunks))) as pool:
+        return np.concatenate(list(pool.map(function, chunks)))
+
+
+def circuit_scorer(circuit: Circuit) -> Callable[[np.ndarray], np.ndarray]:
+    '''
+    Returns:
+        A picklable function scoring multiplier matrices for `circuit`.
+    '''
+    return partial(score_multipliers, circuit)
+
+
+def edit_scorer(circuit: Circuit) -> Callable[[np.ndarray], np.ndarray]:
+    '''
+    Returns:
+        A picklable function scoring edit multiplier matrices for `circuit`.
+    '''
+    return partial(score_edits, circuit)
+
+
+def _pad_edits(edits: np.ndarray) -> np.ndarray:
+    edits = np.asarray(edits, dtype=np.float64)
+    if edits.shape[-1] == len(EDIT_NAMES):
+        return edits
+    if edits.shape[-1] != DNA_EDIT_COUNT:
+        raise RuntimeError(
+            f'Expected {DNA_EDIT_COUNT} or {len(EDIT_NAMES)} edit multipliers '
+            f'per gate, got {edits.shape[-1]}.'
+        )
+    padding = np.ones(edits.shape[:-1] + (len(EDIT_NAMES) - DNA_EDIT_COUNT,))
+    return np.concatenate([edits, padding], axis=-1)
@@ -0,0 +1,348 @@
+"""
+backend.solvers.budget
+
+Edit budget constrained circuit optimization.
+
+Given a circuit and a budget of at most M gates that may be altered, we have
+to pick which gates to edit as well as how. Enumerating every subset stops
+being practical past a handful of gates, so the subsets are searched with
+branch and bound:
+
+    - Gates are ordered by how much editing them alone helps.
+    - A node fixes some gates as edited and leaves the ones later in the order
+      undecided. Editing more gates never hurts (an edit multiplier of one is
+      no edit), so the best score when editing every gate the node could
+      still choose bounds everything below it.
+    - Nodes whose bound can't beat the best complete design are pruned.
+
+Every subset optimization (bound or leaf) is cached by its gate set, as the
+same sets come up under different branches, and each wave of nodes is solved
+in parallel. A superset's solve starts from the best cached solutions of its
+subsets, so its value never falls below theirs.
+
+The per subset optimum is itself found by sampling and local refinement, so
+a bound is a heuristic estimate of the true best score below a node, not a
+guarantee: a subset solved later can still beat the bound that pruned it.
+The search is therefore a heuristic, if a thorough one, and not exact.
+
+W.R. Jackson 2020
+"""
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import (
+    Dict,
+    FrozenSet,
+    List,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+from scipy import optimize as opt
+
+from backend.datastructures import (
+    Circuit,
+    Repressor,
+)
+from backend.solvers.batch import (
+    DNA_EDIT_COUNT,
+    EDIT_NAMES,
+    apply_edits,
+    score_edits,
+)
+from backend.solvers.pareto import DEFAULT_EDIT_BOUNDS
+
+# Stand-in objective value for parameter sets that produce no finite score.
+_INVALID_OBJECTIVE = 1e6
+
+
+@dataclass
+class BudgetResult:
+    '''
+    The search is heuristic (see the module docstring): `score` is the best
+    found, not a proven optimum.
+
+    Attributes:
+        score: Best score found.
+        gates: Labels of the gates edited, at most the budget.
+        edits: (G, V) edit multipliers, ones for untouched gates.
+        circuit: The edited circuit, with its edit counters filled in.
+        subsets_solved: Number of distinct gate subsets optimized.
+        nodes_pruned: Number of search nodes discarded by their bound.
+    '''
+    score: float
+    gates: List[str]
+    edits: np.ndarray
+    circuit: Circuit
+    subsets_solved: int
+    nodes_pruned: int
+
+
+def budget_optimize(
+        circuit: Union[Circuit, Repressor],
+        max_gates: int,
+        bio_optimization: str = 'DNA',
+        bounds: Sequence[Tuple[float, float]] = None,
+        samples: int = 256,
+        seed: int = 0,
+        n_jobs: int = 1,
+) -> BudgetResult:
+    '''
+    Optimizes a circuit while editing at most `max_gates` of its gates.
+
+    Args:
+        circuit: The circuit (or its output repressor) to optimize.
+        max_gates: The edit budget, e.g. `--repressor-max`.
+        bio_optimization: 'DNA' for promoter/RBS edits only, 'ALL' to include
+            protein edits.
+        bounds: (low, high) multiplier bounds per edit type; defaults to
+            `DEFAULT_EDIT_BOUNDS`.
+        samples: Batched random samples scored per subset before refining the
+            best one with L-BFGS-B.
+        seed: Seed for the per subset sampling.
+        n_jobs: Worker processes used to solve subsets. -1 uses every core.
+
+    Returns:
+        The best design found within budget.
+    '''
+    if isinstance(circuit, Repressor):
+        circuit = Circuit.from_repressor(circuit)
+    if max_gates < 0:
+        raise RuntimeError('The edit budget can not be negative.')
+    if bio_optimization == 'DNA':
+        edit_types = DNA_EDIT_COUNT
+    elif bio_optimization == 'ALL':
+        edit_types = len(EDIT_NAMES)
+    else:
+        raise RuntimeError(
+            f'Unable to find requested bio optimization {bio_optimization}'
+        )
+    log_bounds = np.log(np.asarray(
+        bounds if bounds is not None else DEFAULT_EDIT_BOUNDS,
+        dtype=np.float64,
+    )[:edit_types])
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    search = _BranchAndBound(
+        circuit,
+        min(max_gates, circuit.gate_count),
+        edit_types,
+        log_bounds,
+        samples,
+        seed,
+        n_jobs,
+    )
+    return search.run()
+
+
+class _BranchAndBound:
+    '''
+    State of one budgeted search; see the module docstring.
+    '''
+
+    def __init__(
+            self,
+            circuit: Circuit,
+            budget: int,
+            edit_types: int,
+            log_bounds: np.ndarray,
+            samples: int,
+            seed: int,
+            n_jobs: int,
+    ):
+        self.circuit = circuit
+        self.budget = budget
+        self.edit_types = edit_types
+        self.log_bounds = log_bounds
+        self.samples = samples
+        self.seed = seed
+        self.n_jobs = n_jobs
+        self.cache: Dict[FrozenSet[int], Tuple[float, np.ndarray]] = {}
+        self.nodes_pruned = 0
+        self._pool = None
+
+    def run(self) -> BudgetResult:
+        if self.n_jobs > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_jobs)
+        try:
+            best_set = self._search()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+        return self._result(best_set)
+
+    def _search(self) -> FrozenSet[int]:
+        gate_count = self.circuit.gate_count
+        everything = frozenset(range(gate_count))
+        self.solve([frozenset()])
+        if self.budget >= gate_count:
+            self.solve([everything])
+            return everything
+        if self.budget == 0:
+            return frozenset()
+        singles = [frozenset([gate]) for gate in range(gate_count)]
+        self.solve(singles)
+        # After the singles, so it starts from the best of them.
+        self.solve([everything])
+        # Branch on the most useful gates first so good incumbents turn up
+        # early.
+        order = sorted(
+            range(gate_count),
+            key=lambda gate: -self.cache[frozenset([gate])][0],
+        )
+        best_set = max(singles, key=lambda gates: self.cache[gates][0])
+        # Nodes are (-bound, included gates, next position in order).
+        heap = [(-self.cache[everything][0], (), 0)]
+        while heap:
+            incumbent = self.cache[best_set][0]
+            wave = []
+            while heap and len(wave) < max(self.n_jobs, 1) * 4:
+                bound, included, position = heapq.heappop(heap)
+                if -bound <= incumbent:
+                    self.nodes_pruned += 1
+                    continue
+                wave.append((included, position))
+            children = [
+                (included + (order[index],), index + 1)
+                for included, position in wave
+                for index in range(position, gate_count)
+            ]
+            reaches = [self._reach(*child, order) for child in children]
+            self.solve(reaches)
+            for (included, position), reach in zip(children, reaches):
+                value = self.cache[reach][0]
+                if len(reach) <= self.budget:
+                    # Everything this node could still add fits in the
+                    # budget, so its bound is achievable.
+                    if value > self.cache[best_set][0]:
+                        best_set = reach
+                elif value > self.cache[best_set][0]:
+                    heapq.heappush(heap, (-value, included, position))
+                else:
+                    self.nodes_pruned += 1
+        return best_set
+
+    def _reach(
+            self,
+            included: Tuple[int, ...],
+            position: int,
+            order: List[int],
+    ) -> FrozenSet[int]:
+        '''
+        Every gate a node could end up editing. Nodes that have used up the
+        budget can't add anything more.
+        '''
+        if len(included) >= self.budget:
+            return frozenset(included)
+        return frozenset(included) | frozenset(order[position:])
+
+    def solve(self, subsets: List[FrozenSet[int]]):
+        '''
+        Optimizes each uncached subset, in parallel when configured.
+        '''
+        pending = list(dict.fromkeys(
+            subset for subset in subsets if subset not in self.cache
+        ))
+        tasks = [
+            (
+                self.circuit,
+                tuple(sorted(subset)),
+                self.edit_types,
+                self.log_bounds,
+                self.samples,
+                self.seed,
+                self._seeds(subset),
+            )
+            for subset in pending
+        ]
+        if self._pool is not None and len(tasks) > 1:
+            results = list(self._pool.map(_optimize_subset, tasks))
+        else:
+            results = [_optimize_subset(task) for task in tasks]
+        for subset, result in zip(pending, results):
+            self.cache[subset] = result
+
+    def _seeds(self, subset: FrozenSet[int], count: int = 4) -> np.ndarray:
+        '''
+        The best cached solutions of a subset's proper subsets, laid out as
+        genomes of the subset (zero, i.e. no edit, for the other gates).
+
+        Returns:
+            (<= count, len(subset) * V) starting genomes.
+        '''
+        solved = sorted(
+            (
+                (score, gates, genome)
+                for gates, (score, genome) in self.cache.items()
+                if gates < subset and np.isfinite(score)
+            ),
+            key=lambda item: -item[0],
+        )[:count]
+        rows = {gate: row for row, gate in enumerate(sorted(subset))}
+        seeds = np.zeros((len(solved), len(subset), self.edit_types))
+        for seed, (_, gates, genome) in zip(seeds, solved):
+            seed[[rows[gate] for gate in sorted(gates)]] = genome
+        return seeds.reshape(len(solved), len(subset) * self.edit_types)
+
+    def _result(self, gates: FrozenSet[int]) -> BudgetResult:
+        score, genome = self.cache[gates]
+        edits = np.ones((self.circuit.gate_count, self.edit_types))
+        edits[sorted(gates)] = np.exp(genome)
+        return BudgetResult(
+            score=float(score),
+            gates=[self.circuit.gate_labels[gate] for gate in sorted(gates)],
+            edits=edits,
+            circuit=apply_edits(self.circuit, edits),
+            subsets_solved=len(self.cache),
+            nodes_pruned=self.nodes_pruned,
+        )
+
+
+def _optimize_subset(task) -> Tuple[float, np.ndarray]:
+    '''
+    Best score when only the given gates may be edited: a batch of random
+    samples, plus any seed genomes, followed by L-BFGS-B from the best one.
+    Seeds are scored as they are, even outside the bounds, since no edit on
+    a gate is always available. Module level so it can be shipped to worker
+    processes.
+
+    Returns:
+        (score, (len(gates), V) log edit multipliers).
+    '''
+    circuit, gates, edit_types, log_bounds, samples, seed, seeds = task
+    if not gates:
+        return float(circuit.score()), np.zeros((0, edit_types))
+    generator = np.random.default_rng([seed, *gates])
+    low = np.tile(log_bounds[:, 0], len(gates))
+    high = np.tile(log_bounds[:, 1], len(gates))
+    candidates = generator.uniform(low, high, (samples, len(low)))
+    candidates[0] = 0
+    candidates = np.vstack([candidates, seeds])
+
+    def score(genomes: np.ndarray) -> np.ndarray:
+        edits = np.ones((len(genomes), circuit.gate_count, edit_types))
+        edits[:, list(gates)] = np.exp(genomes).reshape(
+            len(genomes), len(gates), edit_types,
+        )
+        return score_edits(circuit, edits)
+
+    def objective(genome: np.ndarray) -> float:
+        value = score(genome[None])[0]
+        return -value if np.isfinite(value) else _INVALID_OBJECTIVE
+
+    scores = score(candidates)
+    start = candidates[np.argmax(scores)]
+    best_score, best = float(np.max(scores)), start
+    refined = opt.minimize(
+        objective,
+        start,
+        method='L-BFGS-B',
+        bounds=list(zip(low, high)),
+    )
+    if -refined.fun > best_score:
+        best_score, best = float(-refined.fun), refined.x
+    return best_score, best.reshape(len(gates), edit_types)
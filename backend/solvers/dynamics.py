@@ -0,0 +1,211 @@
+"""
+backend.solvers.dynamics
+
+Dynamic simulation of circuits across input transitions.
+
+The rest of the backend only looks at steady states. Here every gate's output
+is a protein level with first order production and degradation,
+
+    dy/dt = gamma * (H(x) - y),
+
+where H is the gate's Hill response to its summed input x (the same y_min,
+y_max, K and n) and gamma its degradation/dilution rate, so the steady states
+are exactly those of `Circuit.simulate`. Every one of the 2^n x 2^n input
+transitions starts from the steady state of its first row and switches to
+its second at t = 0. All of them are stacked into one stiff system with a
+block diagonal Jacobian and integrated together with BDF, rather than one
+solver call per transition.
+
+W.R. Jackson 2020
+"""
+from dataclasses import dataclass
+from typing import Union
+
+import numpy as np
+from scipy import sparse
+from scipy.integrate import solve_ivp
+
+from backend.datastructures import (
+    Circuit,
+    Repressor,
+    response_function,
+)
+
+
+@dataclass
+class TransitionReport:
+    '''
+    All arrays indexed [from row, to row] are over truth table rows in
+    `Circuit.truth_table_bits` order. Levels are compared in log10 space,
+    since gate outputs span decades.
+
+    Attributes:
+        times: (N,) sample times, in units of 1 / degradation rate.
+        output: (N, R, R) output gate level over time for every transition.
+        steady_states: (R, G) steady state of every gate per row.
+        settling_time: (R, R) time after which the output stays within the
+            tolerance of its final level; inf if it never settles in the
+            simulated window.
+        overshoot: (R, R) how far, in decades, the output travels past its
+            final level.
+        glitch: (R, R) for transitions that shouldn't change the output's
+            logic level, the largest excursion from it in decades; NaN for
+            the others.
+    '''
+    times: np.ndarray
+    output: np.ndarray
+    steady_states: np.ndarray
+    settling_time: np.ndarray
+    overshoot: np.ndarray
+    glitch: np.ndarray
+
+    @property
+    def worst_settling_time(self) -> float:
+        return float(np.max(self.settling_time))
+
+    @property
+    def worst_glitch(self) -> float:
+        glitches = self.glitch[np.isfinite(self.glitch)]
+        return float(glitches.max()) if len(glitches) else 0.0
+
+
+def simulate_transitions(
+        circuit: Union[Circuit, Repressor],
+        degradation: Union[float, np.ndarray] = 1.0,
+        duration: float = None,
+        samples: int = 200,
+        tolerance: float = 0.05,
+        rtol: float = 1e-6,
+        atol: float = 1e-9,
+) -> TransitionReport:
+    '''
+    Integrates every input transition of a circuit in one stiff system.
+
+    Args:
+        circuit: The circuit (or its output repressor).
+        degradation: Degradation rate, one for every gate or (G,) per gate.
+        duration: Simulated time. Defaults to ten time constants of the
+            slowest gate per level of circuit depth.
+        samples: Number of evenly spaced sample times.
+        tolerance: Settling band around the final level, in decades.
+        rtol, atol: Solver tolerances.
+
+    Returns:
+        The transition report.
+    '''
+    if isinstance(circuit, Repressor):
+        circuit = Circuit.from_repressor(circuit)
+    gate_count = circuit.gate_count
+    gamma = np.broadcast_to(
+        np.asarray(degradation, dtype=np.float64),
+        (gate_count,),
+    )
+    if duration is None:
+        duration = 10.0 * (circuit.depths().max() + 1) / gamma.min()
+    bits = circuit.truth_table_bits()
+    rows = len(bits)
+    steady = circuit.simulate(bits=bits)
+    signals = circuit.signal_inputs(bits)
+    # Every (from, to) pair: start from `from`, drive with `to`'s signals.
+    transitions = rows * rows
+    start = np.repeat(steady, rows, axis=0)
+    drive = np.tile(signals, (rows, 1))
+
+    # Gate to gate wiring, wiring[j, g] = 1 when gate j feeds gate g.
+    sources, targets = [], []
+    for gate in range(gate_count):
+        for node in circuit.gate_inputs(gate):
+            if node >= circuit.signal_count:
+                sources.append(node - circuit.signal_count)
+                targets.append(gate)
+    sources = np.array(sources, dtype=np.int64)
+    targets = np.array(targets, dtype=np.int64)
+    wiring = sparse.csr_matrix(
+        (np.ones(len(sources)), (sources, targets)),
+        shape=(gate_count, gate_count),
+    )
+    parameters = (circuit.y_min, circuit.y_max, circuit.k, circuit.n)
+
+    def inputs(state: np.ndarray) -> np.ndarray:
+        return drive + (wiring.T @ state.T).T
+
+    def derivative(_, flat: np.ndarray) -> np.ndarray:
+        state = flat.reshape(transitions, gate_count)
+        with np.errstate(all='ignore'):
+            production = response_function(inputs(state), *parameters)
+        return (gamma * (production - state)).ravel()
+
+    # Block diagonal Jacobian: -gamma on the diagonal, gamma * H'(x) where a
+    # gate feeds another.
+    offsets = np.arange(transitions)[:, None] * gate_count
+    diagonal = (offsets + np.arange(gate_count)).ravel()
+    jacobian_rows = np.concatenate([diagonal, (offsets + targets).ravel()])
+    jacobian_columns = np.concatenate([diagonal, (offsets + sources).ravel()])
+    size = transitions * gate_count
+
+    def jacobian(_, flat: np.ndarray):
+        state = flat.reshape(transitions, gate_count)
+        x = inputs(state)[:, targets]
+        y_min, y_max, k, n = (parameter[targets] for parameter in parameters)
+        with np.errstate(all='ignore'):
+            ratio = (np.maximum(x, 0) / k) ** n
+            slope = -(y_max - y_min) * n * ratio / \
+                (np.maximum(x, 1e-300) * (1.0 + ratio) ** 2)
+        values = np.concatenate([
+            np.tile(-gamma, transitions),
+            (gamma[targets] * np.nan_to_num(slope)).ravel(),
+        ])
+        return sparse.csr_matrix(
+            (values, (jacobian_rows, jacobian_columns)),
+            shape=(size, size),
+        )
+
+    times = np.linspace(0.0, duration, samples)
+    solution = solve_ivp(
+        derivative,
+        (0.0, duration),
+        start.ravel(),
+        method='BDF',
+        t_eval=times,
+        jac=jacobian,
+        rtol=rtol,
+        atol=atol,
+    )
+    if not solution.success:
+        raise RuntimeError(f'Integration failed: {solution.message}')
+    trajectories = solution.y.reshape(transitions, gate_count, samples)
+    output = trajectories[:, circuit.output].T.reshape(samples, rows, rows)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        levels = np.log10(np.maximum(output, 1e-300))
+    final = np.log10(steady[:, circuit.output])[None, :]
+    initial = np.log10(steady[:, circuit.output])[:, None]
+    deviation = levels - final[None]
+    outside = np.abs(deviation) > tolerance
+    # Last sample outside the band; settled from the one after it.
+    last_outside = samples - 1 - np.argmax(outside[::-1], axis=0)
+    settling_time = np.where(
+        outside.any(axis=0),
+        times[np.minimum(last_outside + 1, samples - 1)],
+        0.0,
+    )
+    settling_time[outside[-1]] = np.inf
+    direction = np.sign(final - initial)
+    overshoot = np.maximum(np.max(direction * deviation, axis=0), 0.0)
+    overshoot[direction == 0] = 0.0
+    logic = circuit.logic_outputs(bits)[:, circuit.output]
+    unchanged = (logic[:, None] == logic[None, :]) & \
+        ~np.eye(rows, dtype=bool)
+    glitch = np.where(
+        unchanged,
+        np.max(np.abs(deviation), axis=0),
+        np.nan,
+    )
+    return TransitionReport(
+        times=times,
+        output=output,
+        steady_states=steady,
+        settling_time=settling_time,
+        overshoot=overshoot,
+        glitch=glitch,
+    )
@@ -0,0 +1,282 @@
+"""
+backend.solvers.optimize_circuit
+
+Joint optimization of every gate in a circuit.
+
+`optimize_repressor` tunes one repressor with everything upstream held fixed,
+so a cascade had to be tuned gate by gate. Here every gate's edit multipliers
+form one parameter vector. Searching that whole vector at once gets expensive
+on larger circuits, so the search runs as block coordinate ascent over the
+DAG: gates at the same topological depth form a block, and while a block is
+being tuned only its fan-out cone is re-simulated, with every other gate's
+response reused from the current design. A final joint L-BFGS-B pass polishes
+all gates together.
+
+W.R. Jackson 2020
+"""
+from dataclasses import dataclass
+from typing import (
+    List,
+    Union,
+)
+
+import numpy as np
+from scipy import optimize as opt
+
+from backend.datastructures import (
+    Circuit,
+    Repressor,
+    score_responses,
+)
+from backend.solvers.batch import (
+    DNA_EDIT_COUNT,
+    EDIT_NAMES,
+    apply_edits,
+    edit_multipliers,
+)
+from backend.solvers.pareto import DEFAULT_EDIT_BOUNDS
+
+# Stand-in objective value for parameter sets that produce no finite score.
+_INVALID_OBJECTIVE = 1e6
+
+
+@dataclass
+class CircuitOptimizationResult:
+    '''
+    Attributes:
+        score: Best score found.
+        initial_score: Score before any edits, even if the bounds exclude
+            the unedited design.
+        edits: (G, V) edit multipliers, V being 2 (DNA) or 4 (ALL).
+        circuit: The edited circuit, with its edit counters filled in.
+        blocks: Gate indices of each block, in the order they were tuned.
+        sweeps: Number of passes over the blocks.
+        evaluations: Number of parameter sets scored.
+    '''
+    score: float
+    initial_score: float
+    edits: np.ndarray
+    circuit: Circuit
+    blocks: List[np.ndarray]
+    sweeps: int
+    evaluations: int
+
+
+def optimize_circuit(
+        circuit: Union[Circuit, Repressor],
+        bio_optimization: str = 'DNA',
+        bounds: np.ndarray = None,
+        max_block_size: int = 8,
+        sweeps: int = 5,
+        samples: int = 128,
+        tolerance: float = 1e-4,
+        polish: bool = True,
+        seed: int = None,
+) -> CircuitOptimizationResult:
+    '''
+    Optimizes the edit multipliers of every gate in a circuit jointly.
+
+    Args:
+        circuit: The circuit (or its output repressor) to optimize.
+        bio_optimization: 'DNA' for promoter/RBS edits only, 'ALL' to include
+            protein edits.
+        bounds: (low, high) multiplier bounds, either (V, 2) for every gate or
+            (G, V, 2) per gate. A gate bounded to (1, 1) is left untouched.
+            Defaults to `DEFAULT_EDIT_BOUNDS`.
+        max_block_size: Largest number of gates tuned together; wider
+            topological levels are split.
+        sweeps: Maximum number of passes over the blocks.
+        samples: Random candidates scored per block per sweep before the
+            L-BFGS-B refinement.
+        tolerance: Stop once a sweep improves the score by less than this.
+        polish: Whether to finish with a joint L-BFGS-B pass over all gates.
+        seed: Seed for the block sampling.
+
+    Returns:
+        The optimized design.
+    '''
+    if isinstance(circuit, Repressor):
+        circuit = Circuit.from_repressor(circuit)
+    if bio_optimization == 'DNA':
+        edit_types = DNA_EDIT_COUNT
+    elif bio_optimization == 'ALL':
+        edit_types = len(EDIT_NAMES)
+    else:
+        raise RuntimeError(
+            f'Unable to find requested bio optimization {bio_optimization}'
+        )
+    evaluator = _CircuitEvaluator(circuit, edit_types)
+    low, high = _log_bounds(bounds, circuit.gate_count, edit_types)
+    generator = np.random.default_rng(seed)
+    blocks = _blocks(circuit, max_block_size)
+
+    genome = np.zeros((circuit.gate_count, edit_types))
+    initial_score = evaluator.score_full(genome[None])[0]
+    # Start from the unedited design, or its nearest point when the bounds
+    # exclude it, so every design kept is within the bounds.
+    genome = np.clip(genome, low, high)
+    best_score = evaluator.score_full(genome[None])[0]
+    if not np.isfinite(best_score):
+        best_score = -np.inf
+    sweep = 0
+    for sweep in range(1, sweeps + 1):
+        sweep_start = best_score
+        for block in blocks:
+            cone = circuit.fanout_cone(block)
+            responses = evaluator.responses(genome)
+            block_low = low[block].ravel()
+            block_high = high[block].ravel()
+
+            def score_block(candidates: np.ndarray) -> np.ndarray:
+                genomes = np.repeat(genome[None], len(candidates), axis=0)
+                genomes[:, block] = candidates.reshape(
+                    len(candidates), len(block), edit_types,
+                )
+                return evaluator.score_cone(genomes, responses, cone)
+
+            candidates = generator.uniform(
+                block_low,
+                block_high,
+                (samples, len(block_low)),
+            )
+            candidates[0] = genome[block].ravel()
+            scores = score_block(candidates)
+            start = candidates[np.argmax(scores)]
+            refined = opt.minimize(
+                lambda x: _objective(score_block(x[None])[0]),
+                start,
+                method='L-BFGS-B',
+                bounds=list(zip(block_low, block_high)),
+            )
+            evaluator.evaluations += refined.nfev
+            score, point = max(
+                (float(np.max(scores)), start),
+                (float(-refined.fun), refined.x),
+                key=lambda pair: pair[0],
+            )
+            if score > best_score:
+                best_score = score
+                genome[block] = point.reshape(len(block), edit_types)
+        if best_score - sweep_start < tolerance:
+            break
+
+    if polish:
+        refined = opt.minimize(
+            lambda x: _objective(evaluator.score_full(
+                x.reshape(1, circuit.gate_count, edit_types)
+            )[0]),
+            genome.ravel(),
+            method='L-BFGS-B',
+            bounds=list(zip(low.ravel(), high.ravel())),
+        )
+        evaluator.evaluations += refined.nfev
+        if -refined.fun > best_score:
+            best_score = float(-refined.fun)
+            genome = refined.x.reshape(circuit.gate_count, edit_types)
+
+    edits = np.exp(genome)
+    return CircuitOptimizationResult(
+        score=float(best_score),
+        initial_score=float(initial_score),
+        edits=edits,
+        circuit=apply_edits(circuit, edits),
+        blocks=blocks,
+        sweeps=sweep,
+        evaluations=evaluator.evaluations,
+    )
+
+
+class _CircuitEvaluator:
+    '''
+    Scores log edit multipliers, either by simulating the whole circuit or
+    only a fan-out cone on top of cached responses.
+    '''
+
+    def __init__(self, circuit: Circuit, edit_types: int):
+        self.circuit = circuit
+        self.edit_types = edit_types
+        self.bits = circuit.truth_table_bits()
+        self.logic = circuit.logic_outputs(self.bits)[:, circuit.output]
+        self.evaluations = 0
+
+    def parameters(self, genomes: np.ndarray) -> dict:
+        multipliers = edit_multipliers(np.exp(genomes))
+        circuit = self.circuit
+        return {
+            'y_min': circuit.y_min * multipliers[..., 0],
+            'y_max': circuit.y_max * multipliers[..., 1],
+            'k': circuit.k * multipliers[..., 2],
+            'n': circuit.n * multipliers[..., 3],
+        }
+
+    def responses(self, genome: np.ndarray) -> np.ndarray:
+        with np.errstate(all='ignore'):
+            return self.circuit.simulate(
+                bits=self.bits,
+                **self.parameters(genome),
+            )
+
+    def score_full(self, genomes: np.ndarray) -> np.ndarray:
+        self.evaluations += len(genomes)
+        with np.errstate(all='ignore'):
+            responses = self.circuit.simulate(
+                bits=self.bits,
+                **self.parameters(genomes),
+            )
+        return self._score(responses)
+
+    def score_cone(
+            self,
+            genomes: np.ndarray,
+            responses: np.ndarray,
+            cone: np.ndarray,
+    ) -> np.ndarray:
+        self.evaluations += len(genomes)
+        with np.errstate(all='ignore'):
+            responses = self.circuit.simulate(
+                bits=self.bits,
+                responses=responses,
+                gates=cone,
+                **self.parameters(genomes),
+            )
+        return self._score(responses)
+
+    def _score(self, responses: np.ndarray) -> np.ndarray:
+        with np.errstate(all='ignore'):
+            scores = np.asarray(score_responses(
+                responses[..., self.circuit.output],
+                self.logic,
+                self.circuit.active_low,
+            ), dtype=np.float64)
+        scores[~np.isfinite(scores)] = float('-inf')
+        return scores
+
+
+def _blocks(circuit: Circuit, max_block_size: int) -> List[np.ndarray]:
+    '''
+    Groups gates by topological depth, inputs first, splitting wide levels.
+    '''
+    depths = circuit.depths()
+    blocks = []
+    for depth in np.unique(depths):
+        level = np.flatnonzero(depths == depth)
+        for start in range(0, len(level), max(max_block_size, 1)):
+            blocks.append(level[start:start + max_block_size])
+    return blocks
+
+
+def _log_bounds(bounds, gate_count: int, edit_types: int):
+    bounds = np.asarray(
+        bounds if bounds is not None else DEFAULT_EDIT_BOUNDS,
+        dtype=np.float64,
+    )
+    if bounds.ndim == 2:
+        bounds = np.broadcast_to(bounds[None], (gate_count,) + bounds.shape)
+    if bounds.shape[0] != gate_count:
+        raise RuntimeError('Per gate bounds need one entry per gate.')
+    bounds = np.log(bounds[:, :edit_types])
+    return bounds[..., 0], bounds[..., 1]
+
+
+def _objective(score: float) -> float:
+    return -score if np.isfinite(score) else _INVALID_OBJECTIVE
@@ -4,20 +4,25 @@ backend.solvers.optimize_repressor
 W.R. Jackson 2020
 """
 import copy
-from typing import Callable
+from typing import (
+    Callable,
+    Union,
+)
 from functools import partial
 
 import numpy as np
 from scipy import optimize as opt
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 
-from backend.datastructures import Repressor
+from backend.datastructures import (
+    Repressor,
+    response_function,
+)
+from backend.solvers.surrogate import surrogate_minimize
 
 
 # ------------------------ Publicly Available Functions ------------------------
 def graph_response_function(
-        func: Callable,
+        func: Union[Callable, Repressor],
         start: int = 0.001,
         stop: int = 1000,
         number_of_observations: int = 1000000,
@@ -27,13 +32,18 @@ def graph_response_function(
     based graphs in the assignment.
 
     Args:
-        func: The function to graph.
+        func: The function to graph, or a repressor whose response function
+            to graph. Repressors are evaluated over the whole range at once.
         start: At what point to start the graph
         stop: At what point to stop the graph.
         number_of_observations: Number of observations to plot. Given the
             curvature of the sigmoidal functions, a very high observation
             count is recommended, or you will end up with angular graphs.
     '''
+    # matplotlib is slow to import and only needed for plotting.
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+
     x = np.linspace(start, stop, number_of_observations)
     fig = plt.figure()
     ax = fig.add_subplot(1, 1, 1)
@@ -43,14 +53,21 @@ def graph_response_function(
     ax.set_xscale('log')
     ax.yaxis.set_major_formatter(ticker.FormatStrFormatter('%0.3f'))
     ax.xaxis.set_major_formatter(ticker.FormatStrFormatter('%0.3f'))
-    plt.plot(x, list(map(func, x)))
+    if isinstance(func, Repressor):
+        y = func.response(x)
+    else:
+        y = list(map(func, x))
+    plt.plot(x, y)
     plt.show()
 
 
 def optimize_repressor(
         input_repressor: Repressor,
         optimization_method: str,
-        bio_optimization: str = 'DNA'
+        bio_optimization: str = 'DNA',
+        x0: np.ndarray = None,
+        warm_start=None,
+        seed: int = None,
 ):
     '''
     Monolithic entrypoint and wrapper around the optimization functionality
@@ -64,6 +81,13 @@ def optimize_repressor(
         optimization_method: Which optimization method to use, either through
             a global optimization method or through
         bio_optimization: What parts of the repressor optimize.
+        x0: Starting point for methods that take one. Defaults to no edit.
+        warm_start: A `WarmStartIndex` of previously solved gates. When passed
+            (and `x0` isn't), local methods start from the nearest solved
+            gate's solution and differential evolution seeds its population
+            with the nearest solutions.
+        seed: Seed for the stochastic global methods (dual annealing,
+            differential evolution and the surrogate), for repeatable runs.
 
     Returns:
 
@@ -88,6 +112,7 @@ def optimize_repressor(
         'differential-evolution',
         'shgo',
         'brute',
+        'surrogate',
     ]:
         bounds_list = []
         # I assume that practically messing with the ymin and ymax of a
@@ -102,23 +127,38 @@ def optimize_repressor(
             # Stretching can be 0:1.5
             bounds_list.append([0, 1.5])
             bounds_list.append([0, 1.05])
+        if x0 is None and warm_start is not None:
+            x0 = warm_start.initial_point(input_repressor, bounds_list)
         # Avg Run Time: 6000ms
         if optimization_method == 'dual_annealing':
             return opt.dual_annealing(
                 curried_optimize,
                 bounds=bounds_list,
+                x0=x0,
+                seed=seed,
             )
         # Avg Run Time: 4800ms
         if optimization_method == 'basin-hopping':
             return opt.basinhopping(
                 curried_optimize,
-                [1] * variable_count
+                x0 if x0 is not None else [1] * variable_count
             )
         # Avg Run Time: 195ms
         if optimization_method == 'differential-evolution':
+            init = 'latinhypercube'
+            if warm_start is not None and len(warm_start):
+                # Same population size as scipy's default of 15 per variable.
+                init = warm_start.initial_population(
+                    input_repressor,
+                    15 * variable_count,
+                    bounds_list,
+                    seed=seed,
+                )
             return opt.differential_evolution(
                 curried_optimize,
                 bounds=bounds_list,
+                init=init,
+                seed=seed,
             )
         # Avg Run Time: 9ms, but fails to actually converge to anything useful.
         # Upon casual research into the field of optimization, it's probably
@@ -134,6 +174,15 @@ def optimize_repressor(
                 curried_optimize,
                 ranges=bounds_list,
             )
+        # Gaussian process surrogate with expected improvement, for when each
+        # evaluation is expensive. 60 evaluations by default.
+        if optimization_method == 'surrogate':
+            return surrogate_minimize(
+                curried_optimize,
+                bounds=bounds_list,
+                x0=x0,
+                seed=seed,
+            )
     elif optimization_method in [
         'Nelder-Mead',
         'Powell',
@@ -150,9 +199,11 @@ def optimize_repressor(
         'trust-krylov',
         'trust-exact',
     ]:
+        if x0 is None and warm_start is not None:
+            x0 = warm_start.initial_point(input_repressor)
         return opt.minimize(
             curried_optimize,
-            [1] * variable_count,
+            x0 if x0 is not None else [1] * variable_count,
             method=optimization_method,
         )
     else:
@@ -226,12 +277,12 @@ def simple_calculate_response_function(x, coefficients: list) -> float:
     used in tandem with 'get_linear_coefficents' method of Repressor Gates.
 
     Args:
-        x: Input signal value.
+        x: Input signal value, or an array of them.
         coefficients: Linear coefficients. (ymin, ymax, k, n)
 
     Returns:
         The response function of the repressor.
 
     '''
-    y_min, y_max, k, n = map(np.float64, coefficients)
-    return y_min + ((y_max - y_min) / (1.0 + (x / k) ** n))
+    y_min, y_max, k, n = coefficients
+    return response_function(x, y_min, y_max, k, n)
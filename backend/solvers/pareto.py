@@ -0,0 +1,325 @@
+"""
+backend.solvers.pareto
+
+Multi-objective optimization of circuit score against edit cost.
+
+Every extra promoter, RBS or protein change costs lab time, so rather than
+maximizing score alone we search for the Pareto front of (score, edit cost)
+with NSGA-II. Candidates are per gate edit multipliers (the same ones
+`optimize_repressor` uses) held in log space, where zero means "leave this
+part alone", and each generation is scored as one batch, optionally spread
+across worker processes.
+
+W.R. Jackson 2020
+"""
+from dataclasses import dataclass
+from typing import (
+    List,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+from backend.datastructures import (
+    Circuit,
+    Repressor,
+)
+from backend.solvers.batch import (
+    DNA_EDIT_COUNT,
+    EDIT_NAMES,
+    EDIT_TOLERANCE,
+    apply_edits,
+    edit_counts,
+    edit_scorer,
+    parallel_map_chunks,
+)
+
+# Default (low, high) bounds of each edit multiplier. The DNA bounds follow the
+# spread of y_max and K seen across the standard E. coli UCF; the protein
+# bounds match the ones `optimize_repressor` uses for its global methods.
+DEFAULT_EDIT_BOUNDS = (
+    (0.1, 10.0),
+    (0.1, 10.0),
+    (1 / 1.5, 1.5),
+    (0.5, 1.05),
+)
+
+
+@dataclass
+class ParetoDesign:
+    '''
+    Attributes:
+        score: Circuit score with the edits applied.
+        cost: Edit cost, see `edit_cost`.
+        dna_edits: Number of DNA edits.
+        protein_edits: Number of protein edits.
+        edits: (G, V) edit multipliers, V being 2 (DNA) or 4 (ALL).
+        circuit: The edited circuit, with its edit counters filled in.
+    '''
+    score: float
+    cost: float
+    dna_edits: int
+    protein_edits: int
+    edits: np.ndarray
+    circuit: Circuit
+
+
+def edit_cost(
+        edits: np.ndarray,
+        magnitude_weight: float = 0.5,
+        dna_weight: float = 1.0,
+        protein_weight: float = 2.0,
+        tolerance: float = EDIT_TOLERANCE,
+) -> np.ndarray:
+    '''
+    Cost of a set of edits: a fixed charge per edited part plus a charge that
+    grows with how far each part is pushed from its characterized value.
+
+    Args:
+        edits: (..., G, V) edit multipliers.
+        magnitude_weight: Cost per unit of |log2(multiplier)|.
+        dna_weight: Cost of each DNA edit.
+        protein_weight: Cost of each protein edit. Protein engineering is
+            slower than swapping a promoter or RBS, hence the higher default.
+        tolerance: Log distance from one below which a multiplier is no edit.
+
+    Returns:
+        (...,) edit costs.
+    '''
+    edits = np.asarray(edits, dtype=np.float64)
+    dna, protein = edit_counts(edits, tolerance)
+    magnitude = np.abs(np.log2(edits)).sum(axis=-1)
+    return (
+        dna_weight * dna + protein_weight * protein +
+        magnitude_weight * magnitude
+    ).sum(axis=-1)
+
+
+def pareto_optimize(
+        circuit: Union[Circuit, Repressor],
+        bio_optimization: str = 'DNA',
+        population: int = 64,
+        generations: int = 60,
+        bounds: Sequence[Tuple[float, float]] = None,
+        magnitude_weight: float = 0.5,
+        dna_weight: float = 1.0,
+        protein_weight: float = 2.0,
+        seed: int = None,
+        n_jobs: int = 1,
+) -> List[ParetoDesign]:
+    '''
+    NSGA-II over per gate edit multipliers, maximizing score and minimizing
+    edit cost.
+
+    Args:
+        circuit: The circuit (or its output repressor) to edit.
+        bio_optimization: 'DNA' for promoter/RBS edits only, 'ALL' to include
+            protein edits.
+        population: Designs per generation.
+        generations: Number of generations.
+        bounds: (low, high) multiplier bounds per edit type; defaults to
+            `DEFAULT_EDIT_BOUNDS`.
+        magnitude_weight: See `edit_cost`.
+        dna_weight: See `edit_cost`.
+        protein_weight: See `edit_cost`.
+        seed: Seed for the search.
+        n_jobs: Worker processes used for scoring.
+
+    Returns:
+        The non-dominated designs, cheapest first.
+    '''
+    if isinstance(circuit, Repressor):
+        circuit = Circuit.from_repressor(circuit)
+    if bio_optimization == 'DNA':
+        edit_types = DNA_EDIT_COUNT
+    elif bio_optimization == 'ALL':
+        edit_types = len(EDIT_NAMES)
+    else:
+        raise RuntimeError(
+            f'Unable to find requested bio optimization {bio_optimization}'
+        )
+    bounds = np.log(np.asarray(
+        bounds if bounds is not None else DEFAULT_EDIT_BOUNDS,
+        dtype=np.float64,
+    )[:edit_types])
+    low = np.tile(bounds[:, 0], circuit.gate_count)
+    high = np.tile(bounds[:, 1], circuit.gate_count)
+    # Genes whose bounds allow leaving them unedited.
+    unedited = (low <= 0) & (high >= 0)
+    shape = (circuit.gate_count, edit_types)
+    generator = np.random.default_rng(seed)
+    scorer = edit_scorer(circuit)
+
+    def evaluate(genomes: np.ndarray) -> np.ndarray:
+        edits = np.exp(genomes)
+        scores = parallel_map_chunks(scorer, edits, n_jobs=n_jobs)
+        costs = edit_cost(
+            edits.reshape((-1,) + shape),
+            magnitude_weight,
+            dna_weight,
+            protein_weight,
+        )
+        # Both objectives minimized.
+        return np.stack([-scores, costs], axis=1)
+
+    # Start from the unedited design plus sparse random edits, so the cheap end
+    # of the front is populated from the first generation.
+    genomes = generator.uniform(low, high, (population, len(low)))
+    genomes[(generator.random(genomes.shape) >= 0.5) & unedited] = 0
+    genomes[0, unedited] = 0
+    objectives = evaluate(genomes)
+    ranks, crowding = _rank_and_crowd(objectives)
+    for _ in range(generations):
+        parents = _tournament(generator, ranks, crowding, population)
+        children = _vary(generator, genomes[parents], low, high)
+        combined = np.concatenate([genomes, children])
+        combined_objectives = np.concatenate([objectives, evaluate(children)])
+        ranks, crowding = _rank_and_crowd(combined_objectives)
+        survivors = np.lexsort((-crowding, ranks))[:population]
+        genomes = combined[survivors]
+        objectives = combined_objectives[survivors]
+        ranks, crowding = ranks[survivors], crowding[survivors]
+
+    front = np.flatnonzero(ranks == 0)
+    front = front[np.isfinite(objectives[front, 0])]
+    # Identical designs are common once the search converges.
+    _, unique = np.unique(genomes[front], axis=0, return_index=True)
+    front = front[unique]
+    front = front[np.argsort(objectives[front, 1], kind='stable')]
+    designs = []
+    for index in front:
+        edits = np.exp(genomes[index]).reshape(shape)
+        edited = apply_edits(circuit, edits)
+        designs.append(ParetoDesign(
+            score=float(-objectives[index, 0]),
+            cost=float(objectives[index, 1]),
+            dna_edits=int((edited.dna_edits - circuit.dna_edits).sum()),
+            protein_edits=int(
+                (edited.protein_edits - circuit.protein_edits).sum()
+            ),
+            edits=edits,
+            circuit=edited,
+        ))
+    return designs
+
+
+def cheapest_design(
+        front: List[ParetoDesign],
+        minimum_score: float,
+) -> Union[ParetoDesign, None]:
+    '''
+    Args:
+        front: Output of `pareto_optimize`.
+        minimum_score: The score the design has to reach.
+
+    Returns:
+        The lowest cost design meeting the score, or None if none do.
+    '''
+    meeting = [design for design in front if design.score >= minimum_score]
+    if not meeting:
+        return None
+    return min(meeting, key=lambda design: design.cost)
+
+
+# ----------------------------------- NSGA-II ----------------------------------
+def _rank_and_crowd(objectives: np.ndarray):
+    '''
+    Fast non-dominated sort plus crowding distance.
+
+    Args:
+        objectives: (P, M) objectives, all minimized. Non finite values are
+            treated as infinitely bad.
+
+    Returns:
+        (P,) front index (0 is non-dominated) and (P,) crowding distance.
+    '''
+    objectives = np.where(np.isfinite(objectives), objectives, np.inf)
+    no_worse = np.all(objectives[:, None, :] <= objectives[None, :, :], axis=2)
+    better = np.any(objectives[:, None, :] < objectives[None, :, :], axis=2)
+    # dominates[i, j]: i dominates j.
+    dominates = no_worse & better
+    domination_count = dominates.sum(axis=0)
+    ranks = np.full(len(objectives), -1, dtype=np.int64)
+    current = np.flatnonzero(domination_count == 0)
+    rank = 0
+    while len(current):
+        ranks[current] = rank
+        domination_count = domination_count - dominates[current].sum(axis=0)
+        domination_count[ranks >= 0] = -1
+        current = np.flatnonzero(domination_count == 0)
+        rank += 1
+    crowding = np.zeros(len(objectives))
+    for front in range(rank):
+        members = np.flatnonzero(ranks == front)
+        if len(members) <= 2:
+            crowding[members] = np.inf
+            continue
+        for column in range(objectives.shape[1]):
+            values = objectives[members, column]
+            order = np.argsort(values, kind='stable')
+            span = values[order[-1]] - values[order[0]]
+            crowding[members[order[[0, -1]]]] = np.inf
+            if not np.isfinite(span) or span == 0:
+                continue
+            crowding[members[order[1:-1]]] += \
+                (values[order[2:]] - values[order[:-2]]) / span
+    return ranks, crowding
+
+
+def _tournament(generator, ranks, crowding, count: int) -> np.ndarray:
+    '''
+    Binary tournament on (rank, crowding).
+    '''
+    first = generator.integers(0, len(ranks), count)
+    second = generator.integers(0, len(ranks), count)
+    first_wins = (ranks[first] < ranks[second]) | (
+        (ranks[first] == ranks[second]) &
+        (crowding[first] >= crowding[second])
+    )
+    return np.where(first_wins, first, second)
+
+
+def _vary(
+        generator,
+        parents: np.ndarray,
+        low: np.ndarray,
+        high: np.ndarray,
+        crossover_eta: float = 15.0,
+        mutation_eta: float = 20.0,
+        reset_rate: float = 0.05,
+) -> np.ndarray:
+    '''
+    Simulated binary crossover and polynomial mutation in log space, plus a
+    reset-to-unedited mutation that keeps cheap designs in the population.
+    '''
+    count, dimensions = parents.shape
+    mates = parents[generator.permutation(count)]
+    u = generator.random((count, dimensions))
+    beta = np.where(
+        u <= 0.5,
+        (2 * u) ** (1 / (crossover_eta + 1)),
+        (1 / (2 * (1 - u))) ** (1 / (crossover_eta + 1)),
+    )
+    crossing = generator.random((count, dimensions)) < 0.5
+    children = np.where(
+        crossing,
+        0.5 * ((1 + beta) * parents + (1 - beta) * mates),
+        parents,
+    )
+    mutating = generator.random((count, dimensions)) < 1.0 / dimensions
+    u = generator.random((count, dimensions))
+    delta = np.where(
+        u < 0.5,
+        (2 * u) ** (1 / (mutation_eta + 1)) - 1,
+        1 - (2 * (1 - u)) ** (1 / (mutation_eta + 1)),
+    )
+    children = np.where(mutating, children + delta * (high - low), children)
+    children = np.clip(children, low, high)
+    # Only where no edit is within the bounds.
+    unedited = (low <= 0) & (high >= 0)
+    resetting = generator.random((count, dimensions)) < reset_rate
+    children[resetting & unedited] = 0
+    children[(np.abs(children) <= EDIT_TOLERANCE) & unedited] = 0
+    return children
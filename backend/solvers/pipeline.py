@@ -0,0 +1,309 @@
+"""
+backend.solvers.pipeline
+
+Batch design pipeline: Verilog in, scored circuits out.
+
+For each Verilog design the pipeline parses the truth table, synthesizes a
+NOR network, assigns repressors from the gate library, optionally optimizes
+within the edit budget and scores the result. Designs are spread across a
+process pool whose workers each load the gate library once, and one JSON line
+is streamed to the output per design as it finishes. Designs already present
+in the output file are skipped, so an interrupted run picks up where it left
+off.
+
+W.R. Jackson 2020
+"""
+import glob
+import json
+import os
+import time
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    as_completed,
+)
+from dataclasses import dataclass
+from typing import (
+    Iterator,
+    List,
+    Set,
+)
+
+import numpy as np
+
+from backend.datastructures import InputSignal
+from backend.parsing import (
+    VerilogDesign,
+    parse_gates_csv,
+    parse_input_signals,
+    parse_ucf_file,
+    parse_verilog_file,
+)
+from backend.solvers.budget import budget_optimize
+from backend.solvers.synthesis import (
+    GateModel,
+    assign_gates,
+    build_circuit,
+    gate_models_from_csv,
+    gate_models_from_library,
+    synthesize_nor,
+)
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+
+# Per process state, filled in by `_initialize_worker`.
+_WORKER_STATE = {}
+
+
+@dataclass
+class PipelineConfig:
+    '''
+    Attributes:
+        ucf_fp: UCF to take gate models from.
+        gates_csv_fp: Gates CSV to take gate models from, used instead of (or
+            when the UCF carries no) gate models.
+        input_signals_fp: Input sensor file, one sensor per design input in
+            file order.
+        repressor_max: Edit budget; 0 scores the assigned circuit as is.
+        bio_optimization: 'DNA' or 'ALL', for the budgeted optimizer.
+        assignment_samples: Random repressor assignments scored per design.
+        seed: Seed for assignment and optimization.
+    '''
+    ucf_fp: str = None
+    gates_csv_fp: str = None
+    input_signals_fp: str = None
+    repressor_max: int = 0
+    bio_optimization: str = 'DNA'
+    assignment_samples: int = 512
+    seed: int = 0
+
+
+def collect_designs(pattern: str) -> List[str]:
+    '''
+    Args:
+        pattern: A Verilog file, a directory of `.v` files or a glob.
+
+    Returns:
+        Sorted absolute paths of every matching design.
+    '''
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.v')
+    return sorted(os.path.abspath(path) for path in glob.glob(pattern)
+                  if os.path.isfile(path))
+
+
+def completed_designs(output_fp: str) -> Set[str]:
+    '''
+    Args:
+        output_fp: A JSON lines file written by `run_pipeline`.
+
+    Returns:
+        Paths of the designs it already holds a successful result for.
+        Designs that errored are left out so they are retried. A truncated
+        last line (from an interrupted run) is ignored.
+    '''
+    completed = set()
+    if not os.path.exists(output_fp):
+        return completed
+    with open(output_fp, 'r') as input_file:
+        for line in input_file:
+            try:
+                record = json.loads(line)
+                if record['status'] == 'ok':
+                    completed.add(record['verilog'])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return completed
+
+
+def run_pipeline(
+        config: PipelineConfig,
+        designs: List[str],
+        output_fp: str = None,
+        n_jobs: int = 1,
+        resume: bool = True,
+) -> Iterator[dict]:
+    '''
+    Runs every design, streaming results as they finish.
+
+    Args:
+        config: Shared settings.
+        designs: Verilog paths, e.g. from `collect_designs`.
+        output_fp: JSON lines file to append results to.
+        n_jobs: Worker processes. -1 uses every core.
+        resume: Skip designs already in `output_fp`.
+
+    Yields:
+        One result record per design, in completion order.
+    '''
+    designs = [os.path.abspath(design) for design in designs]
+    if resume and output_fp is not None:
+        done = completed_designs(output_fp)
+        designs = [design for design in designs if design not in done]
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if designs:
+        # Loading the library here first means configuration errors are
+        # raised as themselves, not as a BrokenProcessPool from a worker's
+        # initializer.
+        _initialize_worker(config)
+    output_file = open(output_fp, 'a') if output_fp is not None else None
+    try:
+        for record in _run(config, designs, n_jobs):
+            if output_file is not None:
+                output_file.write(json.dumps(record) + '\n')
+                output_file.flush()
+            yield record
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+
+def run_design(verilog_fp: str) -> dict:
+    '''
+    Runs a single design in the current worker. `_initialize_worker` must
+    have been called in this process.
+
+    Args:
+        verilog_fp: The Verilog file.
+
+    Returns:
+        The result record. Failures are reported in the record rather than
+        raised, so one bad design doesn't stop a batch.
+    '''
+    start = time.perf_counter()
+    record = {'verilog': os.path.abspath(verilog_fp)}
+    try:
+        record.update(_evaluate(verilog_fp))
+        record['status'] = STATUS_OK
+    except Exception as error:
+        record['status'] = STATUS_ERROR
+        record['error'] = f'{type(error).__name__}: {error}'
+    record['seconds'] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def design_record(
+        design: VerilogDesign,
+        gate_models: List[GateModel],
+        signals: List[InputSignal],
+        config: PipelineConfig,
+) -> dict:
+    '''
+    Synthesizes, assigns, optionally optimizes and scores one design.
+
+    Args:
+        design: The parsed design.
+        gate_models: Available repressor gates.
+        signals: Input sensors, assigned to the design inputs in order.
+        config: Optimization settings; only the budget, bio optimization,
+            assignment sample count and seed are used.
+
+    Returns:
+        The result record, without the file and timing fields `run_design`
+        adds.
+    '''
+    if len(design.outputs) != 1:
+        raise RuntimeError('Only single output designs are supported.')
+    if len(design.inputs) > len(signals):
+        raise RuntimeError(
+            f'{design.name} has {len(design.inputs)} inputs but only '
+            f'{len(signals)} input signals are available.'
+        )
+    network = synthesize_nor(design.truth_table[:, 0], design.inputs)
+    circuit = build_circuit(network, signals[:len(design.inputs)])
+    circuit, models = assign_gates(
+        circuit,
+        gate_models,
+        samples=config.assignment_samples,
+        seed=config.seed,
+    )
+    assigned_score = float(circuit.score())
+    record = {
+        'design': design.name,
+        'inputs': dict(zip(design.inputs, circuit.signal_labels)),
+        'outputs': design.outputs,
+        'truth_table': design.truth_table[:, 0].astype(int).tolist(),
+        'gates': [
+            {
+                'name': model.name,
+                'logic': kind,
+                'sources': [
+                    design.inputs[index] if source == 'input'
+                    else models[index].name
+                    for source, index in sources
+                ],
+            }
+            for model, (kind, sources) in zip(models, network.gates)
+        ],
+        'assigned_score': assigned_score,
+        'score': assigned_score,
+        'edits': {},
+    }
+    if config.repressor_max > 0:
+        result = budget_optimize(
+            circuit,
+            config.repressor_max,
+            bio_optimization=config.bio_optimization,
+            seed=config.seed,
+        )
+        if result.score > assigned_score:
+            record['score'] = result.score
+            edited = np.flatnonzero(np.any(result.edits != 1, axis=1))
+            record['edits'] = {
+                circuit.gate_labels[gate]: result.edits[gate].tolist()
+                for gate in edited
+            }
+    return record
+
+
+# ----------------------------- Private Functions ------------------------------
+def _run(config: PipelineConfig, designs: List[str], n_jobs: int):
+    if not designs:
+        return
+    if n_jobs <= 1 or len(designs) == 1:
+        for design in designs:
+            yield run_design(design)
+        return
+    with ProcessPoolExecutor(
+            max_workers=min(n_jobs, len(designs)),
+            initializer=_initialize_worker,
+            initargs=(config,),
+    ) as pool:
+        futures = [pool.submit(run_design, design) for design in designs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _initialize_worker(config: PipelineConfig):
+    '''
+    Loads the gate library and input sensors once per process.
+    '''
+    gate_models = []
+    if config.ucf_fp is not None:
+        parse_ucf_file(config.ucf_fp)
+        gate_models = gate_models_from_library()
+    if not gate_models and config.gates_csv_fp is not None:
+        gate_models = gate_models_from_csv(
+            parse_gates_csv(config.gates_csv_fp)
+        )
+    if not gate_models:
+        raise RuntimeError(
+            'No gate models found; pass a UCF with gate models or a gates CSV.'
+        )
+    if config.input_signals_fp is None:
+        raise RuntimeError('An input signals file is required.')
+    _WORKER_STATE['config'] = config
+    _WORKER_STATE['gate_models'] = gate_models
+    _WORKER_STATE['signals'] = list(
+        parse_input_signals(config.input_signals_fp).values()
+    )
+
+
+def _evaluate(verilog_fp: str) -> dict:
+    return design_record(
+        parse_verilog_file(verilog_fp),
+        _WORKER_STATE['gate_models'],
+        _WORKER_STATE['signals'],
+        _WORKER_STATE['config'],
+    )
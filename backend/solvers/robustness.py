@@ -0,0 +1,276 @@
+"""
+backend.solvers.robustness
+
+Monte Carlo robustness scoring for circuits.
+
+A circuit that scores well at its nominal parameters can still fall apart in
+the lab, since measured gates scatter around their fitted response functions.
+Here every gate parameter and every input level is perturbed with
+multiplicative log-normal noise, thousands of draws at a time, and the whole
+batch is scored in one vectorized pass through `Circuit.score`.
+
+The noise is drawn once per scorer (common random numbers), so scores of
+different candidate designs are directly comparable and the scorer can be used
+as a smooth optimization objective.
+
+W.R. Jackson 2020
+"""
+from dataclasses import dataclass
+from typing import (
+    Dict,
+    Sequence,
+    Union,
+)
+
+import numpy as np
+
+from backend.datastructures import (
+    Circuit,
+    Library,
+    Repressor,
+)
+
+# Coefficients of variation used when the UCF doesn't supply any. These are in
+# line with the spread seen between replicate RPU measurements of the same gate.
+DEFAULT_VARIATION = {
+    'y_min': 0.25,
+    'y_max': 0.15,
+    'k': 0.20,
+    'n': 0.10,
+    'signal': 0.20,
+}
+# Names the UCF (or a user) might use for the same parameters.
+_VARIATION_ALIASES = {
+    'ymin': 'y_min',
+    'ymax': 'y_max',
+    'K': 'k',
+    'input': 'signal',
+}
+
+
+@dataclass
+class RobustnessReport:
+    '''
+    Attributes:
+        nominal: Score at the unperturbed parameters.
+        mean: Mean score over the draws that scored finitely.
+        std: Standard deviation of the score over the same draws.
+        quantiles: Quantile -> score, over the same draws.
+        threshold: The score a draw must reach to count as meeting spec.
+        probability: Fraction of all draws at or above the threshold.
+        samples: The score of every draw.
+        non_finite: Number of draws that produced no finite score.
+    '''
+    nominal: float
+    mean: float
+    std: float
+    quantiles: Dict[float, float]
+    threshold: float
+    probability: float
+    samples: np.ndarray
+    non_finite: int = 0
+
+
+def variation_from_library(library: Library = None) -> Dict[str, float]:
+    '''
+    Collects coefficients of variation from the UCF `measurement_std` section.
+
+    In the UCFs we've seen this section describes the measurement standard
+    rather than numeric spreads, so any numeric entries whose names match a
+    parameter (`ymin`, `ymax`, `K`, `n`, `signal`) override the defaults and
+    everything else is ignored.
+
+    Args:
+        library: The parsed library. Defaults to the active singleton.
+
+    Returns:
+        Parameter name -> coefficient of variation.
+    '''
+    variation = dict(DEFAULT_VARIATION)
+    library = library if library is not None else Library()
+    measurement_std = library.measurement_std or {}
+    for name, value in measurement_std.items():
+        name = _VARIATION_ALIASES.get(name, name)
+        if name in variation and isinstance(value, (int, float)):
+            variation[name] = float(value)
+    return variation
+
+
+class RobustnessScorer:
+    '''
+    Scores a circuit across a fixed set of random perturbations.
+
+    Usage:
+        scorer = RobustnessScorer(circuit, samples=4096, seed=0)
+        report = scorer.report(threshold=1.5)
+        objective = scorer.statistic(circuit_variant, quantile=0.1)
+    '''
+
+    def __init__(
+            self,
+            circuit: Union[Circuit, Repressor],
+            samples: int = 4096,
+            variation: Dict[str, float] = None,
+            seed: int = None,
+            chunk_size: int = 8192,
+    ):
+        '''
+        Args:
+            circuit: The circuit (or its output repressor) to score.
+            samples: Number of perturbed parameter sets.
+            variation: Parameter name -> coefficient of variation. Defaults to
+                `variation_from_library()`.
+            seed: Seed for the perturbations.
+            chunk_size: Maximum draws evaluated at once, to bound memory.
+        '''
+        if isinstance(circuit, Repressor):
+            circuit = Circuit.from_repressor(circuit)
+        if samples < 1:
+            raise RuntimeError('Robustness scoring needs at least one sample.')
+        self.circuit = circuit
+        self.samples = samples
+        self.variation = variation if variation is not None \
+            else variation_from_library()
+        self.chunk_size = chunk_size
+        generator = np.random.default_rng(seed)
+        gate_shape = (samples, circuit.gate_count)
+        self._factors = {
+            name: _lognormal(generator, self.variation[name], gate_shape)
+            for name in ('y_min', 'y_max', 'k', 'n')
+        }
+        self._factors['signal'] = _lognormal(
+            generator,
+            self.variation['signal'],
+            (samples, circuit.signal_count, 2),
+        )
+
+    def scores(self, circuit: Circuit = None) -> np.ndarray:
+        '''
+        Args:
+            circuit: A circuit with the same structure as the one the scorer
+                was built for, e.g. an optimization candidate. Defaults to
+                that circuit.
+
+        Returns:
+            (samples,) score of every perturbed draw.
+        '''
+        circuit = circuit if circuit is not None else self.circuit
+        if circuit.gate_count != self.circuit.gate_count or \
+                circuit.signal_count != self.circuit.signal_count:
+            raise RuntimeError(
+                'Circuit structure differs from the one the scorer was '
+                'built for.'
+            )
+        scores = np.empty(self.samples)
+        for start in range(0, self.samples, self.chunk_size):
+            window = slice(start, min(start + self.chunk_size, self.samples))
+            scores[window] = circuit.score(
+                y_min=circuit.y_min * self._factors['y_min'][window],
+                y_max=circuit.y_max * self._factors['y_max'][window],
+                k=circuit.k * self._factors['k'][window],
+                n=circuit.n * self._factors['n'][window],
+                signal_levels=circuit.signal_levels *
+                self._factors['signal'][window],
+            )
+        return scores
+
+    def statistic(
+            self,
+            circuit: Circuit = None,
+            quantile: float = None,
+            threshold: float = None,
+    ) -> float:
+        '''
+        A single number summarizing robustness, for use as an objective.
+
+        Args:
+            circuit: Candidate circuit; see `scores`.
+            quantile: If passed in, return this quantile of the scores (e.g.
+                0.1 for "90% of builds score at least this").
+            threshold: If passed in, return the probability of meeting it.
+
+        Returns:
+            The mean score unless a quantile or threshold is requested. Like
+            `report`, means and quantiles skip draws that scored non-finitely,
+            and are -inf if none scored finitely; such draws never meet a
+            threshold.
+        '''
+        scores = self.scores(circuit)
+        if threshold is not None:
+            return float(np.mean(scores >= threshold))
+        finite = scores[np.isfinite(scores)]
+        if not len(finite):
+            return float('-inf')
+        if quantile is not None:
+            return float(np.quantile(finite, quantile))
+        return float(np.mean(finite))
+
+    def report(
+            self,
+            circuit: Circuit = None,
+            threshold: float = None,
+            quantiles: Sequence[float] = (0.05, 0.25, 0.5, 0.75, 0.95),
+    ) -> RobustnessReport:
+        '''
+        Args:
+            circuit: Candidate circuit; see `scores`.
+            threshold: Score that counts as meeting spec. Defaults to the
+                nominal score.
+            quantiles: Which quantiles to report.
+
+        Returns:
+            Summary of the score distribution.
+        '''
+        circuit = circuit if circuit is not None else self.circuit
+        scores = self.scores(circuit)
+        nominal = float(circuit.score())
+        threshold = nominal if threshold is None else threshold
+        finite = scores[np.isfinite(scores)]
+        if len(finite):
+            values = np.quantile(finite, quantiles)
+        else:
+            values = np.full(len(quantiles), float('nan'))
+        return RobustnessReport(
+            nominal=nominal,
+            mean=float(finite.mean()) if len(finite) else float('nan'),
+            std=float(finite.std()) if len(finite) else float('nan'),
+            quantiles={q: float(value) for q, value in zip(quantiles, values)},
+            threshold=threshold,
+            probability=float(np.mean(scores >= threshold)),
+            samples=scores,
+            non_finite=len(scores) - len(finite),
+        )
+
+
+def robustness_score(
+        circuit: Union[Circuit, Repressor],
+        samples: int = 4096,
+        threshold: float = None,
+        variation: Dict[str, float] = None,
+        seed: int = None,
+) -> RobustnessReport:
+    '''
+    Convenience wrapper building a `RobustnessScorer` and reporting on it.
+
+    Args:
+        circuit: The circuit (or its output repressor) to score.
+        samples: Number of perturbed parameter sets.
+        threshold: Score that counts as meeting spec.
+        variation: Parameter name -> coefficient of variation.
+        seed: Seed for the perturbations.
+
+    Returns:
+        Summary of the score distribution.
+    '''
+    scorer = RobustnessScorer(circuit, samples, variation, seed)
+    return scorer.report(threshold=threshold)
+
+
+def _lognormal(generator, coefficient_of_variation: float, shape):
+    '''
+    Multiplicative noise with mean one and the given coefficient of variation.
+    '''
+    if coefficient_of_variation <= 0:
+        return np.ones(shape)
+    sigma = np.sqrt(np.log1p(coefficient_of_variation ** 2))
+    return generator.lognormal(-sigma ** 2 / 2, sigma, size=shape)
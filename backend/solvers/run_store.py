@@ -0,0 +1,428 @@
+"""
+backend.solvers.run_store
+
+Persistent store of `optimize_repressor` runs.
+
+Every run is recorded in a small SQLite database with what it ran against (a
+hash of the circuit's gate parameters and one of its structure), how it ran
+(method and bio optimization mode) and what it found (the result vector,
+score, evaluation count and timing). Lookups by gate, method and score range
+are indexed, and a run whose inputs match one already in the store is
+answered from it instead of being optimized again. New gates can be warm
+started from the stored solutions of their nearest neighbours.
+
+The database runs in WAL mode, so several processes can read and write one
+store at once; batches from a process pool are inserted in one transaction.
+
+W.R. Jackson 2020
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import (
+    Iterable,
+    List,
+    Tuple,
+)
+
+import numpy as np
+
+from backend.datastructures import (
+    Circuit,
+    Repressor,
+)
+from backend.solvers.optimize_repressor import (
+    optimizable_response_function_dna,
+    optimizable_response_function_dna_and_protein,
+    optimize_repressor,
+)
+from backend.solvers.warm_start import (
+    FEATURE_COUNT,
+    WarmStartIndex,
+    repressor_features,
+)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    gate TEXT NOT NULL,
+    parameter_hash TEXT NOT NULL,
+    structure_hash TEXT NOT NULL,
+    method TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    x TEXT NOT NULL,
+    score REAL,
+    evaluations INTEGER,
+    seconds REAL NOT NULL,
+    created REAL NOT NULL,
+    features TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_gate
+    ON runs(gate, method, mode, score);
+CREATE INDEX IF NOT EXISTS runs_by_inputs
+    ON runs(parameter_hash, structure_hash, method, mode);
+CREATE INDEX IF NOT EXISTS runs_by_score ON runs(score);
+'''
+
+_COLUMNS = (
+    'gate, parameter_hash, structure_hash, method, mode, x, score, '
+    'evaluations, seconds, created, features'
+)
+
+
+@dataclass
+class OptimizationRun:
+    '''
+    Attributes:
+        gate: Name of the optimized gate, e.g. `B3_BM3R1`.
+        parameter_hash: Hash of every gate's [y_min, y_max, k, n].
+        structure_hash: Hash of the wiring, logic and input signal levels.
+        method: Optimization method passed to `optimize_repressor`.
+        mode: Bio optimization mode, 'DNA' or 'ALL'.
+        x: The result vector.
+        score: Score of the repressor with `x` applied.
+        evaluations: Objective evaluations, when the method reports them.
+        seconds: Wall clock time of the run.
+        created: Unix time the run was recorded.
+        features: The gate's `repressor_features`, for warm starts.
+        run_id: Row id, once stored.
+    '''
+    gate: str
+    parameter_hash: str
+    structure_hash: str
+    method: str
+    mode: str
+    x: List[float]
+    score: float
+    evaluations: int
+    seconds: float
+    created: float
+    features: List[float] = None
+    run_id: int = None
+
+
+def circuit_hashes(circuit: Circuit) -> Tuple[str, str]:
+    '''
+    Args:
+        circuit: The circuit, e.g. from `Circuit.from_repressor`.
+
+    Returns:
+        (parameter hash, structure hash). Two circuits with equal hashes
+        score identically under any edit.
+    '''
+    parameters = hashlib.sha256(
+        np.ascontiguousarray(circuit.parameters()).tobytes()
+    ).hexdigest()
+    structure = hashlib.sha256()
+    for array in (
+            circuit.signal_levels,
+            circuit.signal_bits,
+            circuit.number_of_inputs,
+            circuit.logic,
+            circuit.input_indptr,
+            circuit.input_indices,
+            circuit.logic_indptr,
+            circuit.logic_indices,
+    ):
+        structure.update(np.ascontiguousarray(array).tobytes())
+        structure.update(b'|')
+    structure.update(f'{circuit.n_bits}:{circuit.active_low}'.encode('ascii'))
+    return parameters, structure.hexdigest()
+
+
+def run_optimization(
+        repressor: Repressor,
+        method: str,
+        mode: str = 'DNA',
+        gate: str = None,
+        warm_start: WarmStartIndex = None,
+) -> OptimizationRun:
+    '''
+    Runs `optimize_repressor` and records what it found.
+
+    Args:
+        repressor: The repressor to optimize.
+        method: Optimization method.
+        mode: 'DNA' or 'ALL'.
+        gate: Gate name to record. Defaults to the circuit's output label.
+        warm_start: Index of solved gates to start from.
+
+    Returns:
+        The unsaved run.
+    '''
+    circuit = Circuit.from_repressor(repressor)
+    parameter_hash, structure_hash = circuit_hashes(circuit)
+    start = time.perf_counter()
+    result = optimize_repressor(
+        repressor,
+        method,
+        mode,
+        warm_start=warm_start,
+    )
+    seconds = time.perf_counter() - start
+    # `brute` hands back the bare result vector.
+    x = np.atleast_1d(getattr(result, 'x', result)).astype(np.float64)
+    if hasattr(result, 'fun'):
+        score = -float(np.asarray(result.fun).ravel()[0])
+    else:
+        objective = optimizable_response_function_dna if mode == 'DNA' \
+            else optimizable_response_function_dna_and_protein
+        score = -float(objective(x, repressor))
+    evaluations = getattr(result, 'nfev', None)
+    return OptimizationRun(
+        gate=gate if gate is not None else circuit.gate_labels[-1],
+        parameter_hash=parameter_hash,
+        structure_hash=structure_hash,
+        method=method,
+        mode=mode,
+        x=x.tolist(),
+        score=score if np.isfinite(score) else None,
+        evaluations=int(evaluations) if evaluations is not None else None,
+        seconds=seconds,
+        created=time.time(),
+        features=repressor_features(circuit).tolist(),
+    )
+
+
+class RunStore:
+    '''
+    Usage:
+        with RunStore('runs.sqlite') as store:
+            run = store.optimize(repressor, 'Nelder-Mead', gate='B3_BM3R1')
+            best = store.best('B3_BM3R1', mode='DNA')
+    '''
+
+    def __init__(self, db_path: str, timeout: float = 30.0):
+        '''
+        Args:
+            db_path: Filepath of the SQLite database. Created if missing.
+            timeout: Seconds to wait on another process's write lock.
+        '''
+        self.db_path = db_path
+        self._connection = sqlite3.connect(db_path, timeout=timeout)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # -------------------------------- Writing ---------------------------------
+    def add_runs(self, runs: Iterable[OptimizationRun]) -> List[int]:
+        '''
+        Inserts runs in one transaction.
+
+        Returns:
+            Their row ids, which are also set on the runs.
+        '''
+        runs = list(runs)
+        with self._connection:
+            for run in runs:
+                cursor = self._connection.execute(
+                    f'INSERT INTO runs ({_COLUMNS}) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (run.gate, run.parameter_hash, run.structure_hash,
+                     run.method, run.mode, json.dumps(run.x), run.score,
+                     run.evaluations, run.seconds, run.created,
+                     json.dumps(run.features)),
+                )
+                run.run_id = cursor.lastrowid
+        return [run.run_id for run in runs]
+
+    def optimize(
+            self,
+            repressor: Repressor,
+            method: str,
+            mode: str = 'DNA',
+            gate: str = None,
+            warm_start: bool = False,
+    ) -> OptimizationRun:
+        '''
+        Returns the stored run for this repressor, method and mode, or runs
+        and stores it.
+        '''
+        return self.optimize_all(
+            [(gate, repressor)],
+            method,
+            mode,
+            warm_start=warm_start,
+        )[0]
+
+    def optimize_all(
+            self,
+            repressors: List[Tuple[str, Repressor]],
+            method: str,
+            mode: str = 'DNA',
+            n_jobs: int = 1,
+            warm_start: bool = False,
+    ) -> List[OptimizationRun]:
+        '''
+        Optimizes many repressors, skipping those already in the store.
+
+        Args:
+            repressors: (gate name or None, repressor) pairs.
+            method: Optimization method.
+            mode: 'DNA' or 'ALL'.
+            n_jobs: Worker processes for the runs that are missing.
+            warm_start: Start the missing runs from the solutions of the
+                nearest gates already in the store.
+
+        Returns:
+            One run per repressor, in order.
+        '''
+        runs = []
+        # Inputs not in the store yet, each run once however often it's
+        # repeated in the batch.
+        missing = {}
+        for index, (gate, repressor) in enumerate(repressors):
+            key = circuit_hashes(Circuit.from_repressor(repressor))
+            run = self.lookup(*key, method, mode)
+            runs.append(run)
+            if run is None:
+                missing.setdefault(key, []).append(index)
+        index = self.warm_start_index(mode) if warm_start and missing \
+            else None
+        tasks = [
+            (repressors[indices[0]][1], method, mode,
+             repressors[indices[0]][0], index)
+            for indices in missing.values()
+        ]
+        if n_jobs == 1 or len(tasks) <= 1:
+            fresh = [run_optimization(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(
+                    max_workers=None if n_jobs == -1 else n_jobs,
+            ) as pool:
+                fresh = list(pool.map(_run_task, tasks))
+        self.add_runs(fresh)
+        for indices, run in zip(missing.values(), fresh):
+            for index in indices:
+                runs[index] = run
+        return runs
+
+    def warm_start_index(
+            self,
+            mode: str = 'DNA',
+            method: str = None,
+    ) -> WarmStartIndex:
+        '''
+        Args:
+            mode: Bio optimization mode; only its runs have matching result
+                vectors.
+            method: Only use runs from this method, if passed in.
+
+        Returns:
+            A nearest neighbour index over the stored solutions.
+        '''
+        runs = [
+            run for run in self.query(method=method, mode=mode)
+            if run.features is not None and run.score is not None
+        ]
+        if not runs:
+            # A fresh store: every start is cold.
+            return WarmStartIndex(
+                np.empty((0, FEATURE_COUNT)),
+                np.empty((0, 0)),
+            )
+        variables = len(runs[0].x)
+        runs = [run for run in runs if len(run.x) == variables]
+        return WarmStartIndex(
+            np.reshape([run.features for run in runs], (len(runs), -1)),
+            np.reshape([run.x for run in runs], (len(runs), variables)),
+            [run.score for run in runs],
+        )
+
+    # -------------------------------- Queries ---------------------------------
+    def lookup(
+            self,
+            parameter_hash: str,
+            structure_hash: str,
+            method: str,
+            mode: str,
+    ) -> OptimizationRun:
+        '''
+        Returns:
+            The best stored run for exactly these inputs, or None.
+        '''
+        rows = self._select(
+            'parameter_hash = ? AND structure_hash = ? AND method = ? '
+            'AND mode = ?',
+            [parameter_hash, structure_hash, method, mode],
+            limit=1,
+        )
+        return rows[0] if rows else None
+
+    def query(
+            self,
+            gate: str = None,
+            method: str = None,
+            mode: str = None,
+            min_score: float = None,
+            max_score: float = None,
+            limit: int = None,
+    ) -> List[OptimizationRun]:
+        '''
+        Looks up runs by any combination of gate, method, mode and score
+        range.
+
+        Returns:
+            Matching runs, best score first.
+        '''
+        clauses = []
+        arguments = []
+        for column, value in (('gate', gate), ('method', method),
+                              ('mode', mode)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                arguments.append(value)
+        if min_score is not None:
+            clauses.append('score >= ?')
+            arguments.append(min_score)
+        if max_score is not None:
+            clauses.append('score <= ?')
+            arguments.append(max_score)
+        return self._select(' AND '.join(clauses), arguments, limit)
+
+    def best(
+            self,
+            gate: str,
+            method: str = None,
+            mode: str = None,
+    ) -> OptimizationRun:
+        '''
+        Returns:
+            The highest scoring run for a gate, or None.
+        '''
+        runs = self.query(gate=gate, method=method, mode=mode, limit=1)
+        return runs[0] if runs else None
+
+    def _select(self, where: str, arguments: list, limit: int = None):
+        sql = f'SELECT {_COLUMNS}, id FROM runs'
+        if where:
+            sql += f' WHERE {where}'
+        sql += ' ORDER BY score IS NULL, score DESC, id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            arguments = list(arguments) + [limit]
+        return [
+            OptimizationRun(
+                *row[:5],
+                json.loads(row[5]),
+                *row[6:10],
+                json.loads(row[10]) if row[10] else None,
+                row[11],
+            )
+            for row in self._connection.execute(sql, arguments)
+        ]
+
+
+def _run_task(task) -> OptimizationRun:
+    return run_optimization(*task)
@@ -0,0 +1,248 @@
+"""
+backend.solvers.sensitivity
+
+Global sensitivity analysis of a circuit's score with respect to each gate's
+y_min, y_max, K and n.
+
+Both methods build their whole design as one matrix of log-multipliers up
+front and score it through the batched circuit evaluator, optionally split
+across processes:
+
+    Morris screening: r one-at-a-time trajectories, cheap, good for ranking.
+    Sobol indices: Saltelli sampling, N * (D + 2) evaluations, quantitative
+        first order and total effects.
+
+W.R. Jackson 2020
+"""
+from dataclasses import dataclass
+from typing import (
+    Dict,
+    List,
+    Union,
+)
+
+import numpy as np
+
+from backend.datastructures import (
+    Circuit,
+    Repressor,
+)
+from backend.solvers.batch import (
+    PARAMETER_NAMES,
+    circuit_scorer,
+    parallel_map_chunks,
+)
+
+
+@dataclass
+class SensitivityResult:
+    '''
+    Attributes:
+        method: `morris` or `sobol`.
+        gate_labels: Label of each gate (rows of every index array).
+        parameter_names: Name of each parameter (columns of every index
+            array).
+        indices: Index name -> (G, 4) array. Morris reports `mu`, `mu_star`
+            and `sigma`; Sobol reports `first_order` and `total_order`.
+        evaluations: Number of circuit scores computed.
+    '''
+    method: str
+    gate_labels: List[str]
+    parameter_names: List[str]
+    indices: Dict[str, np.ndarray]
+    evaluations: int
+
+    def ranking(self, index: str = None) -> List[tuple]:
+        '''
+        Args:
+            index: Which index to rank by. Defaults to `mu_star` for Morris
+                and `total_order` for Sobol.
+
+        Returns:
+            (gate label, parameter name, value) triples, most influential
+            first.
+        '''
+        if index is None:
+            index = 'mu_star' if self.method == 'morris' else 'total_order'
+        values = self.indices[index]
+        order = np.argsort(values, axis=None)[::-1]
+        return [
+            (
+                self.gate_labels[flat // len(self.parameter_names)],
+                self.parameter_names[flat % len(self.parameter_names)],
+                float(values.flat[flat]),
+            )
+            for flat in order
+        ]
+
+
+def morris_screening(
+        circuit: Union[Circuit, Repressor],
+        trajectories: int = 20,
+        levels: int = 4,
+        spread: float = 2.0,
+        seed: int = None,
+        n_jobs: int = 1,
+) -> SensitivityResult:
+    '''
+    Morris elementary effects screening.
+
+    Each parameter is varied over [1 / spread, spread] times its nominal value
+    on a log scale, discretized into `levels` levels.
+
+    Args:
+        circuit: The circuit (or its output repressor) to analyse.
+        trajectories: Number of one-at-a-time trajectories.
+        levels: Grid levels per parameter (even numbers work best).
+        spread: Largest multiplicative change considered.
+        seed: Seed for the trajectories.
+        n_jobs: Worker processes used for scoring.
+
+    Returns:
+        mu, mu_star and sigma of the elementary effects per gate/parameter.
+    '''
+    circuit = _as_circuit(circuit)
+    dimensions = circuit.gate_count * len(PARAMETER_NAMES)
+    generator = np.random.default_rng(seed)
+    delta = levels / (2.0 * (levels - 1))
+    grid = np.arange(levels // 2) / (levels - 1)
+    # Unit hypercube trajectories, (r, D + 1, D).
+    points = np.empty((trajectories, dimensions + 1, dimensions))
+    directions = np.empty((trajectories, dimensions))
+    orders = np.empty((trajectories, dimensions), dtype=np.int64)
+    for trajectory in range(trajectories):
+        start = generator.choice(grid, size=dimensions)
+        order = generator.permutation(dimensions)
+        sign = generator.choice([-1.0, 1.0], size=dimensions)
+        # Flip starting points so every step stays inside the unit cube.
+        start = np.where(sign < 0, start + delta, start)
+        current = start.copy()
+        points[trajectory, 0] = current
+        for step, parameter in enumerate(order):
+            current = current.copy()
+            current[parameter] += sign[parameter] * delta
+            points[trajectory, step + 1] = current
+        directions[trajectory] = sign
+        orders[trajectory] = order
+    scores = _score_unit_points(
+        circuit,
+        points.reshape(-1, dimensions),
+        spread,
+        n_jobs,
+    ).reshape(trajectories, dimensions + 1)
+    effects = np.empty((trajectories, dimensions))
+    for trajectory in range(trajectories):
+        differences = np.diff(scores[trajectory])
+        parameters = orders[trajectory]
+        effects[trajectory, parameters] = differences / (
+            directions[trajectory, parameters] * delta
+        )
+    effects[~np.isfinite(effects)] = np.nan
+    shape = (circuit.gate_count, len(PARAMETER_NAMES))
+    return SensitivityResult(
+        method='morris',
+        gate_labels=list(circuit.gate_labels),
+        parameter_names=list(PARAMETER_NAMES),
+        indices={
+            'mu': np.nanmean(effects, axis=0).reshape(shape),
+            'mu_star': np.nanmean(np.abs(effects), axis=0).reshape(shape),
+            'sigma': np.nanstd(effects, axis=0).reshape(shape),
+        },
+        evaluations=int(scores.size),
+    )
+
+
+def sobol_indices(
+        circuit: Union[Circuit, Repressor],
+        samples: int = 1024,
+        spread: float = 2.0,
+        seed: int = None,
+        n_jobs: int = 1,
+        chunk_size: int = 8192,
+) -> SensitivityResult:
+    '''
+    Variance based Sobol indices via Saltelli sampling, with the Saltelli
+    (2010) first order and Jansen total order estimators.
+
+    Args:
+        circuit: The circuit (or its output repressor) to analyse.
+        samples: Base sample count N. Costs N * (4G + 2) evaluations.
+        spread: Largest multiplicative change considered.
+        seed: Seed for the base samples.
+        n_jobs: Worker processes used for scoring.
+        chunk_size: Evaluations per batch.
+
+    Returns:
+        First order and total order indices per gate/parameter.
+    '''
+    circuit = _as_circuit(circuit)
+    dimensions = circuit.gate_count * len(PARAMETER_NAMES)
+    generator = np.random.default_rng(seed)
+    base = generator.random((samples, 2 * dimensions))
+    a_matrix = base[:, :dimensions]
+    b_matrix = base[:, dimensions:]
+    # AB_i is A with column i taken from B, stacked as (D, N, D).
+    ab_matrices = np.repeat(a_matrix[None], dimensions, axis=0)
+    columns = np.arange(dimensions)
+    ab_matrices[columns, :, columns] = b_matrix.T
+    design = np.concatenate([
+        a_matrix,
+        b_matrix,
+        ab_matrices.reshape(-1, dimensions),
+    ])
+    scores = _score_unit_points(circuit, design, spread, n_jobs, chunk_size)
+    f_a = scores[:samples]
+    f_b = scores[samples:2 * samples]
+    f_ab = scores[2 * samples:].reshape(dimensions, samples)
+    valid = np.isfinite(f_a) & np.isfinite(f_b) & \
+        np.all(np.isfinite(f_ab), axis=0)
+    if valid.sum() < 2:
+        raise RuntimeError('Too few finite scores to estimate Sobol indices.')
+    f_a, f_b, f_ab = f_a[valid], f_b[valid], f_ab[:, valid]
+    variance = np.var(np.concatenate([f_a, f_b]))
+    if variance == 0:
+        first_order = np.zeros(dimensions)
+        total_order = np.zeros(dimensions)
+    else:
+        first_order = np.mean(f_b * (f_ab - f_a), axis=1) / variance
+        total_order = 0.5 * np.mean((f_a - f_ab) ** 2, axis=1) / variance
+    shape = (circuit.gate_count, len(PARAMETER_NAMES))
+    return SensitivityResult(
+        method='sobol',
+        gate_labels=list(circuit.gate_labels),
+        parameter_names=list(PARAMETER_NAMES),
+        indices={
+            'first_order': first_order.reshape(shape),
+            'total_order': total_order.reshape(shape),
+        },
+        evaluations=int(scores.size),
+    )
+
+
+def _as_circuit(circuit: Union[Circuit, Repressor]) -> Circuit:
+    if isinstance(circuit, Repressor):
+        return Circuit.from_repressor(circuit)
+    return circuit
+
+
+def _score_unit_points(
+        circuit: Circuit,
+        points: np.ndarray,
+        spread: float,
+        n_jobs: int,
+        chunk_size: int = 8192,
+) -> np.ndarray:
+    '''
+    Maps unit hypercube points onto log-multipliers in [1/spread, spread] and
+    scores them.
+    '''
+    log_spread = np.log(spread)
+    multipliers = np.exp((2.0 * points - 1.0) * log_spread)
+    scores = parallel_map_chunks(
+        circuit_scorer(circuit),
+        multipliers,
+        n_jobs=n_jobs,
+        chunk_size=chunk_size,
+    )
+    scores[np.isinf(scores)] = np.nan
+    return scores
@@ -0,0 +1,276 @@
+"""
+backend.solvers.surrogate
+
+Surrogate-assisted minimization for expensive objectives.
+
+The scipy methods behind `optimize_repressor` spend hundreds to thousands of
+objective evaluations, which is fine for a single repressor but not for a
+large circuit or a Monte Carlo robustness objective. Here a Gaussian process
+(Matern 5/2, per-variable length scales fit by maximum marginal likelihood)
+is fit over every point evaluated so far, and new candidates are picked where
+its expected improvement is highest. The true objective is only evaluated in
+small batches; the points of a batch are chosen one after another, each
+pretending the previous ones came back at the current best ("constant
+liar"), so that a batch spreads out instead of piling onto one spot. Batches
+can be evaluated in parallel.
+
+W.R. Jackson 2020
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Callable,
+    Sequence,
+)
+
+import numpy as np
+from scipy import (
+    linalg,
+    optimize as opt,
+    special,
+)
+
+# Bounds on the log length scales (in unit cube coordinates) and log noise.
+_LENGTH_SCALE_BOUNDS = (np.log(1e-2), np.log(1e1))
+_NOISE_BOUNDS = (np.log(1e-8), np.log(1e-1))
+
+
+def surrogate_minimize(
+        objective: Callable,
+        bounds: Sequence[Sequence[float]],
+        max_evaluations: int = 60,
+        batch_size: int = 4,
+        initial_points: int = None,
+        x0: Sequence[float] = None,
+        candidates: int = 2048,
+        seed: int = None,
+        n_jobs: int = 1,
+) -> opt.OptimizeResult:
+    '''
+    Minimizes an expensive objective within bounds.
+
+    Args:
+        objective: Maps a (V,) point to a float. Must be picklable when
+            `n_jobs` isn't 1. Non-finite values are treated as worse than
+            anything seen.
+        bounds: (V, 2) bounds per variable.
+        max_evaluations: Total true objective evaluations.
+        batch_size: Points evaluated per round.
+        initial_points: Size of the initial Latin hypercube design. Defaults
+            to 2V + 1, at least one batch.
+        x0: A point to include in the initial design, e.g. a warm start.
+        candidates: Random candidates scored by expected improvement per
+            proposal, before refining the best with L-BFGS-B.
+        seed: Seed for the design and candidate sampling.
+        n_jobs: Processes to evaluate each batch with. -1 uses every core.
+
+    Returns:
+        A scipy `OptimizeResult` with x, fun, nfev and nit (rounds).
+    '''
+    bounds = np.asarray(bounds, dtype=np.float64)
+    low, span = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+    dimensions = len(bounds)
+    generator = np.random.default_rng(seed)
+    if initial_points is None:
+        initial_points = max(2 * dimensions + 1, batch_size)
+    initial_points = min(initial_points, max_evaluations)
+    unit = _latin_hypercube(generator, initial_points, dimensions)
+    if x0 is not None:
+        unit[0] = np.clip((np.asarray(x0) - low) / span, 0, 1)
+
+    pool = None
+    if n_jobs != 1:
+        pool = ProcessPoolExecutor(max_workers=None if n_jobs == -1
+                                   else n_jobs)
+    try:
+        def evaluate(points: np.ndarray) -> np.ndarray:
+            points = low + points * span
+            if pool is None:
+                values = [objective(point) for point in points]
+            else:
+                values = list(pool.map(objective, points))
+            return np.array([float(np.ravel(value)[0]) for value in values])
+
+        X = unit
+        y = evaluate(X)
+        rounds = 0
+        while len(y) < max_evaluations:
+            rounds += 1
+            process = _GaussianProcess(X, _fill_invalid(y))
+            batch = []
+            for _ in range(min(batch_size, max_evaluations - len(y))):
+                point = _propose(process, generator, candidates)
+                batch.append(point)
+                process = process.condition(point, process.y_best)
+            batch = np.array(batch)
+            X = np.vstack([X, batch])
+            y = np.concatenate([y, evaluate(batch)])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    finite = np.isfinite(y)
+    best = int(np.argmin(np.where(finite, y, np.inf)))
+    return opt.OptimizeResult(
+        x=low + X[best] * span,
+        fun=y[best],
+        nfev=len(y),
+        nit=rounds,
+        success=bool(finite[best]),
+        message='Maximum number of evaluations reached.',
+        xs=low + X * span,
+        funs=y,
+    )
+
+
+class _GaussianProcess:
+    '''
+    Zero mean GP on the unit cube over standardized targets.
+    '''
+
+    def __init__(
+            self,
+            X: np.ndarray,
+            y: np.ndarray,
+            hyperparameters: np.ndarray = None,
+    ):
+        self.X = X
+        self.raw_y = y
+        self.mean = y.mean()
+        self.scale = y.std() or 1.0
+        self.y = (y - self.mean) / self.scale
+        if hyperparameters is None:
+            hyperparameters = self._fit()
+        self.hyperparameters = hyperparameters
+        self._factor()
+
+    @property
+    def y_best(self) -> float:
+        return float(self.raw_y.min())
+
+    def condition(self, point: np.ndarray, value: float):
+        '''
+        Returns:
+            This GP with one more (pretend) observation, keeping the fitted
+            hyperparameters.
+        '''
+        return _GaussianProcess(
+            np.vstack([self.X, point]),
+            np.append(self.raw_y, value),
+            self.hyperparameters,
+        )
+
+    def predict(self, points: np.ndarray):
+        '''
+        Returns:
+            (mean, standard deviation) in the objective's units.
+        '''
+        cross = _matern(points, self.X, self.hyperparameters[:-1])
+        mean = cross @ self.alpha
+        solved = linalg.solve_triangular(self.cholesky, cross.T, lower=True)
+        variance = np.maximum(1.0 - np.sum(solved ** 2, axis=0), 1e-12)
+        return (
+            self.mean + self.scale * mean,
+            self.scale * np.sqrt(variance),
+        )
+
+    def _factor(self):
+        noise = np.exp(self.hyperparameters[-1])
+        covariance = _matern(self.X, self.X, self.hyperparameters[:-1])
+        covariance[np.diag_indices_from(covariance)] += noise + 1e-10
+        self.cholesky = linalg.cholesky(covariance, lower=True)
+        self.alpha = linalg.cho_solve((self.cholesky, True), self.y)
+
+    def _fit(self) -> np.ndarray:
+        dimensions = self.X.shape[1]
+
+        def negative_log_likelihood(parameters):
+            covariance = _matern(self.X, self.X, parameters[:-1])
+            covariance[np.diag_indices_from(covariance)] += \
+                np.exp(parameters[-1]) + 1e-10
+            try:
+                cholesky = linalg.cholesky(covariance, lower=True)
+            except linalg.LinAlgError:
+                return 1e10
+            alpha = linalg.cho_solve((cholesky, True), self.y)
+            return 0.5 * self.y @ alpha + np.sum(np.log(np.diag(cholesky)))
+
+        parameter_bounds = [_LENGTH_SCALE_BOUNDS] * dimensions + \
+            [_NOISE_BOUNDS]
+        best = None
+        for start in (np.log(0.3), np.log(1.0)):
+            result = opt.minimize(
+                negative_log_likelihood,
+                np.append(np.full(dimensions, start), np.log(1e-4)),
+                method='L-BFGS-B',
+                bounds=parameter_bounds,
+            )
+            if best is None or result.fun < best.fun:
+                best = result
+        return best.x
+
+
+def _matern(A: np.ndarray, B: np.ndarray, log_length_scales: np.ndarray):
+    scaled = np.exp(-log_length_scales)
+    difference = (A[:, None, :] - B[None, :, :]) * scaled
+    distance = np.sqrt(5.0 * np.sum(difference ** 2, axis=-1))
+    return (1.0 + distance + distance ** 2 / 3.0) * np.exp(-distance)
+
+
+def _expected_improvement(
+        process: _GaussianProcess,
+        points: np.ndarray,
+) -> np.ndarray:
+    mean, deviation = process.predict(points)
+    improvement = process.y_best - mean
+    z = improvement / deviation
+    return improvement * special.ndtr(z) + \
+        deviation * np.exp(-0.5 * z ** 2) / np.sqrt(2 * np.pi)
+
+
+def _propose(
+        process: _GaussianProcess,
+        generator: np.random.Generator,
+        candidates: int,
+) -> np.ndarray:
+    '''
+    Maximizes expected improvement: random candidates, half of them spread
+    around the best points so far, then L-BFGS-B from the best one.
+    '''
+    dimensions = process.X.shape[1]
+    uniform = generator.random((candidates // 2, dimensions))
+    elite = process.X[np.argsort(process.raw_y)[:5]]
+    local = np.clip(
+        elite[generator.integers(len(elite), size=candidates - len(uniform))]
+        + generator.normal(0, 0.05, (candidates - len(uniform), dimensions)),
+        0,
+        1,
+    )
+    points = np.vstack([uniform, local])
+    scores = _expected_improvement(process, points)
+    best_point = points[np.argmax(scores)]
+    result = opt.minimize(
+        lambda x: -_expected_improvement(process, x[None])[0],
+        best_point,
+        method='L-BFGS-B',
+        bounds=[(0, 1)] * dimensions,
+    )
+    return result.x if -result.fun > scores.max() else best_point
+
+
+def _latin_hypercube(generator, count: int, dimensions: int) -> np.ndarray:
+    strata = np.stack([generator.permutation(count) for _ in
+                       range(dimensions)], axis=1)
+    return (strata + generator.random((count, dimensions))) / count
+
+
+def _fill_invalid(y: np.ndarray) -> np.ndarray:
+    '''
+    Replaces non-finite values with something a bit worse than the worst
+    finite one, so the surrogate steers away from them.
+    '''
+    finite = np.isfinite(y)
+    if not finite.any():
+        return np.zeros_like(y)
+    worst = y[finite].max()
+    spread = np.ptp(y[finite]) if finite.sum() > 1 else 1.0
+    return np.where(finite, y, worst + max(spread, 1e-6))
@@ -0,0 +1,575 @@
+"""
+backend.solvers.synthesis
+
+From truth table to scored circuit.
+
+    1. `synthesize_nor` turns a truth table into a network of two input NOR
+       and NOT gates (the only gates a repressor can implement): a
+       Quine-McCluskey cover of the function, or of its complement if that is
+       smaller, mapped onto NOR/NOT with structural hashing so shared
+       sub-expressions are built once.
+    2. `build_circuit` lays the network out as a `Circuit` whose input
+       signals are switched by real truth table bits.
+    3. `assign_gates` picks which characterized repressor implements each
+       gate. No two gates may share a repressor, and since an assignment only
+       changes parameters (not structure) whole batches of candidate
+       assignments are scored in one vectorized pass. Assignments breaking
+       the UCF placement rules are filtered out before scoring, in bulk over
+       the gate names or one layout at a time over the assembled parts.
+
+W.R. Jackson 2020
+"""
+import itertools
+from dataclasses import dataclass
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+
+from backend.datastructures import (
+    Circuit,
+    InputSignal,
+    Library,
+    RuleSet,
+    assemble_circuit,
+)
+from backend.datastructures.assembly import PartSequence
+from backend.datastructures.repressor import LogicFunction
+
+# Largest number of inputs the exact minimizer is run on.
+MAX_SYNTHESIS_INPUTS = 10
+
+
+@dataclass
+class GateModel:
+    '''
+    A characterized repressor gate available for assignment.
+
+    Attributes:
+        name: Gate name, e.g. `A1_AmtR`.
+        group: The repressor it's built on, e.g. `AmtR`. Gates sharing a
+            group would cross-talk, so at most one per group is used.
+        y_min, y_max, k, n: Response function parameters.
+    '''
+    name: str
+    group: str
+    y_min: float
+    y_max: float
+    k: float
+    n: float
+
+
+@dataclass
+class NorNetwork:
+    '''
+    A network of NOR/NOT gates.
+
+    Attributes:
+        inputs: Input names, most significant bit first.
+        gates: ('NOR' | 'NOT', sources) per gate in topological order, the
+            last gate being the output. Sources are ('input', index) or
+            ('gate', index).
+    '''
+    inputs: List[str]
+    gates: List[Tuple[str, Tuple[Tuple[str, int], ...]]]
+
+    def evaluate(self) -> np.ndarray:
+        '''
+        Returns:
+            (2^inputs,) boolean output over the truth table, for checking a
+            synthesis result.
+        '''
+        rows = np.arange(2 ** len(self.inputs))
+        bits = (rows[:, None] >> np.arange(len(self.inputs) - 1, -1, -1)) & 1
+        bits = bits.astype(bool)
+        outputs = []
+        for _, sources in self.gates:
+            values = [
+                bits[:, index] if kind == 'input' else outputs[index]
+                for kind, index in sources
+            ]
+            outputs.append(~np.logical_or.reduce(values))
+        return outputs[-1]
+
+
+def synthesize_nor(truth_table: np.ndarray, inputs: List[str]) -> NorNetwork:
+    '''
+    Args:
+        truth_table: (2^inputs,) boolean output, rows in counting order.
+        inputs: Input names, most significant bit first.
+
+    Returns:
+        A NOR/NOT network computing the table.
+    '''
+    truth_table = np.asarray(truth_table, dtype=bool).reshape(-1)
+    if len(truth_table) != 2 ** len(inputs):
+        raise RuntimeError('Truth table size does not match the input count.')
+    if len(inputs) > MAX_SYNTHESIS_INPUTS:
+        raise RuntimeError(
+            f'Synthesis supports at most {MAX_SYNTHESIS_INPUTS} inputs.'
+        )
+    if truth_table.all() or not truth_table.any():
+        raise RuntimeError('Constant functions need no circuit.')
+    candidates = []
+    for complemented in (False, True):
+        table = ~truth_table if complemented else truth_table
+        builder = _NetworkBuilder(len(inputs))
+        node = builder.sum_of_products(_minimum_cover(table, len(inputs)))
+        if complemented:
+            node = builder.negate(node)
+        candidates.append(builder.network(node, inputs))
+    return min(candidates, key=lambda network: len(network.gates))
+
+
+def build_circuit(
+        network: NorNetwork,
+        signals: Sequence[InputSignal],
+        gate_models: Sequence[GateModel] = None,
+) -> Circuit:
+    '''
+    Lays a NOR network out as a circuit.
+
+    Args:
+        network: The network to build.
+        signals: One input signal per network input, in the same order.
+        gate_models: Optional model per gate. Without them every gate gets
+            placeholder parameters, to be replaced by `assign_gates`.
+
+    Returns:
+        A circuit whose signals are switched by their truth table bit and
+        whose output is expected high when the function is true.
+    '''
+    if len(signals) != len(network.inputs):
+        raise RuntimeError(
+            f'Need {len(network.inputs)} input signals, got {len(signals)}.'
+        )
+    signal_count = len(signals)
+    n_bits = len(network.inputs)
+    input_indptr, input_indices = [0], []
+    logic_indptr, logic_indices = [0], []
+    for _, sources in network.gates:
+        for kind, index in sources:
+            if kind == 'input':
+                input_indices.append(index)
+                logic_indices.append(index)
+            else:
+                input_indices.append(signal_count + index)
+                logic_indices.append(n_bits + index)
+        input_indptr.append(len(input_indices))
+        logic_indptr.append(len(logic_indices))
+    if gate_models is None:
+        parameters = np.ones((len(network.gates), 4))
+        labels = None
+    else:
+        parameters = np.array([
+            [model.y_min, model.y_max, model.k, model.n]
+            for model in gate_models
+        ])
+        labels = [model.name for model in gate_models]
+    return Circuit(
+        signal_labels=[signal.label for signal in signals],
+        signal_levels=[[signal.off_value, signal.on_value]
+                       for signal in signals],
+        signal_bits=np.arange(signal_count),
+        y_min=parameters[:, 0],
+        y_max=parameters[:, 1],
+        k=parameters[:, 2],
+        n=parameters[:, 3],
+        number_of_inputs=[len(sources) for _, sources in network.gates],
+        logic=[
+            (LogicFunction.NOR if kind == 'NOR' else LogicFunction.NOT).value
+            for kind, _ in network.gates
+        ],
+        input_indptr=input_indptr,
+        input_indices=input_indices,
+        logic_indptr=logic_indptr,
+        logic_indices=logic_indices,
+        n_bits=n_bits,
+        active_low=False,
+        gate_labels=labels,
+    )
+
+
+def assign_gates(
+        circuit: Circuit,
+        gate_models: Sequence[GateModel],
+        samples: int = 512,
+        seed: int = None,
+        rules: RuleSet = None,
+        parts: Dict[str, dict] = None,
+        signals: Dict[str, InputSignal] = None,
+        output: Tuple[str, PartSequence] = None,
+) -> Tuple[Circuit, List[GateModel]]:
+    '''
+    Chooses a repressor for every gate: the best of a batch of random
+    assignments, improved by swapping single gates until no swap helps.
+
+    Args:
+        circuit: Circuit from `build_circuit`.
+        gate_models: Available gates.
+        samples: Random assignments scored up front.
+        seed: Seed for the random assignments.
+        rules: Placement rules. Assignments breaking them are rejected
+            before they are scored. Without `parts` they are checked against
+            the assigned gate names in gate order, so rules naming promoters
+            or terminators, as UCF circuit rules do, can never hold.
+        parts: Gate name to parts row, as for `assemble_circuit`. With it
+            (and `signals`) the rules are checked against the part names and
+            strands of each candidate's assembled layout instead.
+        signals: Input signal label to signal, as for `assemble_circuit`.
+        output: Output cassette, as for `assemble_circuit`.
+
+    Returns:
+        The assigned circuit and the model used for each gate.
+    '''
+    groups: Dict[str, List[int]] = {}
+    for index, model in enumerate(gate_models):
+        groups.setdefault(model.group, []).append(index)
+    gate_count = circuit.gate_count
+    if len(groups) < gate_count:
+        raise RuntimeError(
+            f'The circuit needs {gate_count} distinct repressors but the '
+            f'library only has {len(groups)}.'
+        )
+    parameters = np.array([
+        [model.y_min, model.y_max, model.k, model.n] for model in gate_models
+    ])
+    group_of = np.array([
+        list(groups).index(model.group) for model in gate_models
+    ])
+    generator = np.random.default_rng(seed)
+    group_lists = list(groups.values())
+    assignments = np.empty((samples, gate_count), dtype=np.int64)
+    for sample in range(samples):
+        chosen = generator.choice(len(group_lists), gate_count, replace=False)
+        assignments[sample] = [
+            group_lists[group][generator.integers(len(group_lists[group]))]
+            for group in chosen
+        ]
+    is_valid = None
+    if rules is not None and parts is not None:
+        is_valid = _placement_check(circuit, gate_models, rules, parts,
+                                    signals or {}, output)
+    elif rules is not None:
+        is_valid = _name_check(gate_models, rules)
+    scores = _score_assignments(circuit, parameters, assignments, is_valid)
+    if not np.isfinite(np.max(scores)):
+        if rules is None:
+            raise RuntimeError('No sampled assignment scores finitely.')
+        if parts is not None:
+            raise RuntimeError(
+                'No sampled assignment satisfies the rules.'
+            )
+        gate_names = {model.name for model in gate_models}
+        others = sorted(set(rules.vocabulary) - gate_names)
+        raise RuntimeError(
+            'No sampled assignment satisfies the rules. They are checked '
+            'over gate names only'
+            + (f', but also name {", ".join(others)}.' if others else '.')
+        )
+    best = assignments[np.argmax(scores)].copy()
+    best_score = float(np.max(scores))
+    improved = True
+    while improved:
+        improved = False
+        for gate in range(gate_count):
+            used = set(group_of[np.delete(best, gate)])
+            options = [
+                index for index in range(len(gate_models))
+                if group_of[index] not in used and index != best[gate]
+            ]
+            if not options:
+                continue
+            trials = np.repeat(best[None], len(options), axis=0)
+            trials[:, gate] = options
+            trial_scores = _score_assignments(
+                circuit,
+                parameters,
+                trials,
+                is_valid,
+            )
+            if np.max(trial_scores) > best_score + 1e-12:
+                best = trials[np.argmax(trial_scores)].copy()
+                best_score = float(np.max(trial_scores))
+                improved = True
+    assigned = circuit.copy()
+    assigned.y_min[:], assigned.y_max[:], assigned.k[:], assigned.n[:] = \
+        parameters[best].T
+    assigned.gate_labels = [gate_models[index].name for index in best]
+    return assigned, [gate_models[index] for index in best]
+
+
+def gate_models_from_csv(gates: Dict[str, dict]) -> List[GateModel]:
+    '''
+    Args:
+        gates: Output of `parse_gates_csv`.
+
+    Returns:
+        One model per NOR gate row, grouped by repressor (the CDS).
+    '''
+    return [
+        GateModel(
+            name=name,
+            group=row.get('cds') or name.split('_')[-1],
+            y_min=row['ymin'],
+            y_max=row['ymax'],
+            k=row['K'],
+            n=row['n'],
+        )
+        for name, row in gates.items()
+        if row.get('type', 'NOR') == 'NOR'
+    ]
+
+
+def gate_models_from_library(library: Library = None) -> List[GateModel]:
+    '''
+    Collects gate models from a parsed UCF, which links each entry of `gates`
+    to a `models` entry holding the response function parameters.
+
+    Args:
+        library: The parsed library. Defaults to the active singleton.
+
+    Returns:
+        One model per gate with a complete set of parameters.
+    '''
+    library = library if library is not None else Library()
+    return _gate_models(library.gates or {}, library.models or {})
+
+
+def gate_models_from_ucf(contents: List[dict]) -> List[GateModel]:
+    '''
+    As `gate_models_from_library`, straight from the UCF's JSON contents
+    (e.g. a UCF uploaded by the frontend) without touching the singleton.
+
+    Args:
+        contents: The parsed UCF JSON, a list of collection entries.
+
+    Returns:
+        One model per gate with a complete set of parameters.
+    '''
+    gates = {}
+    models = {}
+    for index, entry in enumerate(contents):
+        if not isinstance(entry, dict):
+            continue
+        name = entry.get('name', index)
+        if entry.get('collection') == 'gates':
+            gates[name] = entry
+        elif entry.get('collection') == 'models':
+            models[name] = entry
+    return _gate_models(gates, models)
+
+
+# ----------------------------- Private Functions ------------------------------
+def _gate_models(gates: dict, models: dict) -> List[GateModel]:
+    gate_models = []
+    for name, gate in gates.items():
+        model = models.get(gate.get('model'), {})
+        values = {
+            parameter.get('name'): parameter.get('value')
+            for parameter in model.get('parameters', [])
+        }
+        if not all(key in values for key in ('ymax', 'ymin', 'K', 'n')):
+            continue
+        gate_models.append(GateModel(
+            name=gate.get('name', str(name)),
+            group=gate.get('group') or str(name).split('_')[-1],
+            y_min=float(values['ymin']),
+            y_max=float(values['ymax']),
+            k=float(values['K']),
+            n=float(values['n']),
+        ))
+    return gate_models
+
+
+def _score_assignments(
+        circuit: Circuit,
+        parameters: np.ndarray,
+        assignments: np.ndarray,
+        is_valid: Callable[[np.ndarray], np.ndarray] = None,
+) -> np.ndarray:
+    if is_valid is not None:
+        valid = is_valid(assignments)
+        scores = np.full(len(assignments), float('-inf'))
+        if valid.any():
+            scores[valid] = _score_assignments(
+                circuit,
+                parameters,
+                assignments[valid],
+            )
+        return scores
+    chosen = parameters[assignments]
+    with np.errstate(all='ignore'):
+        scores = np.asarray(circuit.score(
+            y_min=chosen[..., 0],
+            y_max=chosen[..., 1],
+            k=chosen[..., 2],
+            n=chosen[..., 3],
+        ), dtype=np.float64).reshape(-1)
+    scores[~np.isfinite(scores)] = float('-inf')
+    return scores
+
+
+def _name_check(
+        gate_models: Sequence[GateModel],
+        rules: RuleSet,
+) -> Callable[[np.ndarray], np.ndarray]:
+    names = rules.encode([[model.name for model in gate_models]])[0]
+    return lambda trials: rules.check_many(names[trials])
+
+
+def _placement_check(
+        circuit: Circuit,
+        gate_models: Sequence[GateModel],
+        rules: RuleSet,
+        parts: Dict[str, dict],
+        signals: Dict[str, InputSignal],
+        output: Tuple[str, PartSequence] = None,
+) -> Callable[[np.ndarray], np.ndarray]:
+    # Layouts differ in length between assignments (not every gate has a
+    # ribozyme), so each is assembled and checked on its own. The swap search
+    # revisits assignments, hence the memo.
+    memo: Dict[tuple, bool] = {}
+    candidate = circuit.copy()
+
+    def check(assignment: np.ndarray) -> bool:
+        key = tuple(assignment)
+        if key not in memo:
+            candidate.gate_labels = [gate_models[index].name
+                                     for index in assignment]
+            features = assemble_circuit(candidate, parts, signals,
+                                        output).features
+            memo[key] = rules.check(
+                [feature.name for feature in features],
+                [feature.strand for feature in features],
+            )
+        return memo[key]
+
+    return lambda trials: np.array([check(trial) for trial in trials],
+                                   dtype=bool)
+
+
+def _minimum_cover(table: np.ndarray, width: int) -> List[Tuple[int, int]]:
+    '''
+    Quine-McCluskey prime implicants with a greedy cover.
+
+    Returns:
+        Implicants as (value, mask) pairs; mask bits are "don't care".
+    '''
+    minterms = set(np.flatnonzero(table).tolist())
+    current = {(term, 0) for term in minterms}
+    primes = set()
+    while current:
+        merged = set()
+        used = set()
+        for (value, mask), (other, other_mask) in itertools.combinations(
+                sorted(current), 2):
+            difference = value ^ other
+            if mask == other_mask and difference & (difference - 1) == 0:
+                merged.add((value & ~difference, mask | difference))
+                used.update({(value, mask), (other, other_mask)})
+        primes.update(current - used)
+        current = merged
+
+    def covers(implicant, term):
+        value, mask = implicant
+        return term & ~mask == value
+
+    uncovered = set(minterms)
+    cover = []
+    primes = sorted(primes, key=lambda implicant: (-bin(implicant[1]).count(
+        '1'), implicant))
+    while uncovered:
+        best = max(
+            primes,
+            key=lambda implicant: sum(
+                covers(implicant, term) for term in uncovered
+            ),
+        )
+        cover.append(best)
+        uncovered = {term for term in uncovered if not covers(best, term)}
+    return cover
+
+
+class _NetworkBuilder:
+    '''
+    Builds a hashed NOR/NOT DAG. Nodes are ('input', i), ('NOT', a) and
+    ('NOR', a, b) tuples, deduplicated through `self.nodes`.
+    '''
+
+    def __init__(self, width: int):
+        self.width = width
+        self.nodes: Dict[tuple, tuple] = {}
+
+    def node(self, *key) -> tuple:
+        return self.nodes.setdefault(key, key)
+
+    def negate(self, node: tuple) -> tuple:
+        if node[0] == 'NOT':
+            return node[1]
+        return self.node('NOT', node)
+
+    def nor(self, first: tuple, second: tuple) -> tuple:
+        if first == second:
+            return self.negate(first)
+        return self.node('NOR', *sorted((first, second), key=repr))
+
+    def conjunction(self, literals: List[tuple]) -> tuple:
+        while len(literals) > 1:
+            paired = [
+                self.nor(self.negate(a), self.negate(b))
+                for a, b in zip(literals[::2], literals[1::2])
+            ]
+            literals = paired + literals[len(paired) * 2:]
+        return literals[0]
+
+    def disjunction(self, terms: List[tuple]) -> tuple:
+        while len(terms) > 1:
+            paired = [
+                self.negate(self.nor(a, b))
+                for a, b in zip(terms[::2], terms[1::2])
+            ]
+            terms = paired + terms[len(paired) * 2:]
+        return terms[0]
+
+    def sum_of_products(self, cover: List[Tuple[int, int]]) -> tuple:
+        terms = []
+        for value, mask in cover:
+            literals = []
+            for position in range(self.width):
+                bit = 1 << (self.width - 1 - position)
+                if mask & bit:
+                    continue
+                literal = self.node('input', position)
+                literals.append(literal if value & bit
+                                else self.negate(literal))
+            terms.append(self.conjunction(literals))
+        return self.disjunction(terms)
+
+    def network(self, output: tuple, inputs: List[str]) -> NorNetwork:
+        if output[0] == 'input':
+            # A buffer still needs a gate to drive the output.
+            output = self.node('NOT', self.node('NOT', output))
+        order: Dict[tuple, int] = {}
+        gates = []
+
+        def visit(node: tuple):
+            if node[0] == 'input' or node in order:
+                return
+            for child in node[1:]:
+                visit(child)
+            sources = tuple(
+                ('input', child[1]) if child[0] == 'input'
+                else ('gate', order[child])
+                for child in node[1:]
+            )
+            order[node] = len(gates)
+            gates.append((node[0], sources))
+
+        visit(output)
+        return NorNetwork(inputs=list(inputs), gates=gates)
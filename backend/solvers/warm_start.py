@@ -0,0 +1,169 @@
+"""
+backend.solvers.warm_start
+
+Warm starts for `optimize_repressor` from previously solved gates.
+
+Library gates come in tight families (the BM3R1 variants, say) whose optimal
+edits sit close together, so a new gate is better started from where its
+nearest solved relatives ended up than from "no edit". Gates are compared by
+a feature vector of their own response parameters and the input levels they
+see, all in log10 space, through a k-d tree.
+
+W.R. Jackson 2020
+"""
+from typing import (
+    List,
+    Sequence,
+    Union,
+)
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from backend.datastructures import (
+    Circuit,
+    Repressor,
+)
+
+# Length of a `repressor_features` vector.
+FEATURE_COUNT = 6
+
+
+def repressor_features(repressor: Union[Repressor, Circuit]) -> np.ndarray:
+    '''
+    Args:
+        repressor: The repressor (or circuit) whose output gate to describe.
+
+    Returns:
+        log10 of the output gate's [y_min, y_max, k, n, lowest input, highest
+        input].
+    '''
+    circuit = repressor if isinstance(repressor, Circuit) \
+        else Circuit.from_repressor(repressor)
+    gate = circuit.output
+    levels = circuit.input_levels()[:, gate]
+    with np.errstate(divide='ignore'):
+        return np.log10(np.array([
+            circuit.y_min[gate],
+            circuit.y_max[gate],
+            circuit.k[gate],
+            circuit.n[gate],
+            levels.min(),
+            levels.max(),
+        ]))
+
+
+class WarmStartIndex:
+    '''
+    Usage:
+        index = store.warm_start_index(mode='DNA')
+        optimize_repressor(repressor, 'Nelder-Mead', warm_start=index)
+    '''
+
+    def __init__(
+            self,
+            features: np.ndarray,
+            solutions: Sequence[Sequence[float]],
+            scores: Sequence[float] = None,
+    ):
+        '''
+        Args:
+            features: (N, F) features of the solved gates, from
+                `repressor_features`.
+            solutions: N result vectors, all the same length.
+            scores: N scores, used to break ties between equally near gates.
+        '''
+        features = np.asarray(features, dtype=np.float64)
+        solutions = np.asarray(solutions, dtype=np.float64)
+        keep = np.all(np.isfinite(features), axis=1) & \
+            np.all(np.isfinite(solutions), axis=1)
+        self.features = features[keep]
+        self.solutions = solutions[keep]
+        self.scores = np.zeros(len(keep)) if scores is None \
+            else np.asarray(scores, dtype=np.float64)
+        self.scores = self.scores[keep]
+        self._tree = cKDTree(self.features) if len(self.features) else None
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def neighbours(
+            self,
+            repressor: Union[Repressor, Circuit, np.ndarray],
+            count: int = 5,
+    ) -> np.ndarray:
+        '''
+        Args:
+            repressor: The gate to start, or its features.
+            count: Largest number of neighbours to return.
+
+        Returns:
+            (<= count, V) solutions of the nearest solved gates, nearest
+            first.
+        '''
+        if self._tree is None:
+            return np.empty((0, self.solutions.shape[1]))
+        features = repressor if isinstance(repressor, np.ndarray) \
+            else repressor_features(repressor)
+        if not np.all(np.isfinite(features)):
+            return np.empty((0, self.solutions.shape[1]))
+        count = min(count, len(self))
+        distances, indices = self._tree.query(features, k=count)
+        distances = np.atleast_1d(distances)
+        indices = np.atleast_1d(indices)
+        order = np.lexsort((-self.scores[indices], distances))
+        return self.solutions[indices[order]]
+
+    def initial_point(
+            self,
+            repressor: Union[Repressor, Circuit],
+            bounds: List[List[float]] = None,
+    ) -> np.ndarray:
+        '''
+        Returns:
+            The nearest solved gate's solution, clipped to the bounds, or None
+            when the index is empty.
+        '''
+        neighbours = self.neighbours(repressor, count=1)
+        if not len(neighbours):
+            return None
+        return _clip(neighbours[0], bounds)
+
+    def initial_population(
+            self,
+            repressor: Union[Repressor, Circuit],
+            size: int,
+            bounds: List[List[float]],
+            seed: int = None,
+    ) -> np.ndarray:
+        '''
+        Seeds a population-based optimizer: the nearest solutions first, the
+        rest drawn uniformly within the bounds to keep the search global.
+
+        Args:
+            repressor: The gate to start.
+            size: Population size.
+            bounds: (V, 2) bounds per variable.
+            seed: Seed for the uniform draws.
+
+        Returns:
+            (size, V) starting population.
+        '''
+        bounds = np.asarray(bounds, dtype=np.float64)
+        generator = np.random.default_rng(seed)
+        population = generator.uniform(
+            bounds[:, 0],
+            bounds[:, 1],
+            (size, len(bounds)),
+        )
+        neighbours = self.neighbours(repressor, count=max(size // 2, 1))
+        if len(neighbours):
+            population[:len(neighbours)] = _clip(neighbours, bounds)
+        return population
+
+
+def _clip(points: np.ndarray, bounds) -> np.ndarray:
+    if bounds is None:
+        return np.array(points, dtype=np.float64)
+    bounds = np.asarray(bounds, dtype=np.float64)
+    return np.clip(points, bounds[:, 0], bounds[:, 1])
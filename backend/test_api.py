@@ -1,4 +1,20 @@
+import json
+import urllib.error
+import urllib.request
+
+from backend.api_interactions import cello_requests
+from backend.api_interactions.cache import ResultCache
 from backend.api_interactions.cello_requests import CelloAPI
+from backend.api_interactions.load_test import run_load_test
+from backend.api_interactions.scheduler import (
+    Backoff,
+    CelloScheduler,
+)
+from backend.api_interactions.service import OptimizationService
+from backend.api_interactions.stand_in import (
+    RESULTS_ROOT,
+    CelloStandIn,
+)
 
 import pytest
 
@@ -17,3 +33,473 @@ def test_cello_auth_context_manager(instantiate_cello_api):
     cello_api = instantiate_cello_api
     with cello_api.auth as authentication_mechanism:
         pass
+
+
+# ------------------------------- Scheduler Tests ------------------------------
+class FakeCello:
+    '''
+    Stands in for `CelloAPI`. Each job reports results after a fixed number of
+    polls.
+    '''
+
+    def __init__(self, polls_until_done: int = 2):
+        self.polls_until_done = polls_until_done
+        self.submitted = []
+        self.polls = {}
+
+    def submit(self, job_id, verilog_fp, inputs_fp, outputs_fp, options=None):
+        self.submitted.append(job_id)
+
+    def get_results(self, job_id=None, refresh=False):
+        self.polls[job_id] = self.polls.get(job_id, 0) + 1
+        if self.polls[job_id] >= self.polls_until_done:
+            return json.dumps([f'{job_id}_output.txt'])
+        return '[]'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def design_directory(tmp_path):
+    for name in ['AND', 'OR', 'NOR']:
+        (tmp_path / f'{name}.v').write_text(f'module {name}();\nendmodule\n')
+    return tmp_path
+
+
+def test_scheduler_runs_batch(design_directory):
+    api = FakeCello()
+    clock = FakeClock()
+    scheduler = CelloScheduler(
+        api,
+        'Inputs.txt',
+        'Outputs.txt',
+        str(design_directory / 'state.json'),
+        max_concurrent=2,
+        sleep=clock.sleep,
+        clock=clock.time,
+    )
+    scheduler.add_directory(str(design_directory))
+    finished = list(scheduler.run())
+    assert len(finished) == 3
+    assert all(job.status == 'complete' for job in finished)
+    assert all(job.result for job in finished)
+    assert scheduler.summary() == {'complete': 3}
+
+
+def test_scheduler_resumes_from_state(design_directory):
+    state_fp = str(design_directory / 'state.json')
+    clock = FakeClock()
+    api = FakeCello(polls_until_done=3)
+    scheduler = CelloScheduler(
+        api, 'Inputs.txt', 'Outputs.txt', state_fp,
+        max_concurrent=3, sleep=clock.sleep, clock=clock.time,
+    )
+    scheduler.add_directory(str(design_directory))
+    run = scheduler.run()
+    first = next(run)
+    run.close()
+    # Simulate a restart. Nothing is resubmitted and the finished job is not
+    # yielded twice.
+    resumed = CelloScheduler(
+        api, 'Inputs.txt', 'Outputs.txt', state_fp,
+        max_concurrent=3, sleep=clock.sleep, clock=clock.time,
+    )
+    resumed.add_directory(str(design_directory))
+    remaining = list(resumed.run())
+    assert len(api.submitted) == 3
+    assert first.job_id not in [job.job_id for job in remaining]
+    assert len(remaining) == 2
+
+
+def test_scheduler_polls_progressing_jobs_promptly(design_directory):
+    class ProgressingCello(FakeCello):
+        # One more output file listed per poll.
+        def get_results(self, job_id=None, refresh=False):
+            self.polls[job_id] = self.polls.get(job_id, 0) + 1
+            return json.dumps([f'file{index}'
+                               for index in range(self.polls[job_id] - 1)])
+
+    clock = FakeClock()
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.sleep(seconds)
+
+    scheduler = CelloScheduler(
+        ProgressingCello(),
+        'Inputs.txt',
+        'Outputs.txt',
+        str(design_directory / 'state.json'),
+        max_concurrent=1,
+        poll_initial=1.0,
+        poll_max=64.0,
+        is_complete=lambda listing: len(json.loads(listing)) >= 4,
+        sleep=sleep,
+        clock=clock.time,
+    )
+    scheduler.add_design(str(design_directory / 'AND.v'))
+    assert [job.status for job in scheduler.run()] == ['complete']
+    # Without resets the interval would have doubled on every poll.
+    assert max(sleeps) < 3.0
+
+
+def test_backoff_grows_and_resets():
+    backoff = Backoff(initial=1.0, maximum=4.0, jitter=0)
+    assert [backoff.next() for _ in range(4)] == [1.0, 2.0, 4.0, 4.0]
+    backoff.reset()
+    assert backoff.next() == 1.0
+
+
+# --------------------------------- Cache Tests --------------------------------
+def test_cache_immutable_and_ttl(tmp_path):
+    clock = FakeClock()
+    cache = ResultCache(str(tmp_path), ttl=10, clock=clock.time)
+    artifact = {'job_id': 'abc', 'filename': 'abc_reutable.txt'}
+    listing = {'keyword': 'input_', 'extension:': '.txt'}
+    cache.put('results', artifact, 'REU TABLE')
+    cache.put('in_out', listing, '["input_pTac.txt"]')
+    assert cache.get('results', artifact) == 'REU TABLE'
+    assert cache.get('in_out', listing) == '["input_pTac.txt"]'
+    clock.sleep(60)
+    # Job artifacts never expire, listings do.
+    assert cache.get('results', artifact) == 'REU TABLE'
+    assert cache.get('in_out', listing) is None
+    # Nothing that uploads content is ever cached.
+    cache.put('in_out', {'filename': 'x', 'filetext': 'y'}, 'ok')
+    assert cache.get('in_out', {'filename': 'x', 'filetext': 'y'}) is None
+    # Reads don't rewrite the index; their access times go out on close.
+    index_fp = tmp_path / 'index.json'
+    written = index_fp.read_text()
+    assert cache.get('results', artifact) == 'REU TABLE'
+    assert index_fp.read_text() == written
+    cache.close()
+    assert index_fp.read_text() != written
+    # The index survives a restart.
+    reopened = ResultCache(str(tmp_path), ttl=10, clock=clock.time)
+    assert reopened.get('results', artifact) == 'REU TABLE'
+
+
+def test_cache_deduplicates_and_evicts(tmp_path):
+    clock = FakeClock()
+    cache = ResultCache(str(tmp_path), max_bytes=250, clock=clock.time)
+    for index in range(2):
+        cache.put('results', {'job_id': str(index), 'filename': 'f'}, 'a' * 100)
+        clock.sleep(1)
+    # Identical content is only stored once.
+    assert cache.size() == 100
+    cache.put('results', {'job_id': '2', 'filename': 'f'}, 'b' * 100)
+    clock.sleep(1)
+    cache.get('results', {'job_id': '0', 'filename': 'f'})
+    clock.sleep(1)
+    cache.put('results', {'job_id': '3', 'filename': 'f'}, 'c' * 100)
+    assert cache.size() <= 250
+    # The least recently used blob went, the recently read one stayed.
+    assert cache.get('results', {'job_id': '2', 'filename': 'f'}) is None
+    assert cache.get('results', {'job_id': '0', 'filename': 'f'}) == 'a' * 100
+
+
+def test_cache_waits_for_finished_listings(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    listing = {'job_id': 'abc', 'extension': 'reutable.txt'}
+    # An unfinished job lists nothing yet, so that answer isn't kept.
+    cache.put('results', listing, '[]')
+    assert cache.get('results', listing) is None
+    cache.put('results', listing, '["abc_A000_reutable.txt"]')
+    assert cache.get('results', listing) == '["abc_A000_reutable.txt"]'
+
+
+def test_cached_fetch_skips_network(tmp_path, monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError('Network should not be touched on a cache hit.')
+
+    monkeypatch.setattr(cello_requests.requests, 'get', no_network)
+    cache = ResultCache(str(tmp_path))
+    cache.put(
+        'results',
+        {'job_id': 'abc', 'filename': 'abc_reutable.txt'},
+        'REU TABLE',
+    )
+    api = CelloAPI(username=USERNAME, password=PASSWORD, cache=cache)
+    assert api.get_results('abc', filename='abc_reutable.txt') == 'REU TABLE'
+
+
+@pytest.mark.parametrize('status, message', [
+    (401, 'rejected the supplied credentials'),
+    (403, 'rejected the supplied credentials'),
+    (404, 'Unexpected response'),
+])
+def test_authentication_reports_status(monkeypatch, status, message):
+    class Response:
+        status_code = status
+
+    monkeypatch.setattr(
+        cello_requests.requests, 'get', lambda *args, **kwargs: Response(),
+    )
+    auth = cello_requests.CelloAuth(
+        'http://cello.invalid', username=USERNAME, password=PASSWORD,
+    )
+    with pytest.raises(RuntimeError, match=message):
+        auth.validate_authentication()
+
+
+def test_scheduler_polls_past_cached_listing(design_directory, tmp_path):
+    # Jobs list no results at first. A cached listing would hide the change
+    # and every job would run into the timeout.
+    with CelloStandIn(job_duration=0.2, seed=0) as server:
+        api = stand_in_api(server, cache=ResultCache(str(tmp_path / 'cache')))
+        scheduler = CelloScheduler(
+            api,
+            'example_files/Inputs.txt',
+            'example_files/Outputs.txt',
+            str(design_directory / 'state.json'),
+            max_concurrent=3,
+            poll_initial=0.05,
+            poll_max=0.1,
+            job_timeout=5.0,
+        )
+        scheduler.add_directory(str(design_directory))
+        finished = list(scheduler.run())
+    assert [job.status for job in finished] == ['complete'] * 3
+
+
+def test_scheduler_fails_rejected_submissions(design_directory):
+    with CelloStandIn(seed=0) as server:
+        api = stand_in_api(server, retries=1)
+        api.auth.validate_authentication()
+        server.failure_rate = 1.0
+        scheduler = CelloScheduler(
+            api,
+            'example_files/Inputs.txt',
+            'example_files/Outputs.txt',
+            str(design_directory / 'state.json'),
+            poll_initial=0.01,
+            job_timeout=5.0,
+        )
+        scheduler.add_design(str(design_directory / 'AND.v'))
+        finished = list(scheduler.run())
+    assert finished[0].status == 'failed'
+    assert finished[0].error.startswith('Submission failed')
+    assert finished[0].polls == 0
+
+
+# ------------------------------- Stand-In Tests -------------------------------
+@pytest.fixture
+def stand_in():
+    with CelloStandIn(seed=0) as server:
+        yield server
+
+
+def stand_in_api(server, **kwargs):
+    return CelloAPI(
+        url=server.url,
+        username=USERNAME,
+        password=PASSWORD,
+        retry_backoff=0.001,
+        **kwargs,
+    )
+
+
+def test_cello_auth_against_stand_in(stand_in):
+    cello_api = stand_in_api(stand_in)
+    with cello_api.auth as authentication_mechanism:
+        assert authentication_mechanism is not None
+    assert cello_api.auth.validated
+
+
+def test_stand_in_round_trip(stand_in):
+    cello_api = stand_in_api(stand_in)
+    cello_api.post_input('pTac', 0.0034, 2.8, 'AACGATCG')
+    assert json.loads(cello_api.get_inputs()) == ['input_pTac.text']
+    assert cello_api.get_inputs('pTac').startswith('pTac 0.0034 2.8')
+    cello_api.submit('job1', 'example_files/AND.v', 'example_files/Inputs.txt',
+                     'example_files/Outputs.txt')
+    listing = json.loads(cello_api.get_results('job1'))
+    assert 'job1_A000_reutable.txt' in listing
+    assert 'REU' in cello_api.get_results('job1', filename=listing[-1])
+
+
+def test_retries_ride_out_injected_failures():
+    with CelloStandIn(failure_rate=0.3, seed=1) as server:
+        cello_api = stand_in_api(server, retries=10)
+        for _ in range(20):
+            cello_api.get_results()
+        assert cello_api.retry_count + cello_api.auth.retry_count > 0
+        assert server.failures_injected > 0
+
+
+def test_load_test_harness(stand_in):
+    report = run_load_test(
+        lambda: stand_in_api(stand_in),
+        lambda api: api.get_inputs(),
+        total_requests=40,
+        concurrency=4,
+    )
+    assert report.failures == 0
+    assert report.throughput > 0
+    assert report.latency_p50 <= report.latency_p99 <= report.latency_max
+
+
+def test_load_test_counts_error_responses():
+    # A 404 isn't retried and comes back as text rather than raising.
+    with CelloStandIn(failure_status=404, seed=0) as server:
+        clients = [stand_in_api(server) for _ in range(2)]
+        for client in clients:
+            client.auth.validate_authentication()
+        server.failure_rate = 1.0
+        report = run_load_test(
+            clients.pop,
+            lambda api: api.get_results(),
+            total_requests=8,
+            concurrency=2,
+        )
+    assert report.failures == 8
+
+
+def test_read_genbank_streams_to_disk(stand_in, tmp_path, capsys):
+    cello_api = stand_in_api(stand_in)
+    cello_api.submit('job1', 'example_files/AND.v', 'example_files/Inputs.txt',
+                     'example_files/Outputs.txt')
+    destination = str(tmp_path / 'plasmid.ape')
+    filepath = cello_api.read_genbank(
+        'job1',
+        'job1_A000_plasmid_circuit_P000.ape',
+        seq=True,
+        destination=destination,
+    )
+    assert filepath == destination
+    assert 'L3S2P11' in capsys.readouterr().out
+    with open(destination) as genbank_file:
+        assert genbank_file.read().startswith('LOCUS')
+    # Without a destination or a cache the file is read once and not kept.
+    assert cello_api.read_genbank(
+        'job1', 'job1_A000_plasmid_circuit_P000.ape',
+    ) is None
+    assert 'L3S2P11' in capsys.readouterr().out
+
+
+def test_read_genbank_keeps_downloads_in_cache(stand_in, tmp_path, capsys):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    cello_api = stand_in_api(stand_in, cache=cache)
+    cello_api.submit('job1', 'example_files/AND.v', 'example_files/Inputs.txt',
+                     'example_files/Outputs.txt')
+    filepaths = [
+        cello_api.read_genbank('job1', 'job1_A000_plasmid_circuit_P000.ape')
+        for _ in range(2)
+    ]
+    assert filepaths[0] == filepaths[1]
+    assert filepaths[0].startswith(str(tmp_path / 'cache'))
+    assert stand_in.requests_served[RESULTS_ROOT] == 1
+    assert capsys.readouterr().out.count('L3S2P11') == 2
+    assert not list((tmp_path / 'cache').glob('*.part'))
+
+
+def test_finished_listings_served_from_cache(stand_in, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    index_fp = tmp_path / 'index.json'
+    with stand_in_api(stand_in, cache=cache) as api:
+        api.submit('job1', 'example_files/AND.v', 'example_files/Inputs.txt',
+                   'example_files/Outputs.txt')
+        served = stand_in.requests_served.get('results', 0)
+        listings = [api.fetch_extension('job1', 'reutable.txt')
+                    for _ in range(2)]
+        assert listings[0] == listings[1]
+        assert 'job1_A000_reutable.txt' in json.loads(listings[0])
+        assert stand_in.requests_served['results'] == served + 1
+        written = index_fp.read_text()
+    # Leaving the client flushes the access times buffered by the cache hit.
+    assert index_fp.read_text() != written
+
+
+# ------------------------------- Service Tests --------------------------------
+def service_request(service, operation, path, payload=None, origin=None):
+    headers = {'Content-Type': 'application/json'}
+    if origin is not None:
+        headers['Origin'] = origin
+    request = urllib.request.Request(
+        service.url + path,
+        data=json.dumps(payload).encode('utf-8') if payload else None,
+        method=operation,
+        headers=headers,
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def test_optimization_service_caches_results():
+    with open('example_files/AND.v') as verilog_file:
+        verilog = verilog_file.read()
+    with OptimizationService(workers=1) as service:
+        status, body = service_request(service, 'POST', '/libraries', {
+            'gates_csv_path': 'example_files/gates_Eco1C1G1T1.csv',
+            'input_signals_path': 'example_files/Inputs.txt',
+        })
+        assert status == 201
+        job = {
+            'library_id': body['library_id'],
+            'kind': 'score',
+            'verilog': verilog,
+            'assignment_samples': 64,
+        }
+        status, body = service_request(service, 'POST', '/jobs', job)
+        assert status == 202
+        status, body = service_request(
+            service, 'GET', f'/jobs/{body["job_id"]}?wait=30',
+        )
+        assert body['status'] == 'complete'
+        assert body['result']['truth_table'] == [0, 0, 0, 1]
+        status, cached = service_request(service, 'POST', '/jobs', job)
+        assert status == 200 and cached['cached']
+        assert cached['result'] == body['result']
+        assert service_request(service, 'GET', '/jobs/missing')[0] == 404
+        assert service_request(
+            service, 'GET', f'/jobs/{body["job_id"]}?wait=abc',
+        )[0] == 400
+        assert service.health()['cache_hits'] == 1
+        # Browsers are only served from the frontend's origin.
+        library = {'gates_csv_path': '/etc/passwd'}
+        assert service_request(service, 'POST', '/libraries', library,
+                               origin='http://evil.example')[0] == 403
+        assert service_request(service, 'GET', '/health',
+                               origin='http://localhost:3000')[0] == 200
+
+
+def test_optimization_service_backpressure_and_timeout():
+    with open('example_files/AND.v') as verilog_file:
+        verilog = verilog_file.read()
+    with OptimizationService(workers=1, queue_size=1) as service:
+        library_id = service.add_library(
+            gates_csv_path='example_files/gates_Eco1C1G1T1.csv',
+            input_signals_path='example_files/Inputs.txt',
+        )
+        statuses = [
+            service_request(service, 'POST', '/jobs', {
+                'library_id': library_id,
+                'kind': 'optimize',
+                'verilog': verilog,
+                'repressor_max': 2,
+                'seed': seed,
+                'timeout': 0.001,
+            })
+            for seed in range(4)
+        ]
+        assert 429 in [status for status, _ in statuses]
+        job = service.wait(statuses[0][1]['job_id'], timeout=30)
+        assert job.status == 'timeout'
+        assert service.health()['timeouts'] >= 1
+        # The replacement worker still serves jobs.
+        job = service.submit(library_id, 'score', verilog,
+                             assignment_samples=16)
+        assert service.wait(job.job_id, timeout=30).status == 'complete'
@@ -5,14 +5,44 @@ TODO: WORDS GOOD PLEASE.
 
 W.R. Jackson 2020
 """
+import json
+import subprocess
+import sys
 
+import numpy as np
 import pytest
 
 from backend import (
+    Circuit,
+    GateModel,
     InputSignal,
+    NorNetwork,
+    PipelineConfig,
     Repressor,
+    RobustnessScorer,
+    RuleSet,
+    RunStore,
+    SequenceStore,
+    assign_gates,
+    budget_optimize,
+    build_circuit,
+    cheapest_design,
+    collect_designs,
+    dose_response_curves,
+    morris_screening,
+    optimize_circuit,
     optimize_repressor,
+    pareto_optimize,
+    response_function,
+    robustness_score,
+    run_pipeline,
+    score_responses,
+    simulate_transitions,
+    sobol_indices,
+    surrogate_minimize,
+    synthesize_nor,
 )
+from backend.solvers.pipeline import completed_designs
 
 # -------------------------------- Test Fixtures -------------------------------
 @pytest.fixture
@@ -165,6 +195,34 @@ def test_response_function_calculation(generate_s1_gate, generate_ptet):
            pytest.approx(1.2965, 0.1)
 
 
+def test_array_response_function(generate_s1_gate, generate_ptet):
+    s1 = generate_s1_gate
+    s1.set_biological_inputs([generate_ptet])
+    s1.set_logical_function('NOT')
+    levels = np.array([0.0013, 4.4])
+    expected = []
+    for bits in (0b1111, 0b0101):
+        s1.set_logical_inputs([bits])
+        expected.append(s1.calculate_response_function())
+    assert s1.response(levels) == pytest.approx(expected)
+    buffer = np.empty(2, dtype=np.float32)
+    assert s1.response(levels, out=buffer) is buffer
+    assert buffer == pytest.approx(expected, rel=1e-6)
+    parameters = np.array([
+        [s1.y_min, s1.y_max, s1.k, s1.n],
+        [s1.y_min, s1.y_max, s1.k * 2, s1.n],
+    ])
+    curves = dose_response_curves(parameters, levels, dtype=np.float32)
+    assert curves.shape == (2, 2) and curves.dtype == np.float32
+    assert curves[0] == pytest.approx(expected, rel=1e-6)
+    assert curves[1, 1] > curves[0, 1]
+    assert response_function(
+        levels[:, None], *parameters.T,
+    ) == pytest.approx(curves.T, rel=1e-6)
+    with pytest.raises(RuntimeError):
+        s1.response(levels, out=np.empty(3))
+
+
 def test_connected_gates(
         generate_s1_gate,
         generate_p1_gate,
@@ -244,3 +302,608 @@ def test_optimize_repressor(
     results = optimize_repressor(p1, 'Nelder-Mead')
 
 
+def test_run_store_reuses_finished_runs(
+        generate_s1_gate,
+        generate_ptet,
+        tmp_path,
+):
+    s1 = generate_s1_gate
+    s1.set_biological_inputs([generate_ptet])
+    s1.set_logical_function('NOT')
+    db_path = str(tmp_path / 'runs.sqlite')
+    with RunStore(db_path) as store:
+        run = store.optimize(s1, 'Nelder-Mead', gate='S1_SrpR')
+        assert run.run_id is not None
+        assert run.x[0] == pytest.approx(0.197, 0.1)
+        assert run.evaluations > 0
+        brute = store.optimize(s1, 'brute', gate='S1_SrpR')
+        assert brute.score is not None
+    with RunStore(db_path) as store:
+        assert store.optimize(s1, 'Nelder-Mead').run_id == run.run_id
+        assert store.best('S1_SrpR').score == max(run.score, brute.score)
+        assert [found.method for found in store.query(
+            gate='S1_SrpR', method='brute', mode='DNA',
+        )] == ['brute']
+        assert store.query(min_score=run.score + 1e6) == []
+        s1.k *= 2
+        assert store.optimize(s1, 'Nelder-Mead').run_id != run.run_id
+
+
+def test_warm_start_from_solved_gates(
+        generate_s1_gate,
+        generate_ptet,
+):
+    s1 = generate_s1_gate
+    s1.set_biological_inputs([generate_ptet])
+    s1.set_logical_function('NOT')
+    with RunStore(':memory:') as store:
+        solved = store.optimize(s1, 'Nelder-Mead')
+        index = store.warm_start_index(mode='DNA')
+        assert len(index) == 1
+        assert index.neighbours(s1)[0].tolist() == solved.x
+        s1.k *= 1.05
+        cold = optimize_repressor(s1, 'Nelder-Mead')
+        warm = optimize_repressor(s1, 'Nelder-Mead', warm_start=index)
+        assert warm.nfev < cold.nfev
+        assert -warm.fun == pytest.approx(-cold.fun, abs=1e-3)
+        population = index.initial_population(
+            s1, 10, [[0.0, 10.0], [0, 0.5]], seed=0,
+        )
+        assert population.shape == (10, 2)
+        assert population[0].tolist() == np.clip(
+            solved.x, [0.0, 0.0], [10.0, 0.5],
+        ).tolist()
+        warm_run = store.optimize(s1, 'Nelder-Mead', warm_start=True)
+        assert warm_run.evaluations == warm.nfev
+
+
+def test_warm_start_from_empty_store(generate_s1_gate, generate_ptet):
+    s1 = generate_s1_gate
+    s1.set_biological_inputs([generate_ptet])
+    s1.set_logical_function('NOT')
+    with RunStore(':memory:') as store:
+        index = store.warm_start_index(mode='DNA')
+        assert len(index) == 0
+        assert index.initial_point(s1) is None
+        population = index.initial_population(
+            s1, 10, [[0.0, 10.0], [0, 0.5]], seed=0,
+        )
+        assert population.shape == (10, 2)
+        run = store.optimize(s1, 'Nelder-Mead', warm_start=True)
+        assert run.evaluations == optimize_repressor(s1, 'Nelder-Mead').nfev
+
+
+def test_surrogate_optimization(generate_s1_gate, generate_ptet):
+    def objective(x):
+        return (x[0] - 0.3) ** 2 + 2 * (x[1] + 0.5) ** 2 + np.sin(3 * x[0])
+
+    result = surrogate_minimize(
+        objective,
+        [[-2, 2], [-2, 2]],
+        max_evaluations=30,
+        batch_size=3,
+        seed=0,
+    )
+    assert result.nfev == 30
+    assert result.x == pytest.approx([-0.369, -0.5], abs=0.05)
+    s1 = generate_s1_gate
+    s1.set_biological_inputs([generate_ptet])
+    s1.set_logical_function('NOT')
+    reference = optimize_repressor(s1, 'differential-evolution', 'ALL', seed=0)
+    surrogate = optimize_repressor(s1, 'surrogate', 'ALL', seed=0)
+    assert surrogate.nfev * 10 <= reference.nfev
+    assert -surrogate.fun == pytest.approx(-reference.fun, abs=0.01)
+
+
+# ------------------------------- Sequence Store -------------------------------
+def test_sequence_store_round_trip():
+    store = SequenceStore()
+    sequences = [
+        'ATGCATGCA',
+        'CTTGTCCAACCAAATgattcgttaccctttgacagTTTCTATCG',
+        'ACGTNNRYacgtnWTT',
+        '',
+        'A',
+    ]
+    handles = [store.intern(sequence) for sequence in sequences]
+    for sequence, handle in zip(sequences, handles):
+        assert str(handle) == sequence
+        assert len(handle) == len(sequence)
+        for start in range(len(sequence)):
+            for stop in range(start, len(sequence) + 1):
+                assert handle[start:stop].decode() == sequence[start:stop]
+    assert handles[2][4] == 'N'
+    assert handles[1][-3:] == 'TCG'
+
+
+def test_sequence_store_deduplicates():
+    store = SequenceStore()
+    cds = 'ATGGAAAGCACCCCGACCAAACAGAAAGCAATTTTTAGC' * 20
+    first = store.intern(cds)
+    second = store.intern(''.join(list(cds)))
+    assert first == second
+    assert len(store) == 1
+    # Four bases to the byte.
+    assert store.nbytes == len(cds) // 4
+
+
+def test_rule_set_checks_placements():
+    rules = RuleSet(
+        {
+            'function': 'AND',
+            'rules': [
+                'STARTSWITH L3S2P55',
+                'pTac BEFORE pTet',
+                'NOT pAmtR NEXTTO pTet',
+                'NOTCONTAINS pBAD',
+                'pTac NOTMORETHAN 1',
+                {
+                    'function': 'OR',
+                    'rules': ['[1] EQUALS #in0', '[1] EQUALS pTet'],
+                },
+            ],
+        },
+        bindings={'#in0': 'pTac'},
+    )
+    candidates = [
+        ['L3S2P55', 'pTac', 'A1_AmtR', 'pTet', 'YFP'],
+        ['L3S2P55', 'pTet', 'pTac'],
+        ['pTac', 'L3S2P55'],
+        ['L3S2P55', 'pTac', 'pAmtR', 'pTet'],
+        ['L3S2P55', 'pTac', 'pBAD'],
+        ['L3S2P55', 'pTac', 'pTac'],
+        ['L3S2P55', 'pTet'],
+        ['L3S2P55'],
+    ]
+    expected = [True, False, False, False, False, False, True, False]
+    assert [rules.check(parts) for parts in candidates] == expected
+    assert rules.check_many(candidates).tolist() == expected
+    orientation = RuleSet(['ALL_FORWARD'])
+    assert orientation.check(['pTac', 'pTet'])
+    assert not orientation.check(['pTac', 'pTet'], strands=[1, -1])
+    with pytest.raises(RuntimeError):
+        RuleSet(['[0] EQUALS #in1'])
+
+
+# ---------------------------------- Circuits ----------------------------------
+@pytest.fixture
+def generate_two_gate_circuit(
+        generate_s1_gate,
+        generate_p1_gate,
+        generate_plux_star,
+        generate_ptet,
+):
+    '''
+    The canonical S1 -> P1 cascade, returned as its output repressor.
+    '''
+    s1 = generate_s1_gate
+    s1.set_biological_inputs([generate_ptet])
+    s1.set_logical_function('NOT')
+    p1 = generate_p1_gate
+    p1.set_biological_inputs([generate_plux_star, s1])
+    p1.set_logical_function('NOR')
+    return p1
+
+
+def test_circuit_matches_repressor_score(generate_two_gate_circuit):
+    p1 = generate_two_gate_circuit
+    circuit = Circuit.from_repressor(p1)
+    assert circuit.gate_count == 2
+    assert circuit.signal_count == 2
+    assert circuit.score() == pytest.approx(p1.score_self())
+    # Round trip back to objects.
+    rebuilt = circuit.to_repressor()
+    assert rebuilt.score_self() == pytest.approx(p1.score_self())
+
+
+def test_circuit_batched_evaluation(generate_two_gate_circuit):
+    circuit = Circuit.from_repressor(generate_two_gate_circuit)
+    scales = np.linspace(0.5, 2.0, 5)
+    k = circuit.k[None, :] * scales[:, None]
+    batched = circuit.score(k=k)
+    assert batched.shape == (5,)
+    for index, scale in enumerate(scales):
+        variant = circuit.copy()
+        variant.k *= scale
+        assert variant.score() == pytest.approx(batched[index])
+    # Copies don't share parameters.
+    assert circuit.k[0] == generate_two_gate_circuit.biological_inputs[1].k
+
+
+def test_score_table(generate_two_gate_circuit, capsys):
+    p1 = generate_two_gate_circuit
+    table = p1.build_score_table()
+    assert table.shape == (4,)
+    assert table['logical_input'].shape == (4, 2)
+    assert table['biological_input'].shape == (4, 2)
+    # The response column is the hill function of the summed inputs.
+    x = table['biological_input'].sum(axis=1)
+    assert np.allclose(
+        table['response'],
+        p1.y_min + (p1.y_max - p1.y_min) / (1.0 + (x / p1.k) ** p1.n),
+    )
+    frame = p1.build_score_table(as_dataframe=True)
+    assert list(frame.columns) == [
+        'logical_input_0',
+        'logical_input_1',
+        'biological_input_0',
+        'biological_input_1',
+        'response',
+        'on',
+    ]
+    assert p1.score_self(score_table=True) == pytest.approx(2.3326, 0.1)
+    assert 'response' in capsys.readouterr().out
+
+
+# ------------------------------ Robustness Scoring ----------------------------
+def test_robustness_score(generate_two_gate_circuit):
+    p1 = generate_two_gate_circuit
+    report = robustness_score(p1, samples=2000, seed=0)
+    assert report.nominal == pytest.approx(p1.score_self())
+    assert report.samples.shape == (2000,)
+    assert report.quantiles[0.05] <= report.quantiles[0.5] <= \
+        report.quantiles[0.95]
+    assert 0.0 < report.probability < 1.0
+    # Without noise every draw is the nominal circuit.
+    quiet = robustness_score(
+        p1,
+        samples=10,
+        variation={'y_min': 0, 'y_max': 0, 'k': 0, 'n': 0, 'signal': 0},
+    )
+    assert np.allclose(quiet.samples, quiet.nominal)
+    assert report.non_finite == quiet.non_finite == 0
+
+
+def test_robustness_report_skips_non_finite_draws(
+        generate_two_gate_circuit, monkeypatch):
+    scorer = RobustnessScorer(generate_two_gate_circuit, samples=4, seed=0)
+    monkeypatch.setattr(
+        scorer, 'scores',
+        lambda circuit: np.array([1.0, float('nan'), 3.0, float('-inf')]),
+    )
+    report = scorer.report(threshold=2.0, quantiles=(0.0, 0.5, 1.0))
+    assert report.non_finite == 2
+    assert report.mean == pytest.approx(2.0)
+    assert report.quantiles == {0.0: 1.0, 0.5: 2.0, 1.0: 3.0}
+    assert report.probability == pytest.approx(0.25)
+    # The objective skips them the same way.
+    assert scorer.statistic() == pytest.approx(2.0)
+    assert scorer.statistic(quantile=0.5) == pytest.approx(2.0)
+    assert scorer.statistic(threshold=2.0) == pytest.approx(0.25)
+    monkeypatch.setattr(
+        scorer, 'scores', lambda circuit: np.full(4, float('nan')),
+    )
+    assert scorer.statistic() == float('-inf')
+
+
+def test_robustness_scorer_uses_common_random_numbers(
+        generate_two_gate_circuit):
+    circuit = Circuit.from_repressor(generate_two_gate_circuit)
+    scorer = RobustnessScorer(circuit, samples=500, seed=1)
+    assert scorer.statistic() == scorer.statistic()
+    variant = circuit.copy()
+    variant.y_max[variant.output] *= 2
+    assert scorer.statistic(variant) != scorer.statistic()
+    assert scorer.statistic(quantile=0.1) <= scorer.statistic(quantile=0.9)
+
+
+def test_sensitivity_indices(generate_two_gate_circuit):
+    circuit = Circuit.from_repressor(generate_two_gate_circuit)
+    morris = morris_screening(circuit, trajectories=30, seed=0)
+    assert morris.indices['mu_star'].shape == (2, 4)
+    assert np.all(morris.indices['mu_star'] >= 0)
+    sobol = sobol_indices(circuit, samples=2048, seed=0)
+    assert sobol.evaluations == 2048 * (2 * 4 + 2)
+    total = sobol.indices['total_order']
+    assert total.shape == (2, 4)
+    assert np.all(total >= -0.05)
+    assert np.all(sobol.indices['first_order'] <= total + 0.1)
+    # Both methods should agree on what matters most.
+    assert morris.ranking()[0][:2] == sobol.ranking()[0][:2]
+    # Parallel evaluation returns the same indices as the serial pass.
+    parallel = sobol_indices(circuit, samples=256, seed=3, n_jobs=2,
+                             chunk_size=512)
+    serial = sobol_indices(circuit, samples=256, seed=3)
+    assert np.allclose(parallel.indices['total_order'],
+                       serial.indices['total_order'])
+
+
+def test_pareto_optimize(generate_two_gate_circuit):
+    p1 = generate_two_gate_circuit
+    nominal = p1.score_self()
+    front = pareto_optimize(p1, 'ALL', population=32, generations=30, seed=0)
+    # The unedited design is always the free end of the front.
+    assert front[0].cost == 0
+    assert front[0].score == pytest.approx(nominal)
+    costs = np.array([design.cost for design in front])
+    scores = np.array([design.score for design in front])
+    # Paying more only makes sense if it buys score.
+    assert np.all(np.diff(costs) >= 0)
+    assert np.all(np.diff(scores) > 0)
+    best = front[-1]
+    assert best.score > nominal
+    assert best.circuit.score() == pytest.approx(best.score)
+    assert best.dna_edits + best.protein_edits == \
+        best.circuit.dna_edits.sum() + best.circuit.protein_edits.sum()
+    cheapest = cheapest_design(front, nominal + 0.1)
+    assert cheapest.score >= nominal + 0.1
+    assert cheapest.cost == min(
+        design.cost for design in front if design.score >= nominal + 0.1
+    )
+    assert cheapest_design(front, best.score + 1) is None
+    # Bounds that rule out leaving a gate unedited are still respected.
+    bounds = [(1.5, 3.0), (0.2, 0.5)]
+    front = pareto_optimize(p1, 'DNA', population=16, generations=10,
+                            bounds=bounds, seed=0)
+    for design in front:
+        assert np.all(design.edits >= np.array(bounds)[:, 0] * (1 - 1e-9))
+        assert np.all(design.edits <= np.array(bounds)[:, 1] * (1 + 1e-9))
+
+
+@pytest.fixture
+def generate_inverter_chain(generate_ptet, generate_plux_star):
+    '''
+    Six NOT gates with scattered parameters feeding a NOR output gate.
+    '''
+    generator = np.random.default_rng(1)
+    upstream = generate_ptet
+    for _ in range(6):
+        gate = Repressor(
+            y_max=generator.uniform(1, 4),
+            y_min=generator.uniform(0.003, 0.05),
+            k=generator.uniform(0.01, 0.2),
+            n=generator.uniform(1.5, 4),
+            number_of_inputs=1,
+        )
+        gate.set_biological_inputs([upstream])
+        gate.set_logical_function('NOT')
+        upstream = gate
+    output = Repressor(y_max=3.9, y_min=0.01, k=0.03, n=4, number_of_inputs=2)
+    output.set_biological_inputs([generate_plux_star, upstream])
+    output.set_logical_function('NOR')
+    return Circuit.from_repressor(output)
+
+
+def test_circuit_streaming_score():
+    generator = np.random.default_rng(0)
+    width = 14
+    gates = [('NOR', (('input', 0), ('input', 1)))]
+    for bit in range(2, width):
+        gates.append(('NOR', (('gate', len(gates) - 1), ('input', bit))))
+    network = NorNetwork([f'in{bit}' for bit in range(width)], gates)
+    circuit = build_circuit(network, [
+        InputSignal(
+            label=f'p{bit}',
+            off_value=generator.uniform(0.001, 0.03),
+            on_value=generator.uniform(1, 4),
+        )
+        for bit in range(width)
+    ])
+    for name, low, high in (('y_min', 0.003, 0.05), ('y_max', 1, 4),
+                            ('k', 0.01, 0.2), ('n', 1.5, 4)):
+        setattr(circuit, name, generator.uniform(low, high,
+                                                 circuit.gate_count))
+    # Gate g of the chain sees inputs 0 .. g + 1.
+    assert circuit.bit_dependencies().sum(axis=1).tolist() == \
+        list(range(2, width + 1))
+    expected = score_responses(
+        circuit.simulate()[:, circuit.output],
+        circuit.logic_outputs()[:, circuit.output],
+        circuit.active_low,
+    )
+    assert np.isfinite(expected)
+    for chunk_size in (64, 300, 2 ** width):
+        assert circuit.score_streaming(chunk_size) == \
+            pytest.approx(expected)
+    assert circuit.score_streaming(1024, n_jobs=2) == pytest.approx(expected)
+
+
+def test_simulate_transitions(generate_inverter_chain):
+    circuit = generate_inverter_chain
+    report = simulate_transitions(circuit, samples=100)
+    rows = 2 ** circuit.n_bits
+    assert report.output.shape == (100, rows, rows)
+    # Every transition ends at the steady state of the row it switched to.
+    assert report.output[-1] == pytest.approx(
+        np.tile(circuit.simulate()[:, circuit.output], (rows, 1)),
+        rel=1e-4,
+    )
+    assert np.all(np.diag(report.settling_time) == 0)
+    assert np.all(np.isfinite(report.settling_time))
+    # The slow inverter chain races the direct input on the NOR gate.
+    assert report.worst_glitch > 1.0
+    assert report.worst_settling_time > simulate_transitions(
+        circuit, degradation=10.0, samples=100,
+    ).worst_settling_time
+
+
+def test_budget_optimize(generate_inverter_chain):
+    circuit = generate_inverter_chain
+    untouched = budget_optimize(circuit, 0)
+    assert untouched.score == pytest.approx(circuit.score())
+    assert untouched.gates == []
+    single = budget_optimize(circuit, 1)
+    double = budget_optimize(circuit, 2)
+    assert len(double.gates) <= 2
+    assert double.score >= single.score > untouched.score
+    assert double.circuit.score() == pytest.approx(double.score)
+    assert (double.circuit.dna_edits > 0).sum() <= 2
+    # Pruning and caching kept the search well short of every pair.
+    pairs = circuit.gate_count * (circuit.gate_count - 1) // 2
+    assert double.nodes_pruned > 0
+    assert double.subsets_solved < 1 + circuit.gate_count + pairs
+
+
+def test_circuit_partial_simulation(generate_inverter_chain):
+    circuit = generate_inverter_chain
+    assert list(circuit.depths()) == list(range(circuit.gate_count))
+    assert list(circuit.fanout_cone([4])) == [4, 5, 6]
+    nominal = circuit.simulate()
+    k = np.repeat(circuit.k[None], 3, axis=0)
+    k[:, 4] *= [0.5, 1.0, 2.0]
+    full = circuit.simulate(k=k)
+    partial = circuit.simulate(k=k, responses=nominal, gates=[4, 5, 6])
+    assert np.allclose(full, partial)
+
+
+def test_optimize_circuit(generate_inverter_chain):
+    circuit = generate_inverter_chain
+    result = optimize_circuit(circuit, seed=0)
+    assert result.initial_score == pytest.approx(circuit.score())
+    assert result.score > result.initial_score
+    assert result.circuit.score() == pytest.approx(result.score)
+    # Tuning everything jointly does at least as well as the best single
+    # gate.
+    assert result.score >= budget_optimize(circuit, 1).score - 1e-6
+    # Gates pinned to (1, 1) are left alone.
+    bounds = np.tile([[0.1, 10.0], [0.1, 10.0]], (circuit.gate_count, 1, 1))
+    bounds[:-1] = 1.0
+    output_only = optimize_circuit(circuit, bounds=bounds, seed=0)
+    assert np.allclose(output_only.edits[:-1], 1.0)
+    assert output_only.circuit.dna_edits[:-1].sum() == 0
+    # Bounds that exclude the unedited design are still respected.
+    shifted = optimize_circuit(circuit, bounds=[(0.1, 0.2), (50, 100)],
+                               seed=0)
+    assert np.all((shifted.edits[:, 0] >= 0.1 - 1e-9) &
+                  (shifted.edits[:, 0] <= 0.2 + 1e-9))
+    assert np.all((shifted.edits[:, 1] >= 50 - 1e-6) &
+                  (shifted.edits[:, 1] <= 100 + 1e-6))
+
+
+# ------------------------------ Design Pipeline -------------------------------
+def test_synthesize_nor_covers_every_two_input_function():
+    signals = [
+        InputSignal(label=label, off_value=0.01, on_value=2.0)
+        for label in ('a', 'b')
+    ]
+    for function in range(1, 15):
+        table = np.array([(function >> row) & 1 for row in range(4)], bool)
+        network = synthesize_nor(table, ['a', 'b'])
+        assert np.array_equal(network.evaluate(), table)
+        circuit = build_circuit(network, signals)
+        assert np.array_equal(
+            circuit.logic_outputs()[:, circuit.output],
+            table,
+        )
+        assert all(len(sources) <= 2 for _, sources in network.gates)
+
+
+def test_assign_gates_respects_rules():
+    signals = [
+        InputSignal(label=label, off_value=0.01, on_value=2.0)
+        for label in ('a', 'b')
+    ]
+    network = synthesize_nor(np.array([0, 0, 0, 1], bool), ['a', 'b'])
+    circuit = build_circuit(network, signals)
+    models = [
+        GateModel(name=f'G{index}', group=f'R{index}',
+                  y_min=0.01 * (index + 1), y_max=2.0 + 0.3 * index,
+                  k=0.1 + 0.05 * index, n=2.5)
+        for index in range(6)
+    ]
+    _, free = assign_gates(circuit, models, samples=64, seed=0)
+    rules = RuleSet([
+        f'NOTCONTAINS {free[0].name}',
+        f'[0] EQUALS {free[-1].name}',
+    ])
+    assigned, chosen = assign_gates(circuit, models, samples=64, seed=0,
+                                    rules=rules)
+    assert rules.check(assigned.gate_labels)
+    assert chosen[0].name == free[-1].name
+    assert free[0].name not in assigned.gate_labels
+    # Rules are checked over gate names, so parts outside them can't match.
+    with pytest.raises(RuntimeError, match='L3S2P55'):
+        assign_gates(circuit, models, samples=64, seed=0,
+                     rules=RuleSet(['STARTSWITH L3S2P55']))
+
+
+def test_run_pipeline_streams_and_resumes(tmp_path):
+    config = PipelineConfig(
+        gates_csv_fp='example_files/gates_Eco1C1G1T1.csv',
+        input_signals_fp='example_files/Inputs.txt',
+        repressor_max=1,
+        assignment_samples=64,
+    )
+    designs = collect_designs('example_files')
+    assert [design.split('/')[-1] for design in designs] == \
+        ['0xFE.v', 'AND.v']
+    output_fp = str(tmp_path / 'results.jsonl')
+    records = list(run_pipeline(config, designs[1:], output_fp))
+    assert len(records) == 1
+    record = records[0]
+    assert record['status'] == 'ok'
+    assert record['design'] == 'A'
+    assert record['score'] >= record['assigned_score']
+    assert len(record['edits']) <= 1
+    # Distinct repressors throughout.
+    names = [gate['name'] for gate in record['gates']]
+    assert len({name.split('_')[1] for name in names}) == len(names)
+    # Only the design that isn't in the output yet runs on the second pass.
+    records = list(run_pipeline(config, designs, output_fp))
+    assert [record['design'] for record in records] == ['0xFE']
+    with open(output_fp) as output_file:
+        assert len(output_file.readlines()) == 2
+    # Designs that errored are retried rather than skipped.
+    with open(output_fp, 'a') as output_file:
+        output_file.write(json.dumps({
+            'verilog': str(tmp_path / 'flaky.v'),
+            'status': 'error',
+        }) + '\n')
+    assert str(tmp_path / 'flaky.v') not in completed_designs(output_fp)
+    # Configuration errors come through as themselves, not a broken pool.
+    with pytest.raises(RuntimeError, match='input signals'):
+        list(run_pipeline(
+            PipelineConfig(gates_csv_fp=config.gates_csv_fp),
+            designs,
+            n_jobs=2,
+        ))
+
+
+# Dependencies that importing the package must not pull in on its own.
+HEAVY_MODULES = (
+    'Bio', 'matplotlib', 'pandas', 'scipy', 'requests', 'colorama',
+)
+
+
+@pytest.mark.parametrize('statement', [
+    'import backend',
+    'import backend.parsing',
+    'import backend.datastructures',
+    'from backend import Circuit, parse_verilog',
+])
+def test_imports_stay_lazy(statement):
+    # Which modules got imported, rather than how long it took, so the check
+    # doesn't depend on how loaded the machine running it is.
+    probe = (
+        'import sys\n'
+        f'{statement}\n'
+        f'print(*[m for m in {HEAVY_MODULES!r} if m in sys.modules])'
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', probe],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    assert output == []
+
+
+def test_cli_help_stays_lazy():
+    probe = (
+        'import runpy, sys\n'
+        "sys.argv = ['main.py', '--help']\n"
+        'try:\n'
+        "    runpy.run_path('main.py', run_name='__main__')\n"
+        'except SystemExit:\n'
+        '    pass\n'
+        f'print(*[m for m in {HEAVY_MODULES!r} if m in sys.modules], '
+        'file=sys.stderr)'
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', probe],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert 'usage' in output.stdout
+    assert output.stderr.split() == []
@@ -0,0 +1,251 @@
+"""
+tests.test_parsing
+
+Tests for GenBank, part library and Verilog parsing, and for the sequence
+side built on them: assembling circuits (checked by parsing the GenBank they
+write back in) and screening parts and assemblies for forbidden sites.
+
+W.R. Jackson 2020
+"""
+import numpy as np
+import pytest
+from Bio import SeqIO
+from Bio.Seq import Seq
+
+from backend.api_interactions.stand_in import genbank_record
+from backend.datastructures import (
+    Assembly,
+    MotifHit,
+    MotifScanner,
+    RuleSet,
+    SequenceStore,
+    TYPE_IIS_SITES,
+    assemble_circuit,
+)
+from backend.parsing import (
+    GenbankIndex,
+    iter_genbank_features,
+    parse_gates_csv,
+    parse_input_signals,
+    parse_location,
+    parse_output_signals,
+    parse_verilog_file,
+)
+from backend.solvers import (
+    assign_gates,
+    build_circuit,
+    gate_models_from_csv,
+    synthesize_nor,
+)
+
+
+# -------------------------------- Test Fixtures -------------------------------
+@pytest.fixture
+def genbank_file(tmp_path):
+    '''
+    Writes a synthetic Cello style plasmid to disk.
+    '''
+    filepath = tmp_path / 'plasmid.gb'
+    filepath.write_text(genbank_record('plasmid', length=2000))
+    return str(filepath)
+
+
+# ------------------------------- GenBank Parsing ------------------------------
+def test_parse_location():
+    assert parse_location('1..10') == [(0, 10, 1)]
+    assert parse_location('<1..>10') == [(0, 10, 1)]
+    assert parse_location('complement(5..8)') == [(4, 8, -1)]
+    assert parse_location('complement(join(1..3,7..9))') == \
+        [(6, 9, -1), (0, 3, -1)]
+    with pytest.raises(RuntimeError):
+        parse_location('other_record:1..10')
+
+
+def test_lazy_features_match_biopython(genbank_file):
+    record = SeqIO.read(genbank_file, 'genbank')
+    features = list(iter_genbank_features(genbank_file))
+    assert len(features) == len(record.features)
+    for feature, reference in zip(features, record.features):
+        assert feature.type == reference.type
+        assert feature.qualifiers['label'] == reference.qualifiers['label']
+        assert feature.start == reference.location.start
+        assert feature.end == reference.location.end
+        assert feature.extract().upper() == \
+            str(reference.extract(record.seq)).upper()
+        # Views are windows into a single buffer, not copies.
+        assert bytes(feature.view()).decode() == feature.extract()
+
+
+def test_features_without_sequence(genbank_file):
+    labels = [
+        feature.label
+        for feature in iter_genbank_features(genbank_file, with_sequence=False)
+    ]
+    assert labels == ['pAmtR', 'A1', 'AmtR', 'L3S2P11']
+
+
+# ------------------------------- GenBank Index --------------------------------
+def test_genbank_index_queries(tmp_path):
+    results = tmp_path / 'results'
+    results.mkdir()
+    for index in range(3):
+        (results / f'design_{index}.ape').write_text(
+            genbank_record(f'design_{index}', length=1500 + index * 7)
+        )
+    with GenbankIndex(str(tmp_path / 'index.sqlite')) as genbank_index:
+        assert genbank_index.add_directory(str(results), '*.ape') == 3
+        # Unchanged files are not rescanned.
+        assert genbank_index.add_directory(str(results), '*.ape') == 0
+        hits = genbank_index.query(type='terminator', label='L3S2P11')
+        assert len(hits) == 3
+        assert len(genbank_index.files_with('AmtR')) == 3
+        assert genbank_index.read_entry(hits[0]).lstrip().startswith(
+            'terminator'
+        )
+        for hit in genbank_index.query(type='CDS'):
+            record = SeqIO.read(hit.path, 'genbank')
+            reference = [f for f in record.features if f.type == 'CDS'][0]
+            assert genbank_index.read_sequence(hit).upper() == \
+                str(reference.extract(record.seq)).upper()
+
+
+# ------------------------------ Part Libraries --------------------------------
+def test_parse_part_libraries_into_store():
+    store = SequenceStore()
+    gates = parse_gates_csv('example_files/gates_Eco1C1G1T1.csv', store)
+    inputs = parse_input_signals('example_files/Inputs.txt', store)
+    outputs = parse_output_signals('example_files/Outputs.txt', store)
+    assert gates['A1_AmtR']['ymax'] == pytest.approx(3.8)
+    assert str(gates['A1_AmtR']['promoterDNA']).startswith('CTTGTCCAACCAAAT')
+    assert inputs['pTet'].on_value == pytest.approx(4.4)
+    assert len(outputs['YFP']) > 0
+    # BM3R1 variants share their CDS, so it is only stored once.
+    bm3r1 = [gate for name, gate in gates.items() if name.endswith('BM3R1')]
+    assert len(bm3r1) > 1
+    assert len({gate['cdsDNA'].sequence_id for gate in bm3r1}) == 1
+    assert len(store) < store.interned
+
+
+def test_parse_verilog_file(tmp_path):
+    design = parse_verilog_file('example_files/0xFE.v')
+    assert design.name == '0xFE'
+    assert design.inputs == ['in1', 'in2', 'in3']
+    assert design.outputs == ['out']
+    assert list(design.truth_table[:, 0]) == [True] * 7 + [False]
+    # Selector order sets the bit order; missing rows take the default.
+    filepath = tmp_path / 'partial.v'
+    filepath.write_text(
+        'module partial(output y, input a, b);\n'
+        '  always@(a, b)\n'
+        '    begin\n'
+        '      case({b,a})  // b is the most significant bit\n'
+        "        2'b01: y = 1'b1;\n"
+        "        default: y = 1'b0;\n"
+        '      endcase\n'
+        '    end\n'
+        'endmodule\n'
+    )
+    partial = parse_verilog_file(str(filepath))
+    assert partial.inputs == ['b', 'a']
+    assert list(partial.truth_table[:, 0]) == [False, True, False, False]
+
+
+# ---------------------------------- Assembly ----------------------------------
+def test_assembled_circuit_round_trips_through_genbank(tmp_path):
+    store = SequenceStore()
+    gates = parse_gates_csv('example_files/gates_Eco1C1G1T1.csv', store)
+    inputs = parse_input_signals('example_files/Inputs.txt', store)
+    outputs = parse_output_signals('example_files/Outputs.txt', store)
+    network = synthesize_nor(np.array([0, 0, 0, 1], bool), ['pTac', 'pTet'])
+    circuit = build_circuit(network, [inputs['pTac'], inputs['pTet']])
+    circuit, _ = assign_gates(circuit, gate_models_from_csv(gates), seed=0)
+    assembly = assemble_circuit(
+        circuit,
+        gates,
+        inputs,
+        output=('YFP', outputs['YFP']),
+        name='AND',
+    )
+    # Every gate's cassette plus the output cassette.
+    assert [f.name for f in assembly.features if f.type == 'CDS'] == \
+        [gates[label]['cds'] for label in circuit.gate_labels]
+    assert assembly.features[-1].name == 'YFP'
+    sequence = assembly.sequence()
+    assert len(sequence) == len(assembly)
+
+    genbank_fp = tmp_path / 'AND.gb'
+    assembly.write_genbank(str(genbank_fp))
+    features = list(iter_genbank_features(str(genbank_fp)))
+    assert [feature.label for feature in features] == \
+        [feature.name for feature in assembly.features]
+    for feature, placed in zip(features, assembly.features):
+        assert feature.extract().upper() == assembly.extract(placed).upper()
+    record = SeqIO.read(str(genbank_fp), 'genbank')
+    assert str(record.seq).upper() == sequence.upper()
+
+    fasta_fp = tmp_path / 'AND.fasta'
+    assembly.write_fasta(str(fasta_fp), line_width=70)
+    # Writing to a filepath replaces the file, so it still holds one record.
+    assembly.write_fasta(str(fasta_fp), line_width=70)
+    assert str(SeqIO.read(str(fasta_fp), 'fasta').seq) == sequence
+
+    flipped = Assembly('flipped', circular=False)
+    flipped.append('AAAC')
+    part = flipped.append(inputs['pTet'].sequence, 'pTet', 'promoter', -1)
+    assert flipped.extract(part) == str(inputs['pTet'].sequence)
+    assert flipped.sequence()[4:] == str(
+        Seq(str(inputs['pTet'].sequence)).reverse_complement()
+    )
+
+
+def test_assign_gates_checks_rules_over_assembled_parts():
+    store = SequenceStore()
+    gates = parse_gates_csv('example_files/gates_Eco1C1G1T1.csv', store)
+    inputs = parse_input_signals('example_files/Inputs.txt', store)
+    network = synthesize_nor(np.array([0, 0, 0, 1], bool), ['pTac', 'pTet'])
+    circuit = build_circuit(network, [inputs['pTac'], inputs['pTet']])
+    models = gate_models_from_csv(gates)
+    free, _ = assign_gates(circuit, models, seed=0)
+    # UCF style rules, naming promoters and terminators rather than gates.
+    terminator = gates[free.gate_labels[0]]['terminator']
+    rules = RuleSet([f'NOTCONTAINS {terminator}', 'STARTSWITH pTac'])
+    assigned, _ = assign_gates(circuit, models, seed=0, rules=rules,
+                               parts=gates, signals=inputs)
+    features = assemble_circuit(assigned, gates, inputs).features
+    assert rules.check([feature.name for feature in features],
+                       [feature.strand for feature in features])
+    assert terminator not in [feature.name for feature in features]
+    with pytest.raises(RuntimeError, match='gate names only'):
+        assign_gates(circuit, models, seed=0, rules=rules)
+
+
+def test_motif_scanner_finds_sites_in_parts_and_junctions():
+    scanner = MotifScanner(dict(TYPE_IIS_SITES, BglI='GCCNNNNNGGC'))
+    hits = scanner.scan('ttGGTCTCaaGAGACCgGCCatgcaGGCn')
+    assert hits == [
+        MotifHit('BsaI', 2, 8, 1),
+        MotifHit('BsaI', 10, 16, -1),
+        MotifHit('BglI', 17, 28, 0),
+    ]
+    store = SequenceStore()
+    gates = parse_gates_csv('example_files/gates_Eco1C1G1T1.csv', store)
+    cds = {name: row['cdsDNA'] for name, row in gates.items()}
+    found = scanner.scan_parts(cds)
+    for name, sequence in cds.items():
+        assert list(found.get(name, ())) == scanner.scan(sequence)
+
+    # BsaI split across two parts, and across the origin.
+    assembly = Assembly('junctions')
+    assembly.append('TCAAAAGG', 'left')
+    assembly.append(store.intern('TCTCAAAA'), 'right')
+    assembly.append(store.intern('GAGACCAA'), 'flipped', strand=-1)
+    assembly.append('TTTGGTC', 'end')
+    assert scanner.scan_assembly(assembly) == [
+        MotifHit('BsaI', 6, 12, 1),
+        MotifHit('BsaI', 18, 24, 1),
+        MotifHit('BsaI', len(assembly) - 4, len(assembly) + 2, 1),
+    ]
+    linear = Assembly('linear', circular=False)
+    for sequence, _, strand in assembly.segments:
+        linear.append(sequence, strand=strand)
+    assert scanner.scan_assembly(linear) == scanner.scan(linear.sequence())
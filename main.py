@@ -1,34 +1,112 @@
 """
-backend.datastructures.repressor
+main
 
-Class encapsulating all behavior of a repressor/gate.
+Batch entrypoint: synthesizes, assigns, optimizes and scores every Verilog
+design matched by --input_verilog, streaming one JSON line per design.
 
 W.R. Jackson 2020
 """
 import argparse
-
-from backend import parse_ucf_file
+import dataclasses
+import json
+import sys
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
-        description=''
+        description='Designs and scores genetic circuits for Verilog files.'
     )
     parser.add_argument('--input_verilog', type=str, action='store',
-        help='Filepath to verilog file.')
+        help='Verilog file, directory of .v files or glob.')
     parser.add_argument('--input_ucf', type=str, action='store',
                         help='Filepath to input user constrained file')
+    parser.add_argument('--gates_csv', type=str, action='store',
+                        help='Gates CSV to use when the UCF carries no gate '
+                             'models.')
+    parser.add_argument('--input_signals', type=str, action='store',
+                        help='Input sensor file (name, low, high, sequence '
+                             'per line).')
+    parser.add_argument('--output', type=str, action='store',
+                        help='JSON lines file to append results to. Designs '
+                             'already in it are skipped. Defaults to stdout.')
+    parser.add_argument('--jobs', type=int, action='store', default=1,
+                        help='Worker processes, -1 for every core.')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Rerun designs already in the output file.')
+    parser.add_argument('--bio-optimization', type=str, action='store',
+                        default='DNA', choices=['DNA', 'ALL'],
+                        help='Which edits the optimizer may make.')
+    parser.add_argument('--seed', type=int, action='store', default=0,
+                        help='Seed for gate assignment and optimization.')
     parser.add_argument('--repressor-max', type=int, action='store', default=0,
-                        help='Maximum number of repressors that are capable'
+                        help='Maximum number of repressors that are capable '
                              'of being altered.')
+    parser.add_argument('--runs-db', type=str, action='store',
+                        help='Optimization run store to query.')
+    parser.add_argument('--query-runs', action='store_true',
+                        help='Print stored runs matching --gate, --method, '
+                             '--mode and the score range, best first, and '
+                             'exit.')
+    parser.add_argument('--gate', type=str, action='store')
+    parser.add_argument('--method', type=str, action='store')
+    parser.add_argument('--mode', type=str, action='store',
+                        choices=['DNA', 'ALL'])
+    parser.add_argument('--min-score', type=float, action='store')
+    parser.add_argument('--max-score', type=float, action='store')
+    parser.add_argument('--limit', type=int, action='store')
     args = parser.parse_args()
-    if args.input_ucf is None:
+    # Only now, so that --help and argument errors don't wait on scipy.
+    from backend import (
+        PipelineConfig,
+        RunStore,
+        collect_designs,
+        run_pipeline,
+    )
+    if args.query_runs:
+        if args.runs_db is None:
+            raise RuntimeError('--query-runs needs --runs-db')
+        with RunStore(args.runs_db) as store:
+            for run in store.query(
+                    gate=args.gate,
+                    method=args.method,
+                    mode=args.mode,
+                    min_score=args.min_score,
+                    max_score=args.max_score,
+                    limit=args.limit,
+            ):
+                print(json.dumps(dataclasses.asdict(run)))
+        sys.exit(0)
+    if args.input_ucf is None and args.gates_csv is None:
         raise RuntimeError('Missing UCF File')
     if args.input_verilog is None:
         raise RuntimeError('Missing Verilog File')
+    if args.input_signals is None:
+        raise RuntimeError('Missing Input Signals File')
+    if args.repressor_max < 0:
+        raise RuntimeError('--repressor-max can not be negative')
 
-    parse_ucf_file(args.input_ucf)
-
-
-
-
-
+    designs = collect_designs(args.input_verilog)
+    if not designs:
+        raise RuntimeError(f'No Verilog files match {args.input_verilog}')
+    config = PipelineConfig(
+        ucf_fp=args.input_ucf,
+        gates_csv_fp=args.gates_csv,
+        input_signals_fp=args.input_signals,
+        repressor_max=args.repressor_max,
+        bio_optimization=args.bio_optimization,
+        seed=args.seed,
+    )
+    for record in run_pipeline(
+            config,
+            designs,
+            output_fp=args.output,
+            n_jobs=args.jobs,
+            resume=not args.no_resume,
+    ):
+        if args.output is None:
+            print(json.dumps(record), flush=True)
+        else:
+            print(
+                f'{record["verilog"]}: {record["status"]} '
+                f'{record.get("score", record.get("error"))}',
+                file=sys.stderr,
+            )